@@ -1,154 +1,152 @@
 import streamlit as st
-from db.database import init_db, SessionLocal
-from db.models import Textbook, Content, Unit, Chapter
-from ocr_utils import extract_text, extract_metadata_from_text, extract_relevant_textbook_content, classify_content_type
-from parser import parse_markdown_to_units, split_mixed_block
-import datetime
-import re
+from db.database import init_db, engine
+from llm_cache import get_cache
+from llm_client import get_client
+from jobs import get_job_manager, spool_upload, remove_file, extract_upload, save_markdown, QUEUED, RUNNING, DONE, \
+    FAILED, FINISHED
 
-# Initialize the database
-init_db()
+
+@st.cache_resource
+def get_engine():
+    # once per server process, not on every rerun
+    init_db()
+    return engine
+
+
+@st.cache_resource
+def get_jobs():
+    return get_job_manager()
+
+
+@st.cache_resource
+def get_llm_client():
+    return get_client()
+
+
+db_engine = get_engine()
+jobs = get_jobs()
+get_llm_client()
 
 st.title("📘 PDF Textbook OCR App")
 st.markdown("Upload a textbook PDF, extract content using Mistral OCR, and store in the database.")
 
+llm_cache = get_cache()
+# applies to the jobs this session starts; the shared cache is left alone
+use_cache = not st.sidebar.checkbox("Bypass LLM cache", value=not llm_cache.enabled)
+st.sidebar.caption("LLM cache: {hits} hits / {misses} misses, {entries} entries".format(**llm_cache.stats()))
+active = [job.status for job in jobs.list()]
+st.sidebar.caption(f"Ingest jobs: {active.count(RUNNING)} running, {active.count(QUEUED)} queued")
+
 file = st.file_uploader("Upload a PDF file", type=["pdf"])
 
-if "ocr_text" not in st.session_state:
-    st.session_state.ocr_text = None
-    st.session_state.metadata = {
-        "title": "",
-        "subject": "",
-        "grade": "",
-        "language": "",
-        "publisher": "",
-        "year": ""
-    }
-
-def clean_surrogates(text) -> str:
-    if not isinstance(text, str):
-        return str(text)
-    return text.encode('utf-16', 'surrogatepass').decode('utf-16', 'ignore')
-
-if file and st.session_state.ocr_text is None:
-    with st.spinner("Running OCR and extracting metadata..."):
-        try:
-            markdown_raw = extract_text(file)
-            print("\n🟡 Raw OCR text extracted.")
-
-            metadata = extract_metadata_from_text(markdown_raw)
-            print("\n🟡 Metadata extracted:", metadata)
-
-            filtered_markdown = extract_relevant_textbook_content(markdown_raw)
-            print("\n🟡 Filtered markdown extracted.")
-
-            st.session_state.ocr_text = filtered_markdown
-            st.session_state.metadata = metadata
-
-        except Exception as e:
-            st.error(f"Error during OCR or metadata extraction: {str(e)}")
-            st.session_state.ocr_text = None
-            st.stop()
-
-if st.session_state.ocr_text:
-    title = st.text_input("Title", value=st.session_state.metadata.get("title", ""))
-    subject = st.text_input("Subject", value=st.session_state.metadata.get("subject", ""))
-    grade = st.text_input("Grade", value=st.session_state.metadata.get("grade", ""))
-    language = st.text_input("Language", value=st.session_state.metadata.get("language", ""))
-    publisher = st.text_input("Publisher", value=st.session_state.metadata.get("publisher", ""))
-    year = st.text_input("Year", value=st.session_state.metadata.get("year", ""))
-
-    if st.button("Extract and Save"):
-        with st.spinner("Parsing content and saving to database..."):
+
+def current_job(key: str):
+    """
+    The session's job stored under `key`; after a browser refresh it is found
+    again through the job id kept in the URL.
+    """
+    job_id = st.session_state.get(key) or st.query_params.get(key)
+    job = jobs.get(job_id) if job_id else None
+    if job is not None:
+        st.session_state[key] = job.job_id
+    return job
+
+
+def track(key: str, job):
+    st.session_state[key] = job.job_id
+    st.query_params[key] = job.job_id
+
+
+def forget(key: str):
+    st.session_state.pop(key, None)
+    st.query_params.pop(key, None)
+
+
+@st.fragment(run_every=1.0)
+def job_progress(job_id: str, published: int = 0):
+    """
+    Polls a queued or running job; reruns the page once it has finished or has
+    published more than `published` partial results.
+    """
+    job = jobs.get(job_id)
+    if job is None or job.status in FINISHED or len(job.partial) != published:
+        st.rerun()
+    snapshot = job.snapshot()
+    progress = snapshot["progress"]
+    st.info(f"⏳ {snapshot['label']}: {snapshot['status']} for {snapshot['elapsed_seconds']:.0f}s · "
+            f"{progress['pages']} pages extracted · {progress['classified']} blocks classified · "
+            f"{progress['rows']} rows written")
+    if st.button("Cancel", key=f"cancel-{job_id}"):
+        jobs.cancel(job_id)
+
+
+if file and st.session_state.get("upload") != (file.name, file.size):
+    # a new upload: OCR, metadata and filtering run in the background
+    st.session_state.upload = (file.name, file.size)
+    path = spool_upload(file)
+    track("extract_job", jobs.submit(file.name, extract_upload, path, cleanup=remove_file(path),
+                                      use_cache=use_cache))
+    forget("save_job")
+
+extract_job = current_job("extract_job")
+
+if extract_job is not None and extract_job.status not in FINISHED:
+    job_progress(extract_job.job_id, len(extract_job.partial))
+elif extract_job is not None and extract_job.status == FAILED:
+    st.error(f"Error during OCR or metadata extraction: {extract_job.error}")
+elif extract_job is not None and extract_job.status != DONE:
+    st.warning("OCR was cancelled.")
+
+metadata = None
+if extract_job is not None and extract_job.status == DONE:
+    metadata = extract_job.result["metadata"]
+elif extract_job is not None and extract_job.status not in FINISHED:
+    # shown while the filter is still running
+    metadata = extract_job.partial.get("metadata")
+
+if metadata is not None:
+    # keyed by job so a new upload starts from its own metadata
+    key = extract_job.job_id
+    title = st.text_input("Title", value=metadata.get("title", ""), key=f"title-{key}")
+    subject = st.text_input("Subject", value=metadata.get("subject", ""), key=f"subject-{key}")
+    grade = st.text_input("Grade", value=metadata.get("grade", ""), key=f"grade-{key}")
+    language = st.text_input("Language", value=metadata.get("language", ""), key=f"language-{key}")
+    publisher = st.text_input("Publisher", value=metadata.get("publisher", ""), key=f"publisher-{key}")
+    year = st.text_input("Year", value=str(metadata.get("year") or ""), key=f"year-{key}")
+
+    ready = extract_job.status == DONE
+    if st.button("Extract and Save", disabled=not ready, help=None if ready else "Waiting for the filter to finish"):
+        filtered_markdown = extract_job.result["filtered_markdown"]
+        year_int = None
+        if year.strip():
             try:
-                year_int = None
-                if year.strip():
-                    try:
-                        year_int = int(year)
-                    except ValueError:
-                        st.error("Year must be a valid number.")
-                        st.stop()
-
-                parsed_units = parse_markdown_to_units(st.session_state.ocr_text)
-                if not parsed_units or not isinstance(parsed_units, list):
-                    st.error("Parsed content is empty or malformed. Please check your OCR input.")
-                    st.stop()
-
-                db = SessionLocal()
-                new_book = Textbook(
-                    subject=clean_surrogates(subject),
-                    grade=clean_surrogates(grade),
-                    language=clean_surrogates(language),
-                    title=clean_surrogates(title),
-                    publisher=clean_surrogates(publisher),
-                    year=year_int,
-                    source_file=clean_surrogates(file.name),
-                    created_at=datetime.datetime.now()
-                )
-                db.add(new_book)
-                db.commit()
-                db.refresh(new_book)
-
-                for unit in parsed_units:
-                    if not unit:
-                        continue
-
-                    new_unit = Unit(
-                        textbook_id=new_book.textbook_id,
-                        unit_number=clean_surrogates(unit.get("unit_number", "")),
-                        unit_title=clean_surrogates(unit.get("unit_title", "")), 
-                        unit_description=None
-                    )
-                    db.add(new_unit)
-                    db.commit()
-                    db.refresh(new_unit)
-
-                    for chapter in unit.get("chapters", []):
-                        if not chapter:
-                            continue
-
-                        new_chapter = Chapter(
-                            unit_id=new_unit.unit_id,
-                            chapter_number=clean_surrogates(chapter.get("chapter_number", "1")),
-                            chapter_title=clean_surrogates(chapter.get("chapter_title", "Untitled")),
-                            chapter_description=None
-                        )
-                        db.add(new_chapter)
-                        db.commit()
-                        db.refresh(new_chapter)
-
-                        for block in chapter.get("content_blocks", []):
-                            if not block:
-                                continue
-
-                            full_content = clean_surrogates(block.get("content", ""))
-                            heading = clean_surrogates(block.get("heading", ""))
-
-                            for block in chapter.get("content_blocks", []):
-                                if not block:
-                                    continue
-
-                                sub_blocks = split_mixed_block(block.get("content", ""))
-                                if not sub_blocks:
-                                    sub_blocks = [block.get("content", "")]
-
-                                for sub in sub_blocks:
-                                    predicted_type = classify_content_type(sub)
-
-                                    content = Content(
-                                        chapter_id=new_chapter.chapter_id,
-                                        content_type=predicted_type,
-                                        text_content=clean_surrogates(sub),
-                                        activity_description=clean_surrogates(block.get("heading", "")),
-                                        is_active=True,
-                                        created_at=datetime.datetime.now()
-                                    )
-                                    db.add(content)
-                db.commit()
-                db.close()
-
-                st.markdown("### Extracted Text")
-                st.text_area("OCR Text", st.session_state.ocr_text, height=300)
-
-            except Exception as e:
-                st.error(f"Error during parsing or saving: {str(e)}")
\ No newline at end of file
+                year_int = int(year)
+            except ValueError:
+                st.error("Year must be a valid number.")
+                st.stop()
+
+        track("save_job", jobs.submit(extract_job.label, save_markdown, db_engine, {
+            "subject": subject,
+            "grade": grade,
+            "language": language,
+            "title": title,
+            "publisher": publisher,
+            "year": year_int,
+            "source_file": extract_job.label,
+        }, filtered_markdown, extract_job.result.get("media", []), use_cache=use_cache))
+
+    save_job = current_job("save_job")
+    if save_job is not None and save_job.status not in FINISHED:
+        job_progress(save_job.job_id)
+    elif save_job is not None and save_job.status == DONE:
+        result = save_job.result
+        st.success(f"Saved {result['rows']} content blocks ({result['classified']} classified) and "
+                   f"{result['media']} images in {result['elapsed_seconds']:.1f}s.")
+        st.table(result["metrics"])
+
+        st.markdown("### Extracted Text")
+        st.text_area("OCR Text", extract_job.result["filtered_markdown"], height=300)
+    elif save_job is not None and save_job.status == FAILED:
+        st.error(f"Error during parsing or saving: {save_job.error}")
+    elif save_job is not None:
+        st.warning("Saving was cancelled; the partially saved textbook was removed.")
@@ -0,0 +1,323 @@
+"""
+Asyncio ingestion pipeline with explicit, bounded stages:
+
+    extract -> filter -> parse -> classify -> write
+
+Each stage has its own concurrency and reads from a bounded queue, so slow LLM
+calls overlap with PyMuPDF work and database inserts, and a slow stage pushes
+back on the ones before it. Blocking work runs in threads via asyncio.to_thread.
+
+    python -m async_pipeline book.pdf --filter-concurrency 4 --classify-concurrency 4
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+
+from classification import classify_blocks
+from instrumentation import IngestMetrics, current, profile
+from db.ingest import TextbookWriter
+from db.near_duplicates import near_duplicate_classifier
+from ocr_utils import (spooled_pdf, iter_pages, make_page_windows, build_filter_prompt, get_mistral_client,
+                       strip_markdown_fence, HeaderStitcher, FILTER_CONCURRENCY, EXTRACT_WORKERS)
+from pdf_metadata import extract_pdf_metadata
+from llm_cache import cached_complete
+from parser import IncrementalMarkdownParser
+
+DONE = object()
+
+
+class StageStats:
+    def __init__(self, name: str, workers: int, inbox: asyncio.Queue = None):
+        self.name = name
+        self.workers = workers
+        self.inbox = inbox
+        self.processed = 0
+        self.busy_seconds = 0.0
+
+    def as_dict(self, elapsed: float) -> dict:
+        return {
+            "workers": self.workers,
+            "processed": self.processed,
+            "queue_depth": self.inbox.qsize() if self.inbox is not None else 0,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "per_second": round(self.processed / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+
+
+class IngestPipeline:
+    """
+    Runs one textbook through the stages. Use run_pdf() for a PDF, or
+    run_markdown() when the filtered markdown already exists (the Streamlit
+    app), which starts at the parse stage. stats() can be polled at any time.
+    """
+
+    def __init__(self, engine, textbook: dict, classify=classify_blocks,
+                 extract_workers: int = EXTRACT_WORKERS, filter_concurrency: int = FILTER_CONCURRENCY,
+                 classify_concurrency: int = 4, batch_size: int = 32, queue_size: int = 8,
+                 on_progress=None, progress_interval: float = 0.5):
+        self.engine = engine
+        self.textbook = textbook
+        self.classify = near_duplicate_classifier(engine, classify)
+        self.extract_workers = max(1, extract_workers)
+        self.filter_concurrency = max(1, filter_concurrency)
+        self.classify_concurrency = max(1, classify_concurrency)
+        self.batch_size = max(1, batch_size)
+        self.queue_size = queue_size
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.writer = TextbookWriter(engine, textbook)
+        self.labels = {}
+        self.started = None
+        self.stages = {}
+        self.stopped = threading.Event()
+
+    def stats(self) -> dict:
+        elapsed = time.perf_counter() - self.started if self.started else 0.0
+        return {
+            "elapsed_seconds": round(elapsed, 3),
+            "rows": self.writer.rows,
+            "stages": {name: stage.as_dict(elapsed) for name, stage in self.stages.items()},
+        }
+
+    def _setup(self, stages: list):
+        self.started = time.perf_counter()
+        workers = {"extract": self.extract_workers, "filter": self.filter_concurrency, "parse": 1,
+                   "classify": self.classify_concurrency, "write": 1}
+        for name in stages:
+            inbox = None if name == "extract" else asyncio.Queue(maxsize=self.queue_size)
+            self.stages[name] = StageStats(name, workers[name], inbox)
+
+    async def _run_stage(self, name: str, handler, outbox_name: str = None, finish=None):
+        """
+        Runs the stage's workers until each has received DONE, then sends one DONE
+        per worker of the next stage.
+        """
+        stage = self.stages[name]
+        outbox = self.stages[outbox_name].inbox if outbox_name else None
+
+        async def worker():
+            while True:
+                item = await stage.inbox.get()
+                if item is DONE:
+                    return
+                start = time.perf_counter()
+                await handler(item, outbox)
+                stage.busy_seconds += time.perf_counter() - start
+                stage.processed += 1
+
+        await asyncio.gather(*(worker() for _ in range(stage.workers)))
+        if finish:
+            await finish(outbox)
+        if outbox is not None:
+            for _ in range(self.stages[outbox_name].workers):
+                await outbox.put(DONE)
+
+    # extract: PyMuPDF in a thread, pushing page windows with backpressure
+    async def _extract(self, path: str):
+        loop = asyncio.get_running_loop()
+        stage, outbox = self.stages["extract"], self.stages["filter"].inbox
+
+        def counted_pages():
+            for page in iter_pages(path, workers=self.extract_workers):
+                stage.processed += 1
+                yield page
+
+        def produce():
+            for index, window in enumerate(make_page_windows(counted_pages())):
+                if self.stopped.is_set():
+                    return
+                asyncio.run_coroutine_threadsafe(outbox.put((index, window)), loop).result()
+
+        start = time.perf_counter()
+        await asyncio.to_thread(produce)
+        stage.busy_seconds += time.perf_counter() - start
+        for _ in range(self.stages["filter"].workers):
+            await outbox.put(DONE)
+
+    # filter: one LLM call per window
+    async def _filter(self, item, outbox):
+        index, window = item
+        client = self.client
+
+        def filter_window():
+            try:
+                prompt = build_filter_prompt(window["text"], window["context"])
+                return cached_complete(client, "mistral-medium", prompt)
+            except Exception as e:
+                print(f"LLM Filtering Error (chunk): {str(e)}")
+                return window["text"]
+
+        await outbox.put((index, await asyncio.to_thread(filter_window)))
+
+    # parse: reorders windows, stitches headers and emits sub-block batches
+    def _init_parse(self):
+        self.parser = IncrementalMarkdownParser(with_sub_blocks=True)
+        self.stitcher = HeaderStitcher()
+        self.reorder = {}
+        self.next_index = 0
+        self.seen = {}
+        self.pending = []
+        self.batches = 0
+        self.written = {}
+        self.next_batch = 0
+
+    async def _flush_pending(self, outbox):
+        if self.pending:
+            batch, self.pending = self.pending, []
+            await outbox.put((self.batches, batch))
+            self.batches += 1
+
+    async def _handle_events(self, events, outbox):
+        for event in events:
+            if event[0] == "chapter":
+                await self._flush_pending(outbox)
+                continue
+            _, unit, chapter, block = event
+            if unit is None:
+                continue
+            chapter_seen = self.seen.setdefault(id(chapter), set())
+            for sub in block.get("sub_blocks") or [block.get("content", "")]:
+                if sub not in chapter_seen:
+                    chapter_seen.add(sub)
+                    self.pending.append((unit, chapter, block, sub))
+            if len(self.pending) >= self.batch_size:
+                await self._flush_pending(outbox)
+
+    async def _parse(self, item, outbox):
+        index, text = item
+        self.reorder[index] = text
+        while self.next_index in self.reorder:
+            text = self.reorder.pop(self.next_index)
+            self.next_index += 1
+            lines = [line for line in strip_markdown_fence(text).splitlines() if self.stitcher.keep(line)]
+            await self._handle_events(self.parser.feed("\n".join(lines) + "\n\n"), outbox)
+
+    async def _finish_parse(self, outbox):
+        await self._handle_events(self.parser.close(), outbox)
+        await self._flush_pending(outbox)
+
+    # classify: one classifier call per batch of new texts
+    async def _classify(self, item, outbox):
+        seq, batch = item
+        unknown = [sub for sub in dict.fromkeys(sub for _, _, _, sub in batch) if sub not in self.labels]
+        if unknown:
+            self.labels.update(zip(unknown, await asyncio.to_thread(self.classify, unknown)))
+        await outbox.put((seq, [(unit, chapter, {
+            "content_type": self.labels[sub],
+            "text_content": sub,
+            "activity_description": block.get("heading", ""),
+            "source_page": block.get("source_page"),
+        }) for unit, chapter, block, sub in batch]))
+
+    # write: bulk inserts through TextbookWriter, one writer so rows keep document order
+    async def _write(self, item, outbox):
+        seq, rows = item
+        self.written[seq] = rows
+        while self.next_batch in self.written:
+            await asyncio.to_thread(self.writer.write, self.written.pop(self.next_batch))
+            self.next_batch += 1
+
+    async def _monitor(self, done: asyncio.Event):
+        while not done.is_set():
+            self.on_progress(self.stats())
+            try:
+                await asyncio.wait_for(done.wait(), self.progress_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self, first_stage_tasks: list) -> dict:
+        done = asyncio.Event()
+        monitor = asyncio.create_task(self._monitor(done)) if self.on_progress else None
+        tasks = [asyncio.ensure_future(task) for task in [
+            *first_stage_tasks,
+            self._run_stage("parse", self._parse, "classify", finish=self._finish_parse),
+            self._run_stage("classify", self._classify, "write"),
+            self._run_stage("write", self._write),
+        ]]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # one stage failed: stop the others instead of leaving them blocked on full queues
+            self.stopped.set()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # and remove the batches already committed, so no partial textbook is left
+            await asyncio.to_thread(self.writer.discard)
+            raise
+        finally:
+            done.set()
+            if monitor:
+                await monitor
+                self.on_progress(self.stats())
+            self._record_metrics()
+        if self.writer.textbook_id is None:
+            raise ValueError("Parsed content is empty or malformed.")
+        return {"textbook_id": self.writer.textbook_id, "rows": self.writer.rows,
+                "classified": len(self.labels), **self.stats()}
+
+    def _record_metrics(self):
+        """
+        Adds each stage's busy time to the active IngestMetrics, if any.
+        """
+        metrics = current()
+        if metrics is None:
+            return
+        for name, stage in self.stages.items():
+            metrics.add_time(f"pipeline.{name}", stage.busy_seconds, stage.processed)
+
+    async def run_pdf(self, path: str) -> dict:
+        self._setup(["extract", "filter", "parse", "classify", "write"])
+        self._init_parse()
+        self.client = get_mistral_client()
+        return await self._run([
+            self._extract(path),
+            self._run_stage("filter", self._filter, "parse"),
+        ])
+
+    async def run_markdown(self, markdown: str) -> dict:
+        self._setup(["parse", "classify", "write"])
+        self._init_parse()
+
+        async def feed():
+            await self.stages["parse"].inbox.put((0, markdown))
+            await self.stages["parse"].inbox.put(DONE)
+
+        return await self._run([feed()])
+
+
+def main(argv=None):
+    from db.database import init_db, engine
+    from pipeline import textbook_from_metadata
+
+    arg_parser = argparse.ArgumentParser(prog="python -m async_pipeline")
+    arg_parser.add_argument("pdf")
+    arg_parser.add_argument("--extract-workers", type=int, default=EXTRACT_WORKERS)
+    arg_parser.add_argument("--filter-concurrency", type=int, default=FILTER_CONCURRENCY)
+    arg_parser.add_argument("--classify-concurrency", type=int, default=4)
+    arg_parser.add_argument("--batch-size", type=int, default=32)
+    arg_parser.add_argument("--queue-size", type=int, default=8)
+    arg_parser.add_argument("--progress", action="store_true", help="print stage stats while running")
+    args = arg_parser.parse_args(argv)
+
+    init_db()
+    metrics = IngestMetrics(args.pdf)
+    with metrics.activate(), profile(args.pdf), spooled_pdf(args.pdf) as path:
+        metadata = extract_pdf_metadata(path)
+        pipeline = IngestPipeline(
+            engine, textbook_from_metadata(metadata, args.pdf),
+            extract_workers=args.extract_workers, filter_concurrency=args.filter_concurrency,
+            classify_concurrency=args.classify_concurrency, batch_size=args.batch_size,
+            queue_size=args.queue_size,
+            on_progress=(lambda stats: print(json.dumps(stats), file=sys.stderr)) if args.progress else None,
+        )
+        result = asyncio.run(pipeline.run_pdf(path))
+    result["metrics"] = metrics.log(source_path=args.pdf, textbook_id=result["textbook_id"], rows=result["rows"])
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
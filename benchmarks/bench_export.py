@@ -0,0 +1,80 @@
+"""
+Rows/sec of the streaming corpus export (export.py) on a generated database,
+for JSONL and partitioned Parquet, plus the peak Python memory of each run to
+show it does not grow with the row count.
+
+    python -m benchmarks.bench_export --rows 1000000 --batch-size 5000
+"""
+import os
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+from db.database import make_engine
+from db.ingest import save_textbook
+from db.migrations import run_migrations
+from db.models import Base
+from export import export_corpus
+from benchmarks.synthetic import make_parsed_units
+
+GRADES = ["1", "2", "3", "4", "5"]
+SUBJECTS = ["English", "Hindi", "Science", "Maths"]
+
+
+def build_db(engine, rows: int, books: int):
+    per_book = max(1, rows // books)
+    chapters = 10
+    blocks = max(1, per_book // (5 * chapters))
+    for book in range(books):
+        textbook = {"subject": SUBJECTS[book % len(SUBJECTS)], "grade": GRADES[book % len(GRADES)],
+                    "language": "English", "title": f"Book {book}", "publisher": "Bench", "year": 2024,
+                    "source_file": f"book{book}.pdf"}
+        save_textbook(engine, textbook, make_parsed_units(5, chapters, blocks, seed=book))
+
+
+def run(name: str, engine, directory: str, memory: bool, **options) -> dict:
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    stats = export_corpus(engine, directory, **options)
+    elapsed = time.perf_counter() - start
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    size = sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(directory) for f in files) / 1e6
+    print(f"{name:<18} {stats['rows']} rows in {elapsed:.2f}s -> {stats['rows'] / elapsed:,.0f} rows/sec, "
+          f"{len(stats['files'])} files, {size:.1f} MB" + (f", peak {peak:.1f} MB traced" if peak else ""))
+    return stats
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--rows", type=int, default=200000)
+    arg_parser.add_argument("--books", type=int, default=20)
+    arg_parser.add_argument("--batch-size", type=int, default=5000)
+    arg_parser.add_argument("--memory", action="store_true", help="trace peak memory (slows the export down)")
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
+        start = time.perf_counter()
+        build_db(engine, args.rows, args.books)
+        print(f"built database in {time.perf_counter() - start:.1f}s")
+
+        run("jsonl", engine, os.path.join(tmp, "jsonl"), args.memory, batch_size=args.batch_size)
+        run("jsonl by grade", engine, os.path.join(tmp, "jsonl-part"), args.memory, batch_size=args.batch_size,
+            partition_by=["grade", "subject"])
+        try:
+            run("parquet by grade", engine, os.path.join(tmp, "parquet"), args.memory, fmt="parquet",
+                batch_size=args.batch_size, partition_by=["grade", "subject"])
+        except ImportError as e:
+            print(f"parquet skipped: {str(e)}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Times serial vs multi-process PDF page extraction on a generated PDF.
+
+    python -m benchmarks.bench_extract --pages 2000 --workers 4
+"""
+import os
+import time
+import argparse
+import tempfile
+
+from ocr_utils import iter_pages
+from benchmarks.synthetic import make_pdf
+
+
+def run(name: str, path: str, workers: int) -> float:
+    start = time.perf_counter()
+    count = sum(1 for _ in iter_pages(path, workers=workers))
+    elapsed = time.perf_counter() - start
+    print(f"{name:<12} {count} pages in {elapsed:.2f}s -> {count / elapsed:,.0f} pages/sec")
+    return elapsed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--pages", type=int, default=2000)
+    arg_parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = make_pdf(os.path.join(tmp, "bench.pdf"), args.pages)
+        serial = run("serial", path, 1)
+        parallel = run(f"{args.workers} workers", path, args.workers)
+        print(f"speedup: {serial / parallel:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
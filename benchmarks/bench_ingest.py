@@ -0,0 +1,81 @@
+"""
+Compares the old per-row ORM save path with db.ingest.save_textbook.
+
+    python -m benchmarks.bench_ingest --blocks 10000
+"""
+import os
+import time
+import argparse
+import datetime
+import tempfile
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from db.models import Base, Textbook, Unit, Chapter, Content
+from db.ingest import save_textbook
+from benchmarks.synthetic import make_parsed_units
+
+TEXTBOOK = {"subject": "English", "grade": "1", "language": "English",
+            "title": "Synthetic", "publisher": "Bench", "year": 2024, "source_file": "synthetic.pdf"}
+
+
+def save_per_row(engine, textbook: dict, parsed_units: list):
+    """
+    The save loop app.py used before db.ingest: commit + refresh per unit and
+    chapter, one ORM add per content row.
+    """
+    db = sessionmaker(bind=engine)()
+    new_book = Textbook(created_at=datetime.datetime.now(), **textbook)
+    db.add(new_book)
+    db.commit()
+    db.refresh(new_book)
+    for unit in parsed_units:
+        new_unit = Unit(textbook_id=new_book.textbook_id, unit_number=unit["unit_number"],
+                        unit_title=unit["unit_title"])
+        db.add(new_unit)
+        db.commit()
+        db.refresh(new_unit)
+        for chapter in unit["chapters"]:
+            new_chapter = Chapter(unit_id=new_unit.unit_id, chapter_number=chapter["chapter_number"],
+                                  chapter_title=chapter["chapter_title"])
+            db.add(new_chapter)
+            db.commit()
+            db.refresh(new_chapter)
+            for content in chapter["contents"]:
+                db.add(Content(chapter_id=new_chapter.chapter_id, is_active=True,
+                               created_at=datetime.datetime.now(), **content))
+    db.commit()
+    db.close()
+
+
+def run(name: str, save, parsed_units: list, rows: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        start = time.perf_counter()
+        save(engine, TEXTBOOK, parsed_units)
+        elapsed = time.perf_counter() - start
+        engine.dispose()
+    print(f"{name:<10} {rows} rows in {elapsed:.2f}s -> {rows / elapsed:,.0f} rows/sec")
+    return elapsed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--blocks", type=int, default=10000, help="total content blocks")
+    arg_parser.add_argument("--units", type=int, default=10)
+    arg_parser.add_argument("--chapters", type=int, default=10, help="chapters per unit")
+    args = arg_parser.parse_args()
+
+    per_chapter = max(1, args.blocks // (args.units * args.chapters))
+    parsed_units = make_parsed_units(args.units, args.chapters, per_chapter)
+    rows = 1 + args.units + args.units * args.chapters * (1 + per_chapter)
+
+    before = run("per-row", save_per_row, parsed_units, rows)
+    after = run("bulk", save_textbook, parsed_units, rows)
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Image extraction into the media store (media_store.py) on a generated
+image-heavy PDF: every page carries the series logo, a small bullet icon
+(skipped), one illustration of its own and, on every fourth page, a
+transparent sticker that has to be rendered as a crop. Serial and
+multi-process runs write into separate stores; a second run over the same
+store shows the content-addressed dedupe (no new files).
+
+    python -m benchmarks.bench_media --pages 400 --workers 4
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+
+import fitz
+
+from media_store import extract_media
+
+
+def make_png(rng: random.Random, size: int, alpha: bool = False) -> bytes:
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, size, size), alpha)
+    pixmap.clear_with(255)
+    for _ in range(12):
+        x, y = rng.randrange(size), rng.randrange(size)
+        pixmap.set_rect(fitz.IRect(x, y, x + size // 4, y + size // 4),
+                        tuple(rng.randrange(256) for _ in range(4 if alpha else 3)))
+    return pixmap.tobytes("png")
+
+
+def make_image_pdf(path: str, pages: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    logo, bullet = make_png(rng, 96), make_png(rng, 16)
+    pdf = fitz.open()
+    for number in range(pages):
+        page = pdf.new_page()
+        page.insert_text((72, 72), f"Lesson {number + 1}\nLook at the picture and answer.", fontsize=11)
+        page.insert_image(fitz.Rect(480, 20, 560, 100), stream=logo)
+        page.insert_image(fitz.Rect(72, 120, 84, 132), stream=bullet)
+        page.insert_image(fitz.Rect(72, 160, 372, 460), stream=make_png(rng, 256))
+        if number % 4 == 0:
+            page.insert_image(fitz.Rect(400, 500, 520, 620), stream=make_png(rng, 128, alpha=True))
+    pdf.save(path)
+    pdf.close()
+    return path
+
+
+def store_size(root: str) -> tuple:
+    files = [os.path.join(folder, name) for folder, _, names in os.walk(root) for name in names]
+    return len(files), sum(os.path.getsize(file) for file in files) / 1e6
+
+
+def run(name: str, path: str, root: str, workers: int) -> float:
+    start = time.perf_counter()
+    records = extract_media(path, workers=workers, root=root)
+    elapsed = time.perf_counter() - start
+    files, size = store_size(root)
+    pages = len({record["source_page"] for record in records})
+    print(f"{name:<16} {len(records)} images on {pages} pages in {elapsed:.2f}s -> {pages / elapsed:,.0f} pages/sec, "
+          f"{sum(1 for record in records if record['bytes'])} new files, store {files} files / {size:.1f} MB")
+    return elapsed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--pages", type=int, default=400)
+    arg_parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = make_image_pdf(os.path.join(tmp, "images.pdf"), args.pages)
+        print(f"PDF: {args.pages} pages, {os.path.getsize(path) / 1e6:.1f} MB")
+        serial = run("serial", path, os.path.join(tmp, "serial"), 1)
+        parallel = run(f"{args.workers} workers", path, os.path.join(tmp, "parallel"), args.workers)
+        run("again (dedupe)", path, os.path.join(tmp, "parallel"), args.workers)
+        print(f"speedup: {serial / parallel:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
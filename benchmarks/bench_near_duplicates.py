@@ -0,0 +1,95 @@
+"""
+Near-duplicate lookup (db.near_duplicates) as the library grows: books of
+distinct random blocks are saved through save_textbook and indexed as the
+classify stage would (index_texts), and after each step a sample of stored blocks with a few OCR-style character
+errors is looked up again. Lookup time per block should stay flat while the
+row count grows, and the recall column shows how many noisy copies were found.
+
+    python -m benchmarks.bench_near_duplicates --steps 4 --books-per-step 5
+"""
+import os
+import time
+import random
+import string
+import argparse
+import tempfile
+
+from db.database import make_engine
+from db.ingest import save_textbook
+from db.migrations import run_migrations
+from db.models import Base
+from db.near_duplicates import find_near_duplicates, index_texts
+from benchmarks.synthetic import CONTENT_TYPES
+
+UNITS, CHAPTERS, BLOCKS = 5, 10, 40
+
+
+def make_text(rng: random.Random, vocabulary: list) -> str:
+    return "\n".join(" ".join(rng.choices(vocabulary, k=rng.randint(5, 9))) for _ in range(rng.randint(3, 6)))
+
+
+def ocr_noise(rng: random.Random, text: str, errors: int) -> str:
+    chars = list(text)
+    for _ in range(errors):
+        i = rng.randrange(len(chars))
+        chars[i] = rng.choice("lI1o0.,")
+    return "".join(chars)
+
+
+def make_book(rng: random.Random, vocabulary: list, sample: list) -> list:
+    units = []
+    for u in range(1, UNITS + 1):
+        unit = {"unit_number": u, "unit_title": f"Unit {u}", "chapters": []}
+        for c in range(1, CHAPTERS + 1):
+            contents = []
+            for _ in range(BLOCKS):
+                text = make_text(rng, vocabulary)
+                contents.append({"content_type": rng.choice(CONTENT_TYPES), "text_content": text,
+                                 "activity_description": "", "source_page": c})
+                if rng.random() < 0.01:
+                    sample.append(text)
+            unit["chapters"].append({"chapter_number": c, "chapter_title": f"Chapter {c}", "contents": contents})
+        units.append(unit)
+    return units
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--steps", type=int, default=4)
+    arg_parser.add_argument("--books-per-step", type=int, default=5)
+    arg_parser.add_argument("--errors", type=int, default=3, help="character errors per looked-up block")
+    arg_parser.add_argument("--lookups", type=int, default=200)
+    args = arg_parser.parse_args()
+
+    rng = random.Random(0)
+    vocabulary = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 8))) for _ in range(5000)]
+    sample = []
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
+        rows = 0
+        for step in range(1, args.steps + 1):
+            start = time.perf_counter()
+            for _ in range(args.books_per_step):
+                book = make_book(rng, vocabulary, sample)
+                index_texts(engine, [content["text_content"] for unit in book for chapter in unit["chapters"]
+                                     for content in chapter["contents"]])
+                save_textbook(engine, {"title": "Bench", "subject": "English", "grade": "1"}, book)
+            added = args.books_per_step * UNITS * CHAPTERS * BLOCKS
+            rows += added
+            saved = time.perf_counter() - start
+
+            noisy = [ocr_noise(rng, text, args.errors) for text in rng.sample(sample, min(args.lookups, len(sample)))]
+            with engine.connect() as conn:
+                start = time.perf_counter()
+                matches = find_near_duplicates(conn, noisy)
+                elapsed = time.perf_counter() - start
+            found = sum(match is not None for match in matches)
+            print(f"{rows:>8} rows  saved at {added / saved:,.0f} rows/s  "
+                  f"lookup {elapsed / len(noisy) * 1000:.2f} ms/block  recall {found}/{len(noisy)}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
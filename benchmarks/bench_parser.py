@@ -0,0 +1,144 @@
+"""
+Micro-benchmark for the markdown tokenizer against the previous
+regex-per-line parser + split_mixed_block, on a synthetic multi-megabyte book.
+Also checks that both produce identical output on filtered_markdown.txt.
+
+    python -m benchmarks.bench_parser --blocks 40
+"""
+import re
+import time
+import argparse
+from pathlib import Path
+
+from parser import parse_units, split_mixed_block
+from benchmarks.synthetic import make_markdown
+
+SAMPLE_PATH = Path(__file__).resolve().parent.parent / "filtered_markdown.txt"
+
+
+def legacy_parse(markdown_text):
+    """
+    parse_markdown_to_units as it was before the tokenizer (minus the debug dump).
+    """
+    markdown_text = markdown_text.strip()
+    if markdown_text.startswith("```markdown"):
+        markdown_text = markdown_text[len("```markdown"):].strip()
+    if markdown_text.endswith("```"):
+        markdown_text = markdown_text[:-3].strip()
+
+    unit_pattern = re.compile(r"# Unit\s+(\d+)\s*[:\-\.]?\s*(.*)", re.IGNORECASE)
+    chapter_pattern = re.compile(r"## Chapter\s+(\d+)\s*[:\-\.]?\s*(.*)", re.IGNORECASE)
+    heading_pattern = re.compile(r"###\s+(.*)")
+    page_pattern = re.compile(r"<!--\s*page\s+(\d+)\s*-->", re.IGNORECASE)
+
+    units, unit, chapter, heading, lines = [], None, None, None, []
+    page = block_page = None
+
+    def save_block():
+        if heading and lines:
+            chapter["content_blocks"].append(
+                {"heading": heading, "content": "\n".join(lines).strip(), "source_page": block_page})
+
+    for line in markdown_text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        page_match = page_pattern.match(line)
+        if page_match:
+            page = int(page_match.group(1))
+            if not lines:
+                block_page = page
+            line = line[page_match.end():].strip()
+            if not line:
+                continue
+        unit_match = unit_pattern.match(line)
+        chapter_match = chapter_pattern.match(line)
+        heading_match = heading_pattern.match(line)
+        if unit_match:
+            if chapter:
+                save_block()
+            if unit:
+                if chapter:
+                    unit["chapters"].append(chapter)
+                units.append(unit)
+            unit = {"unit_number": int(unit_match.group(1)), "unit_title": unit_match.group(2).strip(), "chapters": []}
+            chapter, heading, lines = None, None, []
+        elif chapter_match:
+            if chapter:
+                save_block()
+                unit["chapters"].append(chapter)
+            chapter = {"chapter_number": int(chapter_match.group(1)),
+                       "chapter_title": chapter_match.group(2).strip(), "content_blocks": []}
+            heading, lines = None, []
+        elif heading_match:
+            save_block()
+            heading, lines, block_page = heading_match.group(1).strip(), [], page
+        else:
+            lines.append(line)
+    if chapter:
+        save_block()
+        unit["chapters"].append(chapter)
+    if unit:
+        units.append(unit)
+    return units
+
+
+def legacy_split(content):
+    content = content.replace("**", "##")
+    split_pattern = r'(?=^##|\n##|\n\s*[A-Z]\.|\n\s*Note to the teacher|\n\s*New words|\n\s*Sight words|\n\s*Letter sounds|\n\s*Washing hands|\n\s*My hand|\n\s*Now compare|\n\s*Draw attention|\n\s*Let the students|\n\s*Provide regular|\n\s*Teacher:)'
+    return [b.strip().replace("##", "**") for b in re.split(split_pattern, content) if b.strip()]
+
+
+def legacy_pipeline(markdown_text):
+    units = legacy_parse(markdown_text)
+    for unit in units:
+        for chapter in unit["chapters"]:
+            for block in chapter["content_blocks"]:
+                block["sub_blocks"] = legacy_split(block["content"])
+    return units
+
+
+def tokenizer_pipeline(markdown_text):
+    return parse_units(markdown_text, with_sub_blocks=True)
+
+
+def timed(fn, text, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--units", type=int, default=20)
+    arg_parser.add_argument("--chapters", type=int, default=20)
+    arg_parser.add_argument("--blocks", type=int, default=40, help="blocks per chapter")
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    with open(SAMPLE_PATH, encoding="utf-8") as f:
+        sample = f.read()
+    assert legacy_pipeline(sample) == tokenizer_pipeline(sample), "output differs on filtered_markdown.txt"
+    for unit in legacy_parse(sample):
+        for chapter in unit["chapters"]:
+            for block in chapter["content_blocks"]:
+                assert split_mixed_block(block["content"]) == legacy_split(block["content"])
+    print("filtered_markdown.txt: identical output")
+
+    text = make_markdown(args.units, args.chapters, args.blocks)
+    mb = len(text.encode("utf-8")) / 1e6
+    legacy_time, legacy_result = timed(legacy_pipeline, text, args.repeat)
+    new_time, new_result = timed(tokenizer_pipeline, text, args.repeat)
+    assert legacy_result == new_result, "output differs on synthetic markdown"
+
+    print(f"{mb:.1f} MB synthetic markdown")
+    print(f"legacy     {legacy_time:.3f}s ({mb / legacy_time:.1f} MB/s)")
+    print(f"tokenizer  {new_time:.3f}s ({mb / new_time:.1f} MB/s)")
+    print(f"speedup: {legacy_time / new_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
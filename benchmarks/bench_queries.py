@@ -0,0 +1,100 @@
+"""
+Query latency for typical lookups on a generated multi-book database, before
+and after the db.migrations indexes. Also counts the SQL statements issued by
+load_textbook_tree.
+
+    python -m benchmarks.bench_queries --books 300
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from db.models import Base
+from db.ingest import save_textbook
+from db.migrations import run_migrations
+from db.queries import load_textbook_tree, textbook_tree_dict, find_textbooks, find_content
+from benchmarks.synthetic import make_parsed_units
+
+SUBJECTS = ["English", "Hindi", "Maths", "Science", "EVS"]
+
+
+def build_db(engine, books: int, units: int, chapters: int, blocks: int):
+    rng = random.Random(0)
+    for i in range(books):
+        textbook = {"subject": rng.choice(SUBJECTS), "grade": str(rng.randint(1, 12)), "language": "English",
+                    "title": f"Book {i}", "publisher": "Bench", "year": 2024, "source_file": f"book{i}.pdf"}
+        save_textbook(engine, textbook, make_parsed_units(units, chapters, blocks, seed=i))
+
+
+def lookups(session, textbook_id: int) -> dict:
+    return {
+        "textbook tree": lambda: textbook_tree_dict(load_textbook_tree(session, textbook_id)),
+        "poems for grade": lambda: find_content(session, content_type="poem", grade="3"),
+        "books by grade/subject": lambda: find_textbooks(session, grade="3", subject="English"),
+        "notes in one book": lambda: find_content(session, content_type="note", textbook_id=textbook_id),
+    }
+
+
+def time_lookups(engine, textbook_id: int, repeat: int) -> dict:
+    timings = {}
+    for name, fn in lookups(sessionmaker(bind=engine)(), textbook_id).items():
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        timings[name] = best
+    return timings
+
+
+def count_tree_queries(engine, textbook_id: int) -> int:
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        load_textbook_tree(sessionmaker(bind=engine)(), textbook_id, with_media=True)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    return len(statements)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--books", type=int, default=300)
+    arg_parser.add_argument("--units", type=int, default=5)
+    arg_parser.add_argument("--chapters", type=int, default=5, help="chapters per unit")
+    arg_parser.add_argument("--blocks", type=int, default=20, help="content blocks per chapter")
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        start = time.perf_counter()
+        build_db(engine, args.books, args.units, args.chapters, args.blocks)
+        with engine.connect() as conn:
+            rows = conn.execute(text("SELECT count(*) FROM content")).scalar_one()
+        print(f"{args.books} books, {rows:,} content rows generated in {time.perf_counter() - start:.1f}s")
+
+        textbook_id = args.books // 2
+        before = time_lookups(engine, textbook_id, args.repeat)
+        run_migrations(engine)
+        with engine.connect() as conn:
+            conn.execute(text("ANALYZE"))
+        after = time_lookups(engine, textbook_id, args.repeat)
+
+        print(f"\n{'lookup':<24}{'no indexes':>12}{'indexed':>12}{'speedup':>10}")
+        for name in before:
+            print(f"{name:<24}{before[name] * 1000:>10.1f}ms{after[name] * 1000:>10.1f}ms"
+                  f"{before[name] / after[name]:>9.1f}x")
+        print(f"\nload_textbook_tree(with_media=True): {count_tree_queries(engine, textbook_id)} queries")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Search latency on a generated corpus (default one million content rows), FTS5
+against the LIKE scan it replaces. Rows mix the synthetic textbook lines with
+words from a Zipf-distributed vocabulary, so there are both rare and very
+common terms. Queries with more than SEARCH_MAX_CANDIDATES matches are listed
+newest first instead of BM25-ranked (see db.search.search_content).
+
+    python -m benchmarks.bench_search --rows 1000000
+"""
+import os
+import time
+import random
+import itertools
+import string
+import argparse
+import tempfile
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from db.models import Base
+from db.ingest import save_textbook
+from db.migrations import run_migrations
+from db.search import search_content, optimize_search_index
+from benchmarks.synthetic import SAMPLE_LINES, CONTENT_TYPES
+from benchmarks.bench_queries import SUBJECTS
+
+UNITS, CHAPTERS, BLOCKS = 5, 10, 50
+
+
+def make_vocabulary(rng: random.Random, size: int) -> list:
+    return ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9))) for _ in range(size)]
+
+
+def make_book(rng: random.Random, vocabulary: list, weights: list) -> list:
+    units = []
+    for u in range(1, UNITS + 1):
+        unit = {"unit_number": u, "unit_title": f"Unit {u}", "chapters": []}
+        for c in range(1, CHAPTERS + 1):
+            chapter = {"chapter_number": c, "chapter_title": " ".join(rng.choices(vocabulary, cum_weights=weights, k=2)),
+                       "contents": []}
+            for b in range(BLOCKS):
+                words = " ".join(rng.choices(vocabulary, cum_weights=weights, k=12))
+                chapter["contents"].append({
+                    "content_type": rng.choice(CONTENT_TYPES),
+                    "text_content": f"{rng.choice(SAMPLE_LINES)} {words}",
+                    "activity_description": f"Section {b}",
+                })
+            unit["chapters"].append(chapter)
+        units.append(unit)
+    return units
+
+
+def count_rows_with(session, term: str) -> int:
+    return session.execute(
+        text("SELECT count(*) FROM content_fts WHERE content_fts MATCH :m"), {"m": f'"{term}"'}
+    ).scalar_one()
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--rows", type=int, default=1_000_000)
+    arg_parser.add_argument("--vocabulary", type=int, default=20000)
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    rng = random.Random(0)
+    vocabulary = make_vocabulary(rng, args.vocabulary)
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    books = max(1, args.rows // (UNITS * CHAPTERS * BLOCKS))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
+        start = time.perf_counter()
+        for i in range(books):
+            textbook = {"subject": rng.choice(SUBJECTS), "grade": str(rng.randint(1, 12)),
+                        "title": f"Book {i}", "source_file": f"book{i}.pdf"}
+            save_textbook(engine, textbook, make_book(rng, vocabulary, weights))
+        optimize_search_index(engine)
+        with engine.connect() as conn:
+            rows = conn.execute(text("SELECT count(*) FROM content")).scalar_one()
+        print(f"{rows:,} content rows (FTS kept in sync by triggers) built in {time.perf_counter() - start:.1f}s\n")
+
+        session = sessionmaker(bind=engine)()
+        common, mid, rare = vocabulary[0], vocabulary[100], vocabulary[5000]
+        cases = [
+            ("rare word", dict(query=rare)),
+            ("mid-frequency word", dict(query=mid)),
+            ("two words", dict(query=f"{mid} {vocabulary[101]}")),
+            ("near-stopword", dict(query=common)),
+            ("rare + near-stopword", dict(query=f"{rare} {common}")),
+            ("mid word, prefix", dict(query=mid, prefix=True)),
+            ("sample phrase + filters", dict(query="hands clap", content_type="poem", grade="1")),
+            ("near-stopword + filters", dict(query=common, content_type="poem", grade="1", subject="English")),
+        ]
+        for name, term in (("near-stopword", common), ("mid-frequency", mid), ("rare", rare)):
+            share = count_rows_with(session, term) / rows
+            print(f"{name} term '{term}' appears in {share:.1%} of rows")
+        print(f"\n{'query':<26}{'hits':>8}{'ranked':>8}{'fts5':>10}")
+        for name, kwargs in cases:
+            hits = search_content(session, limit=20, **kwargs)
+            ranked = "bm25" if hits and hits[0]["score"] is not None else "newest"
+            seconds = timed(lambda: search_content(session, limit=20, **kwargs), args.repeat)
+            print(f"{name:<26}{len(hits):>8}{ranked:>8}{seconds * 1000:>8.1f}ms")
+
+        like = timed(lambda: session.execute(
+            text("SELECT content_id FROM content WHERE text_content LIKE :q LIMIT 20"), {"q": f"%{rare}%"}
+        ).all(), 1)
+        print(f"\nLIKE '%{rare}%' scan for comparison: {like * 1000:.1f}ms")
+        session.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
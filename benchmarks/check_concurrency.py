@@ -0,0 +1,239 @@
+"""
+Concurrency check: parallel writers (bulk saves, streaming batches, ingest-job
+bookkeeping) and readers (tree loads, filtered lookups, search) against one
+SQLite file. Runs the old bare engine and the tuned db.database.make_engine and
+reports errors such as "database is locked" plus throughput for each.
+
+    python -m benchmarks.check_concurrency --writers 4 --readers 4 --seconds 10
+
+Exits non-zero if the tuned engine fails any check: an error in any thread,
+content rows lost or duplicated (compared book by book with what the writers
+committed), a lost job update, or more connections checked out at once than
+the pool allows.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+from collections import Counter
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from db.models import Base, IngestJob
+from db.database import make_engine, DB_POOL_SIZE, DB_MAX_OVERFLOW
+from db.migrations import run_migrations
+from db.ingest import save_textbook, TextbookWriter
+from db.queries import load_textbook_tree, find_content
+from db.search import search_content
+from benchmarks.synthetic import make_parsed_units
+
+_lock = threading.Lock()
+_titles = Counter()
+
+
+def add(stats: Counter, name: str, n: int = 1):
+    # Counter updates are read-modify-write, so threads would lose counts without the lock
+    with _lock:
+        stats[name] += n
+
+
+def unique_title(prefix: str) -> str:
+    with _lock:
+        _titles[prefix] += 1
+        return f"{prefix}-{_titles[prefix]}"
+
+
+def bulk_writer(engine, worker: int, stop: threading.Event, stats: Counter):
+    i = 0
+    while not stop.is_set():
+        title = unique_title(f"w{worker}")
+        units = make_parsed_units(2, 2, 25, seed=i)
+        save_textbook(engine, {"title": title, "grade": str(i % 12 + 1), "subject": "English"}, units)
+        rows = sum(len(chapter["contents"]) for unit in units for chapter in unit["chapters"])
+        add(stats, "books")
+        add(stats, "rows", rows)
+        add(stats, f"book:{title}", rows)
+        i += 1
+
+
+def streaming_writer(engine, worker: int, stop: threading.Event, stats: Counter):
+    while not stop.is_set():
+        title = unique_title(f"s{worker}")
+        units = make_parsed_units(2, 2, 25, seed=worker)
+        writer = TextbookWriter(engine, {"title": title, "grade": "1", "subject": "Hindi"})
+        for unit in units:
+            for chapter in unit["chapters"]:
+                rows = writer.write([(unit, chapter, content) for content in chapter["contents"]])
+                add(stats, "rows", rows)
+                add(stats, f"book:{title}", rows)
+        add(stats, "books")
+
+
+def job_writer(engine, worker: int, stop: threading.Event, stats: Counter, immediate: bool):
+    """
+    Read-modify-write like ingest.py: look a job up, then update it.
+    """
+    bind = engine.execution_options(sqlite_begin="IMMEDIATE") if immediate else engine
+    Session = sessionmaker(bind=bind)
+    while not stop.is_set():
+        db = Session()
+        try:
+            job = db.query(IngestJob).filter_by(source_path=f"job-{worker}").one_or_none()
+            if job is None:
+                job = IngestJob(source_path=f"job-{worker}", status="pending", attempts=0)
+                db.add(job)
+            job.attempts = (job.attempts or 0) + 1
+            db.commit()
+            add(stats, "job_updates")
+        finally:
+            db.close()
+
+
+def reader(engine, worker: int, stop: threading.Event, stats: Counter, search: bool):
+    Session = sessionmaker(bind=engine)
+    rng = random.Random(worker)
+    while not stop.is_set():
+        db = Session()
+        try:
+            latest = db.execute(text("SELECT max(textbook_id) FROM textbooks")).scalar()
+            if latest:
+                load_textbook_tree(db, rng.randint(1, latest))
+            find_content(db, content_type="poem", grade=str(rng.randint(1, 12)), limit=50)
+            if search:
+                search_content(db, "hands clap", grade="1")
+            add(stats, "reads")
+        finally:
+            db.close()
+
+
+def guarded(fn, stats: Counter, errors: Counter, *args):
+    def run():
+        while not args[2].is_set():
+            try:
+                fn(*args)
+            except Exception as e:
+                add(errors, type(e).__name__ + ": " + str(e).splitlines()[0][:80])
+                add(stats, "errors")
+    return run
+
+
+def watch_pool(engine, stats: Counter):
+    """
+    Tracks how many pooled connections are checked out at once (peak_connections).
+    """
+    state = {"out": 0}
+
+    @event.listens_for(engine, "checkout")
+    def checkout(*args):
+        with _lock:
+            state["out"] += 1
+            stats["peak_connections"] = max(stats["peak_connections"], state["out"])
+
+    @event.listens_for(engine, "checkin")
+    def checkin(*args):
+        with _lock:
+            state["out"] -= 1
+
+
+def verify(engine, stats: Counter, job_writers: int, connection_limit: int) -> list:
+    """
+    Compares the database with what the threads report having committed.
+    Returns the failed checks.
+    """
+    failures = []
+    if stats["errors"]:
+        failures.append(f"{stats['errors']} errors in worker threads")
+    with engine.connect() as conn:
+        stored = dict(conn.execute(text(
+            "SELECT t.title, count(c.content_id) FROM textbooks t "
+            "LEFT JOIN units u ON u.textbook_id = t.textbook_id "
+            "LEFT JOIN chapters ch ON ch.unit_id = u.unit_id "
+            "LEFT JOIN content c ON c.chapter_id = ch.chapter_id GROUP BY t.title"
+        )).all())
+        duplicated_titles = conn.execute(text(
+            "SELECT count(*) FROM (SELECT title FROM textbooks GROUP BY title HAVING count(*) > 1)"
+        )).scalar_one()
+        jobs = conn.execute(text("SELECT source_path, count(*), sum(attempts) FROM ingest_jobs "
+                                 "GROUP BY source_path")).all()
+    written = {name[len("book:"):]: rows for name, rows in stats.items() if name.startswith("book:")}
+    lost = sum(max(0, rows - stored.get(title, 0)) for title, rows in written.items())
+    extra = sum(max(0, rows - written.get(title, 0)) for title, rows in stored.items())
+    if lost:
+        failures.append(f"{lost} committed content rows missing from the database")
+    if extra or duplicated_titles:
+        failures.append(f"{extra} content rows and {duplicated_titles} textbooks stored more than once")
+    if len(jobs) > job_writers or any(count != 1 for _, count, _ in jobs):
+        failures.append("ingest job rows duplicated")
+    attempts = sum(total or 0 for _, _, total in jobs)
+    if attempts != stats["job_updates"]:
+        failures.append(f"{stats['job_updates'] - attempts} of {stats['job_updates']} job updates lost")
+    if stats["peak_connections"] > connection_limit:
+        failures.append(f"{stats['peak_connections']} connections in use at once, pool allows {connection_limit}")
+    return failures
+
+
+def run(name: str, engine, writers: int, readers: int, seconds: float, tuned: bool,
+        connection_limit: int = DB_POOL_SIZE + DB_MAX_OVERFLOW) -> list:
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    stop, stats, errors = threading.Event(), Counter(), Counter()
+    watch_pool(engine, stats)
+    kinds = [bulk_writer, streaming_writer]
+    job_writers = max(1, writers // 2)
+    threads = []
+    for i in range(writers):
+        threads.append(threading.Thread(target=guarded(kinds[i % 2], stats, errors, engine, i, stop, stats)))
+    for i in range(job_writers):
+        threads.append(threading.Thread(target=guarded(
+            lambda e, w, s, st: job_writer(e, w, s, st, immediate=tuned), stats, errors, engine, i, stop, stats)))
+    for i in range(readers):
+        threads.append(threading.Thread(target=guarded(
+            lambda e, w, s, st: reader(e, w, s, st, search=True), stats, errors, engine, i, stop, stats)))
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    failures = verify(engine, stats, job_writers, connection_limit)
+    print(f"\n{name}: {stats['books']} books / {stats['rows']:,} rows written, {stats['job_updates']} job updates, "
+          f"{stats['reads']} read rounds in {elapsed:.1f}s, {stats['errors']} errors, "
+          f"peak {stats['peak_connections']} connections")
+    for message, count in errors.most_common(5):
+        print(f"   {count} x {message}")
+    for failure in failures:
+        print(f"   ❌ {failure}")
+    engine.dispose()
+    return failures
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--writers", type=int, default=4)
+    arg_parser.add_argument("--readers", type=int, default=4)
+    arg_parser.add_argument("--seconds", type=float, default=10)
+    arg_parser.add_argument("--skip-baseline", action="store_true")
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.skip_baseline:
+            url = f"sqlite:///{os.path.join(tmp, 'baseline.db')}"
+            run("bare engine", create_engine(url), args.writers, args.readers, args.seconds, tuned=False)
+        url = f"sqlite:///{os.path.join(tmp, 'tuned.db')}"
+        failures = run("make_engine (WAL)", make_engine(url), args.writers, args.readers, args.seconds, tuned=True)
+    if failures:
+        return 1
+    print("✅ no errors, every committed row and job update stored exactly once, pool limit respected")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""
+Exercises llm_client against the mock server while it injects latency and
+429s: many threads send completions and streams at once, and the script
+reports rate-limited responses, retries, failures and how the adaptive
+limiter settled.
+
+    python -m benchmarks.check_llm_client --requests 200 --threads 16 --max-concurrent 4 --rate-limit 0.05
+
+Exits non-zero if any request failed for good.
+"""
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.mock_mistral import start_server
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--requests", type=int, default=200)
+    arg_parser.add_argument("--threads", type=int, default=16)
+    arg_parser.add_argument("--latency", type=float, default=0.05)
+    arg_parser.add_argument("--rate-limit", type=float, default=0.05)
+    arg_parser.add_argument("--max-concurrent", type=int, default=4)
+    arg_parser.add_argument("--retry-after", type=float, default=0.2)
+    args = arg_parser.parse_args()
+
+    server = start_server(latency=args.latency, rate_limit=args.rate_limit, max_concurrent=args.max_concurrent,
+                          retry_after=args.retry_after)
+    os.environ["MISTRAL_SERVER_URL"] = server.url
+    os.environ.setdefault("MISTRAL_API_KEY", "mock")
+
+    # imported after MISTRAL_SERVER_URL is set; the shared client reads it on first use
+    import llm_client
+    from llm_cache import cached_complete, cached_stream
+    from instrumentation import IngestMetrics, propagate
+
+    client = llm_client.get_client()
+    metrics = IngestMetrics("check_llm_client")
+
+    def call(i: int) -> bool:
+        prompt = f"Here is the raw OCR text:\nline {i}\n\nYour job is"
+        try:
+            if i % 4 == 0:
+                return bool("".join(cached_stream(client, "mistral-medium", prompt, use_cache=False)))
+            return bool(cached_complete(client, "mistral-small", prompt, use_cache=False))
+        except Exception as e:
+            print(f"❌ request {i}: {str(e)[:120]}")
+            return False
+
+    start = time.perf_counter()
+    with metrics.activate(), ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(propagate(call), range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    counters = metrics.summary()["counters"]
+    failed = results.count(False)
+    print(f"{args.requests} requests from {args.threads} threads in {elapsed:.1f}s "
+          f"({args.requests / elapsed:.1f}/s), {failed} failed")
+    print(f"   server: {server.request_count} requests, {server.rate_limited} answered 429, "
+          f"peak {server.peak_in_flight} in flight (allowed {args.max_concurrent or 'any'})")
+    print(f"   client: {counters.get('llm.429', 0)} 429s seen, {counters.get('llm.retries', 0)} retries, "
+          f"{counters.get('llm.errors', 0)} errors, limiter {llm_client.get_limiter().stats()}")
+    server.shutdown()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
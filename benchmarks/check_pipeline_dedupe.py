@@ -0,0 +1,119 @@
+"""
+Regression check for pipeline.ingest_parsed_textbook: a parsed book whose
+sub-blocks repeat within a chapter and across chapters is ingested into a
+throwaway database with a counting classifier. Every distinct sub-block must
+reach the classifier exactly once, and each chapter must get one content row
+per distinct sub-block, labelled with what the classifier returned.
+
+    python -m benchmarks.check_pipeline_dedupe --chapters 20 --blocks 30
+
+Exits non-zero if any check fails.
+"""
+import os
+import sys
+import random
+import argparse
+import tempfile
+from collections import Counter
+
+
+def make_units(rng: random.Random, chapters: int, blocks: int, shared: list) -> list:
+    """
+    One unit of `chapters` chapters. Blocks carry "sub_blocks" as the parser
+    produces them; every other block is left for split_mixed_block.
+    Sub-blocks are drawn from a small pool so they repeat within a chapter, and
+    `shared` texts show up in every chapter.
+    """
+    chapter_list = []
+    for c in range(1, chapters + 1):
+        pool = [f"Chapter {c} sentence {i} about plants and animals." for i in range(blocks // 2)] + shared
+        content_blocks = []
+        for b in range(blocks):
+            if b % 2:
+                content_blocks.append({"heading": "Reading", "content": rng.choice(pool), "source_page": c})
+            else:
+                subs = [rng.choice(pool) for _ in range(rng.randint(1, 3))]
+                content_blocks.append({"heading": "Exercise", "content": "\n\n".join(subs), "source_page": c,
+                                       "sub_blocks": subs})
+        chapter_list.append({"chapter_number": c, "chapter_title": f"Chapter {c}",
+                             "content_blocks": content_blocks})
+    return [{"unit_number": 1, "unit_title": "Unit 1", "chapters": chapter_list}]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--chapters", type=int, default=20)
+    arg_parser.add_argument("--blocks", type=int, default=30)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    # count only what the pipeline itself sends, not labels reused from the index
+    os.environ["NEAR_DUPLICATES"] = "0"
+    from sqlalchemy import select
+    from db.database import make_engine
+    from db.migrations import run_migrations
+    from db.models import Base, Content
+    from parser import split_mixed_block
+    from pipeline import ingest_parsed_textbook
+
+    rng = random.Random(args.seed)
+    shared = ["Read the poem aloud with your partner.", "Answer the following questions."]
+    units = make_units(rng, args.chapters, args.blocks, shared)
+
+    # what the pipeline should do, worked out independently
+    expected = {}
+    for chapter in units[0]["chapters"]:
+        texts = []
+        for block in chapter["content_blocks"]:
+            texts.extend(block.get("sub_blocks") or split_mixed_block(block["content"]) or [block["content"]])
+        expected[chapter["chapter_number"]] = set(texts)
+    distinct = set().union(*expected.values())
+
+    calls, seen = [], Counter()
+
+    def classify(texts: list) -> list:
+        calls.append(len(texts))
+        seen.update(texts)
+        return [f"label-{len(text) % 5}" for text in texts]
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{os.path.join(tmp, 'check.db')}")
+        Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
+        result = ingest_parsed_textbook(engine, {"title": "Check", "subject": "English", "grade": "1"}, units,
+                                        classify=classify)
+        with engine.connect() as conn:
+            # the database holds this one book
+            rows = conn.execute(select(Content.text_content, Content.content_type, Content.chapter_id)).all()
+        engine.dispose()
+
+    repeated = [text for text, count in seen.items() if count > 1]
+    if repeated:
+        failures.append(f"{len(repeated)} sub-blocks classified more than once")
+    if set(seen) != distinct:
+        failures.append(f"classifier saw {len(seen)} distinct sub-blocks, expected {len(distinct)}")
+    expected_rows = sum(len(texts) for texts in expected.values())
+    if len(rows) != expected_rows or result["rows"] != expected_rows:
+        failures.append(f"{len(rows)} content rows inserted, expected {expected_rows}")
+    per_chapter = Counter((row.chapter_id, row.text_content) for row in rows)
+    if any(count > 1 for count in per_chapter.values()):
+        failures.append("a sub-block was stored twice under the same chapter")
+    wrong = [row for row in rows if row.content_type != f"label-{len(row.text_content) % 5}"]
+    if wrong:
+        failures.append(f"{len(wrong)} rows do not carry their classifier label")
+
+    total = sum(len(block.get("sub_blocks") or [block["content"]])
+                for chapter in units[0]["chapters"] for block in chapter["content_blocks"])
+    print(f"{total} sub-blocks, {len(distinct)} distinct: {sum(calls)} classified in {len(calls)} call(s), "
+          f"{len(rows)} rows inserted (expected {expected_rows})")
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        return 1
+    print("✅ each distinct sub-block classified once, rows deduplicated per chapter")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+"""
+Local stand-in for the Mistral chat completions endpoint.
+
+    python -m benchmarks.mock_mistral --port 8089
+    MISTRAL_SERVER_URL=http://127.0.0.1:8089 streamlit run app.py
+
+To exercise llm_client's retries and adaptive limiter, the server can add
+latency and answer 429 (with Retry-After) at random or whenever more than
+--max-concurrent requests are in flight:
+
+    python -m benchmarks.mock_mistral --latency 0.2 --rate-limit 0.1 --max-concurrent 4
+
+Batched classification prompts (see classification.build_batch_prompt) are
+answered with a JSON array holding one label per block, filtering prompts
+echo their OCR text back as markdown, and anything else gets a short fixed
+reply. OCR requests (client.ocr.process) get a fixed page of textbook text.
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BLOCK_MARKER = re.compile(r"<<<BLOCK \d+>>>\n(.*?)(?=\n\n<<<BLOCK \d+>>>|\Z)", re.S)
+METADATA_FIELD = re.compile(r"^- (title|subject|grade|language|publisher|year)$", re.M)
+FILTER_TEXT = re.compile(r"Here is the raw OCR text:\n(.*?)\n\nYour job is", re.S)
+OCR_PAGE = "### Scanned section\nTwo little hands go clap, clap, clap.\nNote to the teacher\nA. Repeat after the teacher"
+
+
+def guess_label(block: str) -> str:
+    lowered = block.lower()
+    if "note to the teacher" in lowered:
+        return "note"
+    if "teacher:" in lowered:
+        return "dialogue"
+    if re.match(r"\**[A-Z]\.", block.strip()):
+        return "exercise"
+    return "poem"
+
+
+def reply_for(prompt: str) -> str:
+    blocks = BLOCK_MARKER.findall(prompt)
+    if blocks:
+        return json.dumps([guess_label(block) for block in blocks])
+    fields = METADATA_FIELD.findall(prompt) if "extract the following metadata" in prompt else []
+    if fields:
+        return json.dumps({field: "2024" if field == "year" else f"Mock {field}" for field in fields})
+    raw = FILTER_TEXT.search(prompt)
+    if raw:
+        # Filtering prompt: echo the OCR text back as the "filtered" markdown.
+        return f"```markdown\n{raw.group(1).strip()}\n```"
+    return "note"
+
+
+def usage(request: dict, content: str) -> dict:
+    """
+    Rough token counts (about four characters per token).
+    """
+    prompt = request.get("messages", [{}])[-1].get("content", "")
+    return {
+        "prompt_tokens": len(prompt) // 4,
+        "completion_tokens": len(content) // 4,
+        "total_tokens": (len(prompt) + len(content)) // 4,
+    }
+
+
+class MockMistralHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_stream(self, request: dict, content: str):
+        """
+        Server-sent events in the chat.stream format, one event per line of `content`.
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        pieces = content.splitlines(keepends=True) or [""]
+        for index, piece in enumerate(pieces):
+            chunk = {
+                "id": "mock-stream",
+                "object": "chat.completion.chunk",
+                "model": request.get("model", "mock"),
+                "created": int(time.time()),
+                "choices": [{
+                    "index": 0,
+                    "delta": {"role": "assistant", "content": piece},
+                    "finish_reason": "stop" if index == len(pieces) - 1 else None,
+                }],
+            }
+            if index == len(pieces) - 1:
+                chunk["usage"] = usage(request, content)
+            self.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self.write_chunk(b"data: [DONE]\n\n")
+        self.write_chunk(b"")
+
+    def write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def send_rate_limited(self):
+        body = json.dumps({"object": "error", "message": "Requests rate limit exceeded", "code": "1300"})
+        self.send_response(429)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Retry-After", f"{self.server.retry_after:g}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode("utf-8"))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+            server.in_flight += 1
+            server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+            limited = (server.max_concurrent and server.in_flight > server.max_concurrent) \
+                or random.random() < server.rate_limit
+            if limited:
+                server.rate_limited += 1
+        try:
+            if limited:
+                self.send_rate_limited()
+                return
+            if server.latency:
+                time.sleep(server.latency)
+            self.respond(request)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def respond(self, request: dict):
+        server = self.server
+        if self.path.endswith("/ocr"):
+            self.send_json(200, {
+                "model": request.get("model", "mock"),
+                "pages": [{"index": 0, "markdown": OCR_PAGE, "images": [],
+                           "dimensions": {"dpi": 100, "height": 1100, "width": 850}}],
+                "usage_info": {"pages_processed": 1},
+            })
+            return
+        if not self.path.endswith("/chat/completions"):
+            self.send_json(404, {"message": "not found"})
+            return
+
+        prompt = request.get("messages", [{}])[-1].get("content", "")
+        content = reply_for(prompt)
+        if request.get("stream"):
+            self.send_stream(request, content)
+            return
+        self.send_json(200, {
+            "id": f"mock-{server.request_count}",
+            "object": "chat.completion",
+            "model": request.get("model", "mock"),
+            "created": int(time.time()),
+            "usage": usage(request, content),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+        })
+
+
+def start_server(port: int = 0, latency: float = 0.0, rate_limit: float = 0.0, max_concurrent: int = 0,
+                 retry_after: float = 1.0):
+    """
+    Starts the mock server on a background thread and returns it.
+    The bound URL is available as `server.url`. `latency` is added to every
+    answered request; `rate_limit` is the fraction of requests answered with
+    429, and `max_concurrent` > 0 also rejects requests beyond that many in
+    flight. 429s carry `Retry-After: retry_after`.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockMistralHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.request_count = 0
+    server.rate_limited = 0
+    server.in_flight = 0
+    server.peak_in_flight = 0
+    server.latency = latency
+    server.rate_limit = rate_limit
+    server.max_concurrent = max_concurrent
+    server.retry_after = retry_after
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--port", type=int, default=8089)
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="seconds added to each reply")
+    arg_parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of requests answered with 429")
+    arg_parser.add_argument("--max-concurrent", type=int, default=0, help="429 beyond this many requests in flight")
+    arg_parser.add_argument("--retry-after", type=float, default=1.0)
+    args = arg_parser.parse_args()
+
+    httpd = start_server(args.port, args.latency, args.rate_limit, args.max_concurrent, args.retry_after)
+    print(f"Mock Mistral listening on {httpd.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        httpd.shutdown()
@@ -0,0 +1,264 @@
+"""
+Benchmark scenarios on synthetic books, with every LLM and OCR call answered
+by the mock server (benchmarks/mock_mistral.py), so no API key or real PDF is
+needed. Results are written as JSON, one file per run, and can be compared
+with an earlier run to spot regressions between commits.
+
+    python -m benchmarks.run                                    # all scenarios
+    python -m benchmarks.run --scenarios parse,split --blocks 40
+    python -m benchmarks.run --latency 0.2 --rate-limit 0.1 --scanned 0.3
+    python -m benchmarks.run --compare benchmarks/results/<older commit>.json --fail-on-regression
+
+Scenarios:
+    extract         extract_text on a generated PDF (--scanned pages go through OCR)
+    parse           parse_markdown_to_units on generated markdown
+    split           split_mixed_block on every parsed block
+    classify        ClassificationEngine (LLM only) on distinct sub-blocks
+    classify_local  local classifier in front of the LLM on the same sub-blocks
+    persist         save_textbook into a fresh SQLite database with FTS triggers
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import datetime
+import statistics
+import subprocess
+import tempfile
+
+from benchmarks.mock_mistral import start_server, guess_label
+from benchmarks.synthetic import make_markdown, make_parsed_units, make_textbook_pdf
+
+SCENARIOS = ["extract", "parse", "split", "classify", "classify_local", "persist"]
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+TEXTBOOK = {"subject": "English", "grade": "1", "language": "English",
+            "title": "Synthetic", "publisher": "Bench", "year": 2024, "source_file": "synthetic.pdf"}
+
+
+def git_commit() -> dict:
+    def git(*args):
+        return subprocess.run(["git", *args], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(RESULTS_DIR)).stdout.strip()
+    try:
+        return {"commit": git("rev-parse", "--short", "HEAD"),
+                "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": "unknown", "dirty": None}
+
+
+def measure(fn, repeat: int, setup=None) -> dict:
+    """
+    Runs `fn` `repeat` times; returns its last result and the best / median time.
+    With `setup`, fn(setup()) is timed and setup() is not.
+    """
+    times, result = [], None
+    for _ in range(max(1, repeat)):
+        prepared = setup() if setup else None
+        start = time.perf_counter()
+        result = fn(prepared) if setup else fn()
+        times.append(time.perf_counter() - start)
+    return {"result": result, "seconds": min(times), "median_seconds": statistics.median(times), "runs": len(times)}
+
+
+class Bench:
+    """
+    Builds the synthetic inputs once and runs the scenarios against them.
+    """
+
+    def __init__(self, args, server):
+        self.args = args
+        self.server = server
+        self.markdown = make_markdown(args.units, args.chapters, args.blocks, args.seed)
+
+    def sub_blocks(self) -> list:
+        from parser import parse_units, split_mixed_block
+
+        texts = []
+        for unit in parse_units(self.markdown):
+            for chapter in unit["chapters"]:
+                for block in chapter["content_blocks"]:
+                    texts.extend(split_mixed_block(block["content"]))
+        return list(dict.fromkeys(texts))[:self.args.classify_blocks]
+
+    def extract(self) -> dict:
+        import fitz
+        from ocr_utils import extract_text
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = make_textbook_pdf(os.path.join(tmp, "bench.pdf"), self.args.units, self.args.chapters,
+                                     self.args.blocks, scanned=self.args.scanned, seed=self.args.seed)
+            with fitz.open(path) as pdf:
+                pages = pdf.page_count
+            timing = measure(lambda: extract_text(path), self.args.repeat)
+        return {**timing, "items": pages, "unit": "pages", "chars": len(timing["result"])}
+
+    def parse(self) -> dict:
+        from parser import parse_markdown_to_units
+
+        timing = measure(lambda: parse_markdown_to_units(self.markdown, with_sub_blocks=True), self.args.repeat)
+        size_mb = len(self.markdown.encode("utf-8")) / 1e6
+        return {**timing, "items": round(size_mb, 3), "unit": "MB"}
+
+    def split(self) -> dict:
+        from parser import parse_units, split_mixed_block
+
+        contents = [block["content"] for unit in parse_units(self.markdown)
+                    for chapter in unit["chapters"] for block in chapter["content_blocks"]]
+        timing = measure(lambda: [split_mixed_block(content) for content in contents], self.args.repeat)
+        return {**timing, "items": len(contents), "unit": "blocks",
+                "sub_blocks": sum(len(subs) for subs in timing["result"])}
+
+    def classify(self) -> dict:
+        from classification import ClassificationEngine
+
+        texts = self.sub_blocks()
+        timing = measure(lambda: ClassificationEngine().classify(texts), self.args.repeat)
+        return {**timing, "items": len(texts), "unit": "blocks"}
+
+    def classify_local(self) -> dict:
+        from classification import ClassificationEngine
+        from local_classifier import LocalClassifier
+
+        texts = self.sub_blocks()
+        # trained on the labels the mock would give, i.e. what a stored book would hold
+        rows = [(text, guess_label(text)) for text in texts]
+
+        def run():
+            local = LocalClassifier.train(rows)
+            labels = local.classify(texts, ClassificationEngine().classify)
+            return local.stats(), labels
+
+        timing = measure(run, self.args.repeat)
+        stats = timing["result"][0]
+        return {**timing, "items": len(texts), "unit": "blocks", "saved_fraction": stats["saved_fraction"]}
+
+    def persist(self) -> dict:
+        from db.database import make_engine
+        from db.ingest import save_textbook
+        from db.migrations import run_migrations
+        from db.models import Base
+
+        parsed_units = make_parsed_units(self.args.units, self.args.chapters, self.args.blocks, self.args.seed)
+        rows = sum(len(chapter["contents"]) for unit in parsed_units for chapter in unit["chapters"])
+
+        engines = []
+
+        def fresh_database():
+            # schema setup is not part of the measurement
+            engine = make_engine(f"sqlite:///{os.path.join(tmp, f'bench{len(engines)}.db')}")
+            Base.metadata.create_all(bind=engine)
+            run_migrations(engine)
+            engines.append(engine)
+            return engine
+
+        with tempfile.TemporaryDirectory() as tmp:
+            timing = measure(lambda engine: save_textbook(engine, TEXTBOOK, parsed_units), self.args.repeat,
+                             setup=fresh_database)
+            for engine in engines:
+                engine.dispose()
+        return {**timing, "items": rows, "unit": "rows"}
+
+    def run(self, name: str) -> dict:
+        from instrumentation import IngestMetrics
+
+        metrics = IngestMetrics(name)
+        requests, rate_limited = self.server.request_count, self.server.rate_limited
+        with metrics.activate():
+            outcome = getattr(self, name)()
+        outcome.pop("result", None)
+        outcome["per_second"] = round(outcome["items"] / outcome["seconds"], 2) if outcome["seconds"] else None
+        outcome["mock_requests"] = self.server.request_count - requests
+        outcome["mock_429s"] = self.server.rate_limited - rate_limited
+        outcome["counters"] = metrics.summary()["counters"]
+        return outcome
+
+
+def compare(previous: dict, current: dict, threshold: float) -> list:
+    """
+    Prints the change in best time per scenario; returns the scenarios that
+    got slower by more than `threshold` (a fraction).
+    """
+    regressions = []
+    print(f"\nvs {previous.get('commit', '?')}:")
+    for name, result in current["scenarios"].items():
+        before = previous.get("scenarios", {}).get(name)
+        if not before or not before.get("seconds") or not result.get("seconds"):
+            continue
+        change = result["seconds"] / before["seconds"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  ⚠️ regression"
+        print(f"   {name:<15} {before['seconds']:.3f}s -> {result['seconds']:.3f}s ({change:+.0%}){flag}")
+    return regressions
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated, default all")
+    arg_parser.add_argument("--units", type=int, default=5)
+    arg_parser.add_argument("--chapters", type=int, default=5, help="chapters per unit")
+    arg_parser.add_argument("--blocks", type=int, default=20, help="blocks per chapter")
+    arg_parser.add_argument("--scanned", type=float, default=0.0, help="fraction of PDF pages without a text layer")
+    arg_parser.add_argument("--classify-blocks", type=int, default=120, help="distinct sub-blocks to classify")
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--latency", type=float, default=0.05, help="mock server seconds per reply")
+    arg_parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of mock replies that are 429")
+    arg_parser.add_argument("--retry-after", type=float, default=0.2)
+    arg_parser.add_argument("--output", help=f"results file (default {RESULTS_DIR}/<commit>.json)")
+    arg_parser.add_argument("--compare", help="earlier results file to compare against")
+    arg_parser.add_argument("--threshold", type=float, default=0.10, help="slowdown that counts as a regression")
+    arg_parser.add_argument("--fail-on-regression", action="store_true")
+    args = arg_parser.parse_args(argv)
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        arg_parser.error(f"unknown scenarios: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+
+    server = start_server(latency=args.latency, rate_limit=args.rate_limit, retry_after=args.retry_after)
+    # set before the project modules are imported: the LLM cache setting is read at import
+    # time and the shared client reads MISTRAL_SERVER_URL on first use
+    os.environ["MISTRAL_SERVER_URL"] = server.url
+    os.environ.setdefault("MISTRAL_API_KEY", "mock")
+    os.environ["LLM_CACHE_DISABLED"] = "1"
+    os.environ.pop("PARSER_DEBUG_DUMP", None)
+
+    bench = Bench(args, server)
+    results = {
+        **git_commit(),
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "params": {key: value for key, value in vars(args).items()
+                   if key not in ("output", "compare", "threshold", "fail_on_regression")},
+        "scenarios": {},
+    }
+    for name in names:
+        outcome = bench.run(name)
+        results["scenarios"][name] = outcome
+        print(f"{name:<15} {outcome['seconds']:.3f}s best of {outcome['runs']} "
+              f"({outcome['per_second']:,} {outcome['unit']}/s, {outcome['mock_requests']} mock requests)")
+    server.shutdown()
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"🟢 Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Synthetic textbook generators for the benchmarks.
+"""
+import random
+
+SAMPLE_LINES = [
+    "Two little hands go clap, clap, clap.",
+    "Teacher: I clap with my hands.",
+    "Children: I tap with my feet.",
+    "A. Repeat after the teacher",
+    "B. Match the words with the pictures.",
+    "Note to the teacher",
+    "* Write sight words and new words on the board.",
+    "Head, shoulders, knees and toes",
+    "**Sight words**",
+    "| one | to |",
+]
+
+CONTENT_TYPES = ["poem", "note", "dialogue", "exercise", "activity", "rhyme"]
+
+
+def make_block_text(rng: random.Random, lines: int = 6) -> str:
+    return "\n".join(rng.choice(SAMPLE_LINES) for _ in range(lines))
+
+
+def make_parsed_units(units: int = 10, chapters: int = 10, blocks: int = 100, seed: int = 0) -> list:
+    """
+    Builds parse_markdown_to_units-shaped output with a "contents" list on every
+    chapter, ready for db.ingest.save_textbook. Total blocks = units * chapters * blocks.
+    """
+    rng = random.Random(seed)
+    parsed = []
+    for u in range(1, units + 1):
+        unit = {"unit_number": u, "unit_title": f"Synthetic unit {u}", "chapters": []}
+        for c in range(1, chapters + 1):
+            chapter = {"chapter_number": c, "chapter_title": f"Chapter {c}", "content_blocks": [], "contents": []}
+            for b in range(blocks):
+                text = make_block_text(rng)
+                chapter["content_blocks"].append({"heading": f"Section {b}", "content": text})
+                chapter["contents"].append({
+                    "content_type": rng.choice(CONTENT_TYPES),
+                    "text_content": text,
+                    "activity_description": f"Section {b}",
+                })
+            unit["chapters"].append(chapter)
+        parsed.append(unit)
+    return parsed
+
+
+def make_markdown(units: int = 10, chapters: int = 10, blocks: int = 100, seed: int = 0) -> str:
+    """
+    Renders a synthetic book as filtered markdown (# Unit / ## Chapter / ### heading).
+    """
+    rng = random.Random(seed)
+    out = ["```markdown"]
+    for u in range(1, units + 1):
+        out.append(f"# Unit {u}: Synthetic unit {u}")
+        for c in range(1, chapters + 1):
+            out.append(f"## Chapter {c}: Chapter {c}")
+            for b in range(blocks):
+                out.append(f"### Section {b}")
+                out.append(make_block_text(rng))
+                out.append("")
+    out.append("```")
+    return "\n".join(out)
+
+
+def write_pdf(path: str, pages: list, scanned: float = 0.0, seed: int = 0, fontsize: int = 9) -> str:
+    """
+    Writes one PDF page per list of lines. About `scanned` (0..1) of the pages
+    are rasterised into an image with no text layer, like a scanned page, so
+    they go through the OCR backend on extraction.
+    """
+    import fitz
+
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for lines in pages:
+        page = doc.new_page()
+        if rng.random() < scanned:
+            with fitz.open() as scratch:
+                source = scratch.new_page(width=page.rect.width, height=page.rect.height)
+                source.insert_text((50, 50), "\n".join(lines), fontsize=fontsize)
+                page.insert_image(page.rect, pixmap=source.get_pixmap(dpi=100))
+        else:
+            page.insert_text((50, 50), "\n".join(lines), fontsize=fontsize)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def make_pdf(path: str, pages: int = 500, lines_per_page: int = 40, seed: int = 0, scanned: float = 0.0) -> str:
+    """
+    Writes a PDF with `pages` pages of synthetic textbook lines.
+    """
+    rng = random.Random(seed)
+    return write_pdf(path, [[f"### Section {number}"] + [rng.choice(SAMPLE_LINES) for _ in range(lines_per_page)]
+                            for number in range(1, pages + 1)], scanned, seed)
+
+
+def make_textbook_pdf(path: str, units: int = 2, chapters: int = 5, blocks: int = 10, lines_per_page: int = 40,
+                      scanned: float = 0.0, seed: int = 0) -> str:
+    """
+    Lays the make_markdown book out over as many pages as it needs, so the
+    extracted text has real unit / chapter / section headers.
+    """
+    lines = [line for line in make_markdown(units, chapters, blocks, seed).splitlines() if not line.startswith("```")]
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)]
+    return write_pdf(path, pages, scanned, seed)
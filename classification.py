@@ -0,0 +1,169 @@
+import os
+import re
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_cache import cached_complete, get_cache
+from instrumentation import incr, propagate
+from local_classifier import LOCAL_CLASSIFIER, get_local_classifier
+from ocr_utils import CONTENT_TYPES, build_classification_prompt, get_mistral_client
+
+CLASSIFY_MODEL = "mistral-small"
+CLASSIFY_BATCH_SIZE = int(os.getenv("CLASSIFY_BATCH_SIZE", "8"))
+CLASSIFY_BATCH_CHARS = int(os.getenv("CLASSIFY_BATCH_CHARS", "12000"))
+CLASSIFY_CONCURRENCY = int(os.getenv("CLASSIFY_CONCURRENCY", "4"))
+CLASSIFY_RATE = float(os.getenv("CLASSIFY_RATE", "2.0"))  # requests per second
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. acquire() blocks until a token is available.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def build_batch_prompt(blocks: list) -> str:
+    numbered = "\n\n".join(
+        f"<<<BLOCK {i}>>>\n{block}" for i, block in enumerate(blocks, start=1)
+    )
+    return f"""
+You are an expert classifier of content blocks from Indian school textbooks (Grades 1–5).
+Your task is to assign a single most appropriate content type label from the list below to each of the {len(blocks)} numbered blocks.
+
+Allowed content types:
+{json.dumps(CONTENT_TYPES)}
+
+Rules:
+- If a block contains multiple types, return only the **most dominant** or educationally intended type.
+- Respond ONLY with a JSON array of exactly {len(blocks)} lowercase labels, in block order, e.g. ["poem", "note"].
+- Do NOT wrap it in triple backticks. No explanations.
+
+{numbered}
+"""
+
+
+def parse_batch_response(raw: str, expected: int):
+    """
+    Returns the list of labels from a batch response, or None if it is unusable.
+    """
+    cleaned = re.sub(r"^```(?:json)?", "", raw.strip(), flags=re.IGNORECASE).strip()
+    cleaned = re.sub(r"```$", "", cleaned).strip()
+    try:
+        labels = json.loads(cleaned)
+    except ValueError:
+        return None
+    if not isinstance(labels, list) or len(labels) != expected:
+        return None
+    return [str(label).strip().lower() or "unknown" for label in labels]
+
+
+class ClassificationEngine:
+    """
+    Classifies many content blocks at once: blocks are packed into batched
+    prompts, batches are sent concurrently through a bounded thread pool and
+    a shared token-bucket rate limiter, and labels come back in input order.
+    """
+
+    def __init__(self, batch_size=CLASSIFY_BATCH_SIZE, max_workers=CLASSIFY_CONCURRENCY,
+                 requests_per_second=CLASSIFY_RATE, batch_chars=CLASSIFY_BATCH_CHARS,
+                 client=None, model=CLASSIFY_MODEL):
+        self.batch_size = max(1, batch_size)
+        self.batch_chars = batch_chars
+        self.max_workers = max(1, max_workers)
+        self.bucket = TokenBucket(requests_per_second)
+        self.client = client or get_mistral_client()
+        self.model = model
+
+    def make_batches(self, blocks: list) -> list:
+        """
+        Groups block indexes into batches bounded by count and total characters.
+        """
+        batches, current, size = [], [], 0
+        for i, block in enumerate(blocks):
+            if current and (len(current) >= self.batch_size or size + len(block) > self.batch_chars):
+                batches.append(current)
+                current, size = [], 0
+            current.append(i)
+            size += len(block)
+        if current:
+            batches.append(current)
+        return batches
+
+    def complete(self, prompt: str) -> str:
+        self.bucket.acquire()
+        try:
+            # Batch prompts depend on how blocks were packed, so labels are
+            # cached per block in classify() instead. Rate limits and transient
+            # failures are retried inside llm_client.
+            return cached_complete(self.client, self.model, prompt, use_cache=False)
+        except Exception as e:
+            print(f"Content type classification error: {str(e)}")
+            return ""
+
+    def classify_batch(self, blocks: list) -> list:
+        labels = parse_batch_response(self.complete(build_batch_prompt(blocks)), len(blocks))
+        if labels is not None:
+            return labels
+        if len(blocks) == 1:
+            return ["unknown"]
+        # The model lost count; fall back to one block per prompt.
+        return [self.classify_batch([block])[0] for block in blocks]
+
+    def classify(self, blocks: list) -> list:
+        """
+        Returns one label per block, in the same order as `blocks`.
+        """
+        if not blocks:
+            return []
+        cache = get_cache()
+        labels = [cache.get(self.model, build_classification_prompt(block)) for block in blocks]
+        labels = [label.lower() if label is not None else None for label in labels]
+        missing = [i for i, label in enumerate(labels) if label is None]
+        incr("classify.blocks", len(blocks))
+        incr("classify.cache_hits", len(blocks) - len(missing))
+        if not missing:
+            return labels
+
+        batches = [[missing[j] for j in batch] for batch in self.make_batches([blocks[i] for i in missing])]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as pool:
+            results = pool.map(propagate(lambda idx: self.classify_batch([blocks[i] for i in idx])), batches)
+            for idx, batch_labels in zip(batches, results):
+                for i, label in zip(idx, batch_labels):
+                    labels[i] = label
+                    if label != "unknown":
+                        cache.set(self.model, build_classification_prompt(blocks[i]), label)
+        return labels
+
+
+def classify_blocks(blocks: list, **kwargs) -> list:
+    """
+    Convenience wrapper: classify a list of sub-blocks from split_mixed_block.
+    Blocks the local classifier is confident about never reach the LLM
+    (LOCAL_CLASSIFIER=0 sends everything).
+    """
+    engine = ClassificationEngine(**kwargs)
+    if not LOCAL_CLASSIFIER:
+        return engine.classify(blocks)
+    return get_local_classifier().classify(blocks, engine.classify)
@@ -1,11 +1,93 @@
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 from db.models import Base
+from db.migrations import run_migrations
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///ocr_data.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 8))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 8))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 30000))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", 64 * 1024))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+
+
+def sqlite_pragmas(busy_timeout_ms: int = SQLITE_BUSY_TIMEOUT_MS, cache_size_kb: int = SQLITE_CACHE_SIZE_KB,
+                   mmap_size: int = SQLITE_MMAP_SIZE, synchronous: str = SQLITE_SYNCHRONOUS) -> list:
+    """
+    Per-connection settings. WAL lets readers run alongside the single writer;
+    synchronous=NORMAL is durable in WAL mode except for the last commits on
+    power loss; the busy timeout makes a second writer wait instead of failing
+    with "database is locked".
+    """
+    return [
+        "PRAGMA journal_mode=WAL",
+        f"PRAGMA synchronous={synchronous}",
+        f"PRAGMA busy_timeout={int(busy_timeout_ms)}",
+        f"PRAGMA cache_size=-{int(cache_size_kb)}",
+        f"PRAGMA mmap_size={int(mmap_size)}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+
+def make_engine(url: str = DATABASE_URL, pool_size: int = DB_POOL_SIZE, max_overflow: int = DB_MAX_OVERFLOW,
+                **pragma_options):
+    """
+    Engine factory for DATABASE_URL. SQLite files get the pragmas above on every
+    new connection and a thread-shareable connection pool (one connection per
+    concurrent reader; writers serialize on the database lock). In-memory SQLite
+    uses a single shared connection. Any other backend (e.g. postgresql://) gets
+    a plain pooled engine with pre-ping.
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite":
+        return create_engine(url, pool_size=pool_size, max_overflow=max_overflow, pool_pre_ping=True)
+
+    memory = parsed.database in (None, "", ":memory:")
+    if memory:
+        engine = create_engine(url, poolclass=StaticPool, connect_args={"check_same_thread": False})
+    else:
+        engine = create_engine(
+            url,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            connect_args={
+                "check_same_thread": False,
+                "timeout": pragma_options.get("busy_timeout_ms", SQLITE_BUSY_TIMEOUT_MS) / 1000,
+            },
+        )
+    pragmas = sqlite_pragmas(**pragma_options)
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            if memory and "journal_mode" in pragma:
+                continue
+            cursor.execute(pragma)
+        cursor.close()
+        # let SQLAlchemy's "begin" event below emit BEGIN instead of pysqlite
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def begin_transaction(conn):
+        conn.exec_driver_sql("BEGIN " + conn.get_execution_options().get("sqlite_begin", "DEFERRED"))
+
+    return engine
 
-DATABASE_URL = "sqlite:///ocr_data.db"
 
-engine = create_engine(DATABASE_URL)
+engine = make_engine()
+# Transactions that read before they write (job bookkeeping, edits) must take the
+# write lock up front: in WAL mode a deferred transaction whose snapshot went
+# stale fails with "database is locked" at its first write instead of waiting.
+write_engine = engine.execution_options(sqlite_begin="IMMEDIATE")
 SessionLocal = sessionmaker(bind=engine)
+WriteSession = sessionmaker(bind=write_engine)
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
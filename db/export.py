@@ -0,0 +1,95 @@
+"""
+Streaming read of the textbook corpus for bulk export (see export.py).
+
+Every content row comes out as one flat dict with its chapter, unit and
+textbook columns joined in. Rows are fetched `batch_size` at a time through a
+streaming cursor (server-side on PostgreSQL, incremental fetchmany on SQLite)
+and never mapped to ORM objects, so memory stays flat however large the corpus.
+"""
+import os
+
+from sqlalchemy import Integer, Boolean, DateTime, select
+
+from db.models import Textbook, Unit, Chapter, Content, ChangeCounter
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+
+EXPORT_COLUMNS = [
+    Textbook.textbook_id, Textbook.title, Textbook.subject, Textbook.grade, Textbook.language,
+    Textbook.publisher, Textbook.year, Textbook.source_file,
+    Unit.unit_id, Unit.unit_number, Unit.unit_title,
+    Chapter.chapter_id, Chapter.chapter_number, Chapter.chapter_title,
+    Content.content_id, Content.content_type, Content.text_content, Content.activity_description,
+    Content.source_page, Content.content_hash, Content.duplicate_of, Content.is_active, Content.revision,
+    Content.created_at, Content.updated_at,
+]
+EXPORT_FIELDS = [column.key for column in EXPORT_COLUMNS]
+
+
+def field_kinds() -> dict:
+    """
+    {field: "int" | "bool" | "datetime" | "str"}, for typed output formats.
+    """
+    kinds = {}
+    for column in EXPORT_COLUMNS:
+        kind = "str"
+        if isinstance(column.type, Boolean):
+            kind = "bool"
+        elif isinstance(column.type, Integer):
+            kind = "int"
+        elif isinstance(column.type, DateTime):
+            kind = "datetime"
+        kinds[column.key] = kind
+    return kinds
+
+
+def current_revision(engine) -> int:
+    """
+    The latest content revision taken by a writer (db.ingest.next_revision).
+    """
+    with engine.connect() as conn:
+        return conn.execute(select(ChangeCounter.value).where(ChangeCounter.name == "content")).scalar() or 0
+
+
+def export_query(grade: str = None, subject: str = None, content_type: str = None, textbook_ids: list = None,
+                 since=None, after_revision: int = None, include_inactive: bool = False):
+    """
+    The joined export select, in content_id order. `since` keeps content rows
+    updated at or after that datetime (served by ix_content_updated_at),
+    `after_revision` those written after that revision (ix_content_revision).
+    """
+    query = (
+        select(*EXPORT_COLUMNS)
+        .join(Chapter, Content.chapter_id == Chapter.chapter_id)
+        .join(Unit, Chapter.unit_id == Unit.unit_id)
+        .join(Textbook, Unit.textbook_id == Textbook.textbook_id)
+    )
+    if not include_inactive:
+        query = query.where(Content.is_active.is_(True))
+    if grade is not None:
+        query = query.where(Textbook.grade == grade)
+    if subject is not None:
+        query = query.where(Textbook.subject == subject)
+    if content_type is not None:
+        query = query.where(Content.content_type == content_type)
+    if textbook_ids:
+        query = query.where(Textbook.textbook_id.in_(textbook_ids))
+    if since is not None:
+        query = query.where(Content.updated_at >= since)
+    if after_revision is not None:
+        query = query.where(Content.revision > after_revision)
+    return query.order_by(Content.content_id)
+
+
+def iter_export_batches(engine, batch_size: int = EXPORT_BATCH_SIZE, **filters):
+    """
+    Yields lists of up to `batch_size` row dicts (EXPORT_FIELDS keys) for
+    export_query(**filters). The whole export reads one consistent snapshot;
+    in WAL mode that does not block writers.
+    """
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(export_query(**filters))
+        # zip with the keys once per row; RowMapping views are much slower to copy
+        keys = list(result.keys())
+        for partition in result.partitions():
+            yield [dict(zip(keys, row)) for row in partition]
@@ -0,0 +1,504 @@
+import re
+import bisect
+import difflib
+import hashlib
+import datetime
+import threading
+
+from sqlalchemy import insert, select, update, delete, bindparam
+
+from db.models import (Textbook, Unit, Chapter, Content, PageHash, Media, Translation, ChangeCounter,
+                       label_source, stored_label)
+from db.near_duplicates import inherited_columns
+from instrumentation import stage, incr
+
+
+def clean_surrogates(text) -> str:
+    if not isinstance(text, str):
+        return str(text)
+    return text.encode('utf-16', 'surrogatepass').decode('utf-16', 'ignore')
+
+
+def content_hash(text) -> str:
+    """
+    sha256 of a block's text with whitespace runs collapsed, so re-extraction
+    noise (trailing spaces, blank lines) does not count as a change.
+    """
+    normalized = re.sub(r"\s+", " ", clean_surrogates(text or "")).strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def _clean_row(row: dict) -> dict:
+    return {k: clean_surrogates(v) if isinstance(v, str) else v for k, v in row.items()}
+
+
+def _insert_textbook(conn, textbook: dict, now) -> int:
+    return conn.execute(
+        insert(Textbook).values(**_clean_row({"created_at": now, **textbook})).returning(Textbook.textbook_id)
+    ).scalar_one()
+
+
+def _unit_row(unit: dict, textbook_id: int) -> dict:
+    return _clean_row({
+        "textbook_id": textbook_id,
+        "unit_number": unit.get("unit_number", ""),
+        "unit_title": unit.get("unit_title", ""),
+        "unit_description": None,
+    })
+
+
+def _chapter_row(chapter: dict, unit_id: int, now) -> dict:
+    return _clean_row({
+        "unit_id": unit_id,
+        "chapter_number": chapter.get("chapter_number", "1"),
+        "chapter_title": chapter.get("chapter_title", "Untitled"),
+        "chapter_description": None,
+        "created_at": now,
+    })
+
+
+def next_revision(conn) -> int:
+    """
+    Takes the next content revision inside the caller's write transaction and
+    locks the counter until it commits, so revisions commit in order: an export
+    that reads the counter first (db.export.current_revision) is sure to see
+    every row at or below that value.
+    """
+    revision = conn.execute(update(ChangeCounter).where(ChangeCounter.name == "content")
+                            .values(value=ChangeCounter.value + 1).returning(ChangeCounter.value)).scalar()
+    if revision is None:
+        # a database built by create_all alone; migration 008 seeds the row
+        conn.execute(insert(ChangeCounter).values(name="content", value=1))
+        revision = 1
+    return revision
+
+
+def _content_row(content: dict, chapter_id: int, now, revision: int) -> dict:
+    return _clean_row({
+        "is_active": True,
+        "revision": revision,
+        "created_at": now,
+        "updated_at": now,
+        "content_hash": content_hash(content.get("text_content")),
+        "label_source": label_source(content.get("content_type")),
+        **inherited_columns(content.get("content_type")),
+        **content,
+        "chapter_id": chapter_id,
+    })
+
+
+def save_textbook(engine, textbook: dict, parsed_units: list) -> int:
+    """
+    Writes a whole parsed textbook in a single transaction using bulk inserts.
+
+    `textbook` holds the Textbook column values. `parsed_units` is the output of
+    parse_markdown_to_units where every chapter additionally carries a "contents"
+    list of Content column dicts (content_type, text_content, activity_description, ...).
+    Unit and chapter ids come back from INSERT ... RETURNING in parameter order.
+    Near-duplicates are looked up and indexed before, when the blocks are
+    classified (db.near_duplicates); a label taken from one brings its duplicate_of.
+    Returns the new textbook_id.
+    """
+    now = datetime.datetime.now()
+    units = [unit for unit in parsed_units if unit]
+
+    with stage("db.write"), engine.begin() as conn:
+        revision = next_revision(conn)
+        textbook_id = _insert_textbook(conn, textbook, now)
+
+        unit_ids = []
+        if units:
+            unit_ids = conn.execute(
+                insert(Unit).returning(Unit.unit_id, sort_by_parameter_order=True),
+                [_unit_row(unit, textbook_id) for unit in units]
+            ).scalars().all()
+
+        chapters, chapter_rows = [], []
+        for unit, unit_id in zip(units, unit_ids):
+            for chapter in unit.get("chapters", []):
+                if not chapter:
+                    continue
+                chapters.append(chapter)
+                chapter_rows.append(_chapter_row(chapter, unit_id, now))
+
+        chapter_ids = []
+        if chapter_rows:
+            chapter_ids = conn.execute(
+                insert(Chapter).returning(Chapter.chapter_id, sort_by_parameter_order=True),
+                chapter_rows
+            ).scalars().all()
+
+        content_rows = []
+        for chapter, chapter_id in zip(chapters, chapter_ids):
+            for content in chapter.get("contents", []):
+                content_rows.append(_content_row(content, chapter_id, now, revision))
+
+        if content_rows:
+            conn.execute(insert(Content), content_rows)
+
+    incr("db.rows", len(content_rows))
+    incr("db.commits")
+    return textbook_id
+
+
+def _collect_media(engine, paths: list):
+    """
+    Deletes the media store files in `paths` that no Media row refers to any more.
+    """
+    if paths:
+        # imported here: media_store pulls in PyMuPDF and the extraction code
+        from media_store import collect_garbage
+
+        collect_garbage(engine, paths)
+
+
+def delete_textbook(engine, textbook_id: int):
+    """
+    Deletes a textbook with its units, chapters, content and everything hanging
+    off them, in one transaction. Rows of other books that were linked to this
+    book's content as near-duplicates are unlinked, and image files no other
+    book uses are removed from the media store.
+    """
+    with engine.begin() as conn:
+        unit_ids = select(Unit.unit_id).where(Unit.textbook_id == textbook_id)
+        chapter_ids = select(Chapter.chapter_id).where(Chapter.unit_id.in_(unit_ids))
+        content_ids = select(Content.content_id).where(Content.chapter_id.in_(chapter_ids))
+        conn.execute(update(Content).where(Content.duplicate_of.in_(content_ids))
+                     .values(duplicate_of=None, revision=next_revision(conn)))
+        media_paths = conn.execute(select(Media.image_path).where(Media.content_id.in_(content_ids))).scalars().all()
+        conn.execute(delete(Media).where(Media.content_id.in_(content_ids)))
+        conn.execute(delete(Translation).where(Translation.content_id.in_(content_ids)))
+        conn.execute(delete(Content).where(Content.chapter_id.in_(chapter_ids)))
+        conn.execute(delete(Chapter).where(Chapter.unit_id.in_(unit_ids)))
+        conn.execute(delete(Unit).where(Unit.textbook_id == textbook_id))
+        conn.execute(delete(PageHash).where(PageHash.textbook_id == textbook_id))
+        conn.execute(delete(Textbook).where(Textbook.textbook_id == textbook_id))
+    _collect_media(engine, media_paths)
+
+
+class TextbookWriter:
+    """
+    Incremental counterpart of save_textbook for streaming ingest: each write()
+    call bulk-inserts a batch of content rows in its own transaction, creating the
+    textbook, unit and chapter rows the first time they are needed.
+    A failed ingest calls discard(), so no partial textbook is left behind.
+    """
+
+    def __init__(self, engine, textbook: dict):
+        self.engine = engine
+        self.textbook = textbook
+        self.textbook_id = None
+        self.now = datetime.datetime.now()
+        self.unit_ids = {}
+        self.chapter_ids = {}
+        self.rows = 0
+        self.discarded = False
+        # a write still running in a worker thread finishes before discard() deletes
+        self.lock = threading.Lock()
+
+    def _chapter_id(self, conn, textbook_id: int, unit_ids: dict, chapter_ids: dict, unit: dict,
+                    chapter: dict) -> int:
+        if id(unit) not in unit_ids:
+            unit_ids[id(unit)] = conn.execute(
+                insert(Unit).values(**_unit_row(unit, textbook_id)).returning(Unit.unit_id)
+            ).scalar_one()
+        if id(chapter) not in chapter_ids:
+            chapter_ids[id(chapter)] = conn.execute(
+                insert(Chapter).values(**_chapter_row(chapter, unit_ids[id(unit)], self.now))
+                .returning(Chapter.chapter_id)
+            ).scalar_one()
+        return chapter_ids[id(chapter)]
+
+    def write(self, items: list) -> int:
+        """
+        `items` is a list of (unit, chapter, content) where unit and chapter are the
+        parser's dicts and content holds Content column values. Returns rows written.
+        """
+        if not items:
+            return 0
+        with self.lock:
+            if self.discarded:
+                raise RuntimeError("Textbook writer was discarded.")
+            # ids are only kept once their transaction has committed
+            unit_ids, chapter_ids = dict(self.unit_ids), dict(self.chapter_ids)
+            with stage("db.write"):
+                with self.engine.begin() as conn:
+                    # each batch is stamped when it is written, not when the writer was made
+                    now, revision = datetime.datetime.now(), next_revision(conn)
+                    textbook_id = self.textbook_id or _insert_textbook(conn, self.textbook, self.now)
+                    rows = [_content_row(content, self._chapter_id(conn, textbook_id, unit_ids, chapter_ids, unit,
+                                                                   chapter), now, revision)
+                            for unit, chapter, content in items]
+                    conn.execute(insert(Content), rows)
+                # before the stage timer, which raises JobCancelled once a job is cancelled
+                self.textbook_id, self.unit_ids, self.chapter_ids = textbook_id, unit_ids, chapter_ids
+                self.rows += len(rows)
+        incr("db.rows", len(rows))
+        incr("db.commits")
+        return len(rows)
+
+    def discard(self):
+        """
+        Deletes everything written so far and refuses further writes.
+        """
+        with self.lock:
+            self.discarded = True
+            if self.textbook_id is not None:
+                delete_textbook(self.engine, self.textbook_id)
+                print(f"🧹 Removed partial textbook {self.textbook_id} ({self.rows} rows)")
+            self.textbook_id, self.unit_ids, self.chapter_ids, self.rows = None, {}, {}, 0
+
+
+def load_page_hashes(engine, textbook_id: int) -> dict:
+    """
+    {page_number: PageHash row} for a textbook.
+    """
+    with engine.connect() as conn:
+        rows = conn.execute(select(PageHash).where(PageHash.textbook_id == textbook_id)).all()
+    return {row.page_number: row for row in rows}
+
+
+def save_page_hashes(engine, textbook_id: int, pages: list):
+    """
+    Replaces a textbook's page_hashes with `pages`, a list of dicts holding
+    page_number, text_hash, prompt_hash and filtered_text.
+    """
+    now = datetime.datetime.now()
+    with engine.begin() as conn:
+        conn.execute(delete(PageHash).where(PageHash.textbook_id == textbook_id))
+        if pages:
+            conn.execute(insert(PageHash), [_clean_row({"textbook_id": textbook_id, "created_at": now,
+                                                        "updated_at": now, **page}) for page in pages])
+
+
+def _unit_key(unit) -> tuple:
+    return (str(unit.get("unit_number") or ""), "" if unit.get("unit_number") else unit.get("unit_title") or "")
+
+
+def _chapter_key(chapter) -> tuple:
+    return (str(chapter.get("chapter_number") or ""),
+            "" if chapter.get("chapter_number") else chapter.get("chapter_title") or "")
+
+
+def sync_textbook(engine, textbook_id: int, parsed_units: list, classify) -> dict:
+    """
+    Re-ingest counterpart of save_textbook: applies a new version of a textbook
+    to its existing rows instead of creating a new textbook.
+
+    `parsed_units` has the same shape as for save_textbook, except that content
+    dicts need no content_type. Units and chapters are matched by number (title
+    when there is none). Within a chapter the old and new blocks are aligned by
+    content hash: unchanged blocks keep their row, edited blocks update the row
+    they replace in place, removed blocks are deactivated (is_active = False) and
+    extra blocks are inserted. Only blocks whose text is not already in the book
+    are passed to `classify`; the others reuse their stored label.
+    Returns counts of what changed.
+    """
+    now = datetime.datetime.now()
+    counts = {"unchanged": 0, "updated": 0, "inserted": 0, "deactivated": 0, "classified": 0}
+
+    # labels first, outside the write transaction: reuse what the book already
+    # has and classify the rest in one call
+    with engine.connect() as conn:
+        known_labels = {
+            row.content_hash or content_hash(row.text_content): stored_label(row.content_type, row.label_source)
+            for row in conn.execute(
+                select(Content.content_hash, Content.text_content, Content.content_type, Content.label_source)
+                .join(Chapter, Content.chapter_id == Chapter.chapter_id)
+                .join(Unit, Chapter.unit_id == Unit.unit_id)
+                .where(Unit.textbook_id == textbook_id, Content.is_active.is_(True))
+            )
+        }
+    unknown = list(dict.fromkeys(
+        content["text_content"]
+        for unit in parsed_units if unit
+        for chapter in unit.get("chapters", []) if chapter
+        for content in chapter.get("contents", [])
+        if not content.get("content_type") and content_hash(content["text_content"]) not in known_labels
+    ))
+    with stage("classify"):
+        labels = dict(zip(unknown, classify(unknown))) if unknown else {}
+    counts["classified"] = len(labels)
+
+    def labelled(content: dict) -> dict:
+        text = content["text_content"]
+        return {**content, "content_type": content.get("content_type") or labels.get(text)
+                or known_labels.get(content_hash(text))}
+
+    with stage("db.diff"), engine.begin() as conn:
+        revision = next_revision(conn)
+        units = {(str(row.unit_number or ""), "" if row.unit_number else row.unit_title or ""): row
+                 for row in conn.execute(select(Unit).where(Unit.textbook_id == textbook_id)).all()}
+        chapters = {}
+        for row in conn.execute(select(Chapter).where(Chapter.unit_id.in_([u.unit_id for u in units.values()] or [-1]))):
+            chapters[(row.unit_id, str(row.chapter_number or ""),
+                      "" if row.chapter_number else row.chapter_title or "")] = row
+        old_rows = {}
+        for row in conn.execute(
+            select(Content.content_id, Content.chapter_id, Content.text_content, Content.content_type,
+                   Content.label_source, Content.content_hash, Content.source_page, Content.activity_description)
+            .where(Content.chapter_id.in_([c.chapter_id for c in chapters.values()] or [-1]),
+                   Content.is_active.is_(True))
+            .order_by(Content.content_id)
+        ):
+            old_rows.setdefault(row.chapter_id, []).append(row)
+
+        # match units and chapters, creating the new ones
+        plan, seen_chapters, renamed_units, renamed_chapters = [], set(), [], []
+        for unit in parsed_units:
+            if not unit:
+                continue
+            old_unit = units.get(_unit_key(unit))
+            if old_unit is None:
+                unit_id = conn.execute(insert(Unit).values(**_unit_row(unit, textbook_id))
+                                       .returning(Unit.unit_id)).scalar_one()
+            else:
+                unit_id = old_unit.unit_id
+                if (old_unit.unit_title or "") != (unit.get("unit_title") or ""):
+                    conn.execute(update(Unit).where(Unit.unit_id == unit_id)
+                                 .values(unit_title=clean_surrogates(unit.get("unit_title", ""))))
+                    renamed_units.append(unit_id)
+            for chapter in unit.get("chapters", []):
+                if not chapter:
+                    continue
+                old_chapter = chapters.get((unit_id, *_chapter_key(chapter)))
+                if old_chapter is None:
+                    chapter_id = conn.execute(insert(Chapter).values(**_chapter_row(chapter, unit_id, now))
+                                              .returning(Chapter.chapter_id)).scalar_one()
+                else:
+                    chapter_id = old_chapter.chapter_id
+                    if (old_chapter.chapter_title or "") != (chapter.get("chapter_title") or ""):
+                        conn.execute(update(Chapter).where(Chapter.chapter_id == chapter_id)
+                                     .values(chapter_title=clean_surrogates(chapter.get("chapter_title", "")),
+                                             updated_at=now))
+                        renamed_chapters.append(chapter_id)
+                if chapter_id in seen_chapters:
+                    # the same chapter number twice: treat the second as a continuation
+                    plan[-1][2].extend(chapter.get("contents", []))
+                    continue
+                seen_chapters.add(chapter_id)
+                plan.append((chapter_id, old_rows.get(chapter_id, []), list(chapter.get("contents", []))))
+
+        # align blocks per chapter
+        updates, inserts, deactivate = [], [], []
+        for chapter_id, old, new in plan:
+            old_hashes = [row.content_hash or content_hash(row.text_content) for row in old]
+            new_hashes = [content_hash(content.get("text_content")) for content in new]
+            matcher = difflib.SequenceMatcher(None, old_hashes, new_hashes, autojunk=False)
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                if tag == "equal":
+                    for row, content in zip(old[i1:i2], new[j1:j2]):
+                        counts["unchanged"] += 1
+                        if (row.source_page, row.activity_description) != (
+                                content.get("source_page"), content.get("activity_description")):
+                            updates.append((row.content_id, {
+                                **content, "content_type": stored_label(row.content_type, row.label_source)}))
+                    continue
+                paired = min(i2 - i1, j2 - j1)
+                for row, content in zip(old[i1:i1 + paired], new[j1:j1 + paired]):
+                    updates.append((row.content_id, content))
+                    counts["updated"] += 1
+                for row in old[i1 + paired:i2]:
+                    deactivate.append(row.content_id)
+                for content in new[j1 + paired:j2]:
+                    inserts.append((chapter_id, content))
+        for chapter_id, rows in old_rows.items():
+            if chapter_id not in seen_chapters:
+                deactivate.extend(row.content_id for row in rows)
+
+        if updates:
+            update_rows = [{"row_id": content_id, **_clean_row({
+                "content_type": content["content_type"],
+                "label_source": label_source(content["content_type"]),
+                "text_content": content["text_content"],
+                "activity_description": content.get("activity_description"),
+                "source_page": content.get("source_page"),
+                "content_hash": content_hash(content["text_content"]),
+                "is_active": True,
+                "revision": revision,
+                "updated_at": now,
+            })} for content_id, content in ((row_id, labelled(c)) for row_id, c in updates)]
+            conn.execute(update(Content).where(Content.content_id == bindparam("row_id")), update_rows)
+        if deactivate:
+            conn.execute(update(Content).where(Content.content_id.in_(deactivate))
+                         .values(is_active=False, revision=revision, updated_at=now))
+        if inserts:
+            insert_rows = [_content_row(labelled(content), chapter_id, now, revision)
+                           for chapter_id, content in inserts]
+            conn.execute(insert(Content), insert_rows)
+        if renamed_units or renamed_chapters:
+            # titles are exported with every row, so the rows under them changed too
+            conn.execute(update(Content).where(Content.chapter_id.in_(
+                select(Chapter.chapter_id).where(Chapter.unit_id.in_(renamed_units)
+                                                 | Chapter.chapter_id.in_(renamed_chapters))
+            )).values(revision=revision, updated_at=now))
+        conn.execute(update(Textbook).where(Textbook.textbook_id == textbook_id).values(updated_at=now))
+
+    counts["inserted"], counts["deactivated"] = len(inserts), len(deactivate)
+    incr("db.rows", counts["updated"] + counts["inserted"] + counts["deactivated"])
+    incr("db.commits")
+    return counts
+
+
+# blocks an illustration most likely belongs to, best first
+MEDIA_CONTENT_TYPES = ("picture_description", "activity", "exercise")
+
+
+def save_media(engine, textbook_id: int, images: list) -> int:
+    """
+    Links images from media_store.extract_media to the textbook's active content
+    by source_page and bulk-inserts them as Media rows, replacing the textbook's
+    earlier media. On its page an image goes to a picture_description, activity
+    or exercise block if there is one, else to the page's first block; images on
+    pages without content go to the nearest earlier page's last block (or the
+    next page's first). Files only the replaced rows used are removed from the
+    media store. Returns rows written.
+    """
+    rows = []
+    with stage("db.media"), engine.begin() as conn:
+        content_ids = (
+            select(Content.content_id)
+            .join(Chapter, Content.chapter_id == Chapter.chapter_id)
+            .join(Unit, Chapter.unit_id == Unit.unit_id)
+            .where(Unit.textbook_id == textbook_id)
+        )
+        replaced = conn.execute(select(Media.image_path).where(Media.content_id.in_(content_ids))).scalars().all()
+        conn.execute(delete(Media).where(Media.content_id.in_(content_ids)))
+        by_page = {}
+        for row in conn.execute(
+            select(Content.content_id, Content.source_page, Content.content_type)
+            .where(Content.content_id.in_(content_ids), Content.is_active.is_(True),
+                   Content.source_page.isnot(None))
+            .order_by(Content.content_id)
+        ):
+            by_page.setdefault(row.source_page, []).append(row)
+        pages = sorted(by_page)
+
+        def content_for(page: int) -> int:
+            rows = by_page.get(page)
+            if rows:
+                preferred = [row for row in rows if row.content_type in MEDIA_CONTENT_TYPES]
+                return (preferred or rows)[0].content_id
+            i = bisect.bisect_left(pages, page)
+            return by_page[pages[i - 1]][-1].content_id if i else by_page[pages[0]][0].content_id
+
+        seen = set()
+        for image in images if by_page else []:
+            if (image["source_page"], image["file_hash"]) in seen:
+                continue
+            seen.add((image["source_page"], image["file_hash"]))
+            rows.append({
+                "content_id": content_for(image["source_page"]),
+                "media_type": "image",
+                "image_path": image["image_path"],
+                "source_page": image["source_page"],
+                "file_hash": image["file_hash"],
+                "width": image.get("width"),
+                "height": image.get("height"),
+            })
+        if rows:
+            conn.execute(insert(Media), rows)
+    _collect_media(engine, replaced)
+    incr("db.media_rows", len(rows))
+    incr("db.commits")
+    return len(rows)
@@ -0,0 +1,224 @@
+"""
+Schema changes that Base.metadata.create_all cannot apply to an existing
+database (indexes, new columns). Each migration runs once and is recorded in
+the schema_migrations table; init_db applies whatever is pending.
+
+Migrations must also be safe on a fresh database that create_all has just
+built from the current models, hence IF NOT EXISTS / column checks.
+"""
+import datetime
+
+from sqlalchemy import inspect, text
+
+
+def create_index(conn, name: str, table: str, columns: str):
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+
+
+def add_column(conn, table: str, column: str, ddl: str):
+    if column not in {c["name"] for c in inspect(conn).get_columns(table)}:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def m001_hierarchy_indexes(conn):
+    """
+    Foreign keys of the textbook tree plus the two common lookups:
+    content of one type within a chapter, and textbooks by grade/subject.
+    """
+    create_index(conn, "ix_units_textbook_id", "units", "textbook_id")
+    create_index(conn, "ix_chapters_unit_id", "chapters", "unit_id")
+    create_index(conn, "ix_content_chapter_type", "content", "chapter_id, content_type")
+    create_index(conn, "ix_translations_content_id", "translations", "content_id")
+    create_index(conn, "ix_media_content_id", "media", "content_id")
+    create_index(conn, "ix_textbooks_grade_subject", "textbooks", "grade, subject")
+    create_index(conn, "ix_ingest_jobs_textbook_id", "ingest_jobs", "textbook_id")
+
+
+def facet_sql(**columns) -> str:
+    """
+    SQL for the facet tokens of one row: a token per non-empty combination of the
+    given columns, e.g. content_type, content_type+grade, ... Values are hex-encoded
+    so any value becomes a single alphanumeric token; the trailing 0 keeps the
+    porter stemmer away from them (see db.search.facet_token).
+    """
+    names = list(columns)
+    tokens = []
+    for mask in range(1, 2 ** len(names)):
+        chosen = [name for i, name in enumerate(names) if mask >> i & 1]
+        key = "".join(name[0] for name in chosen)
+        values = " || 'x' || ".join(f"hex(coalesce({columns[name]}, ''))" for name in chosen)
+        tokens.append(f"'x{key}' || {values} || '0'")
+    return " || ' ' || ".join(tokens)
+
+
+FTS_COLUMNS = "rowid, text_content, activity_description, chapter_title, facets"
+
+FTS_ROW = f"""
+    SELECT c.content_id, c.text_content, c.activity_description, ch.chapter_title,
+           {facet_sql(type="c.content_type", grade="t.grade", subject="t.subject")}
+    FROM content c
+    JOIN chapters ch ON ch.chapter_id = c.chapter_id
+    JOIN units u ON u.unit_id = ch.unit_id
+    JOIN textbooks t ON t.textbook_id = u.textbook_id
+"""
+
+
+def m002_content_fts(conn):
+    """
+    content_fts: FTS5 index over active content (rowid = content_id) with the
+    chapter title denormalized in, plus a `facets` column of content_type/grade/
+    subject filter tokens. Triggers keep it in sync with content, chapters and
+    textbooks, so every write path (ORM, bulk insert, streaming writer) is covered.
+    FTS5 is SQLite-only; on other backends db.search is unavailable.
+    """
+    if conn.dialect.name != "sqlite":
+        return
+    conn.execute(text("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS content_fts USING fts5(
+            text_content, activity_description, chapter_title, facets,
+            tokenize = 'porter unicode61 remove_diacritics 2'
+        )
+    """))
+    # BM25 weights per column; facets only filter and never affect ranking
+    conn.execute(text("INSERT INTO content_fts (content_fts, rank) VALUES ('rank', 'bm25(1.0, 0.5, 2.0, 0.0)')"))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS content_fts_insert AFTER INSERT ON content WHEN new.is_active BEGIN
+            INSERT INTO content_fts ({FTS_COLUMNS}) {FTS_ROW} WHERE c.content_id = new.content_id;
+        END
+    """))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS content_fts_update AFTER UPDATE ON content BEGIN
+            DELETE FROM content_fts WHERE rowid = old.content_id;
+            INSERT INTO content_fts ({FTS_COLUMNS}) {FTS_ROW} WHERE c.content_id = new.content_id AND new.is_active;
+        END
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS content_fts_delete AFTER DELETE ON content BEGIN
+            DELETE FROM content_fts WHERE rowid = old.content_id;
+        END
+    """))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS content_fts_chapter AFTER UPDATE OF chapter_title ON chapters BEGIN
+            DELETE FROM content_fts WHERE rowid IN (SELECT content_id FROM content WHERE chapter_id = new.chapter_id);
+            INSERT INTO content_fts ({FTS_COLUMNS}) {FTS_ROW} WHERE ch.chapter_id = new.chapter_id AND c.is_active;
+        END
+    """))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS content_fts_textbook AFTER UPDATE OF grade, subject ON textbooks BEGIN
+            DELETE FROM content_fts WHERE rowid IN (
+                SELECT c.content_id FROM content c
+                JOIN chapters ch ON ch.chapter_id = c.chapter_id
+                JOIN units u ON u.unit_id = ch.unit_id
+                WHERE u.textbook_id = new.textbook_id
+            );
+            INSERT INTO content_fts ({FTS_COLUMNS}) {FTS_ROW} WHERE t.textbook_id = new.textbook_id AND c.is_active;
+        END
+    """))
+    conn.execute(text(f"INSERT INTO content_fts ({FTS_COLUMNS}) {FTS_ROW} WHERE c.is_active"))
+    conn.execute(text("INSERT INTO content_fts (content_fts) VALUES ('optimize')"))
+
+
+def m003_content_hashes(conn):
+    """
+    Content.content_hash for diffing re-ingests, and the page_hashes lookup.
+    Existing rows keep a NULL hash; the diff hashes their text when it needs to.
+    """
+    add_column(conn, "content", "content_hash", "VARCHAR")
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_page_hashes_textbook_page ON page_hashes (textbook_id, page_number)"
+    ))
+
+
+def m004_content_updated_at(conn):
+    """
+    Incremental exports select content by updated_at (see db.export).
+    """
+    create_index(conn, "ix_content_updated_at", "content", "updated_at")
+
+
+def m005_near_duplicates(conn):
+    """
+    Content.duplicate_of, content lookups by hash, and the near-duplicate index
+    (db.near_duplicates) built for the content already stored.
+    """
+    from db.near_duplicates import backfill_index
+
+    add_column(conn, "content", "duplicate_of", "INTEGER REFERENCES content (content_id)")
+    create_index(conn, "ix_content_content_hash", "content", "content_hash")
+    create_index(conn, "ix_content_duplicate_of", "content", "duplicate_of")
+    backfill_index(conn)
+
+
+def m006_media_files(conn):
+    """
+    Media rows for images in the content-addressed store (see media_store).
+    """
+    add_column(conn, "media", "source_page", "INTEGER")
+    add_column(conn, "media", "file_hash", "VARCHAR")
+    add_column(conn, "media", "width", "INTEGER")
+    add_column(conn, "media", "height", "INTEGER")
+    create_index(conn, "ix_media_file_hash", "media", "file_hash")
+
+
+def m007_label_source(conn):
+    """
+    Content.label_source, so the local classifier trains on LLM and manual labels
+    only. Existing rows keep NULL and are treated as LLM labels.
+    """
+    add_column(conn, "content", "label_source", "VARCHAR")
+
+
+def m008_content_revisions(conn):
+    """
+    Content.revision and its counter, the watermark of incremental exports.
+    Existing rows get revision 0, so the next incremental export after this one
+    only has to look at rows written since.
+    """
+    add_column(conn, "content", "revision", "INTEGER")
+    create_index(conn, "ix_content_revision", "content", "revision")
+    conn.execute(text("CREATE TABLE IF NOT EXISTS change_counters (name VARCHAR PRIMARY KEY, value INTEGER)"))
+    conn.execute(text("UPDATE content SET revision = 0 WHERE revision IS NULL"))
+    if conn.execute(text("SELECT 1 FROM change_counters WHERE name = 'content'")).first() is None:
+        conn.execute(text("INSERT INTO change_counters (name, value) VALUES ('content', 0)"))
+
+
+MIGRATIONS = [
+    ("001", m001_hierarchy_indexes),
+    ("002", m002_content_fts),
+    ("003", m003_content_hashes),
+    ("004", m004_content_updated_at),
+    ("005", m005_near_duplicates),
+    ("006", m006_media_files),
+    ("007", m007_label_source),
+    ("008", m008_content_revisions),
+]
+
+
+def applied_migrations(conn) -> set:
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations (version VARCHAR PRIMARY KEY, name VARCHAR, applied_at TIMESTAMP)"
+    ))
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def run_migrations(engine) -> list:
+    """
+    Applies pending migrations in order, each in its own transaction.
+    Returns the versions that were applied.
+    """
+    with engine.begin() as conn:
+        done = applied_migrations(conn)
+
+    applied = []
+    for version, migration in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            migration(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                {"v": version, "n": migration.__name__, "t": datetime.datetime.now()}
+            )
+        print(f"🟢 Applied migration {version} ({migration.__name__})")
+        applied.append(version)
+    return applied
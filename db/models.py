@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Boolean, ForeignKey, DateTime, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
 Base = declarative_base()
@@ -17,6 +18,8 @@ class Textbook(Base):
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
+    units = relationship("Unit", back_populates="textbook", order_by="Unit.unit_id")
+
 class Unit(Base):
     __tablename__ = "units"
     unit_id = Column(Integer, primary_key=True)
@@ -25,11 +28,15 @@ class Unit(Base):
     unit_title = Column(String)
     unit_description = Column(Text)
 
+    textbook = relationship("Textbook", back_populates="units")
+    chapters = relationship("Chapter", back_populates="unit", order_by="Chapter.chapter_id")
+
 class Content(Base):
     __tablename__ = "content"
     content_id = Column(Integer, primary_key=True)
     chapter_id = Column(Integer, ForeignKey("chapters.chapter_id"))
     content_type = Column(String)
+    label_source = Column(String)  # who wrote content_type: llm, manual, rule, model or near_duplicate (see Label)
     text_content = Column(Text)
     question = Column(Text)
     answer = Column(Text)
@@ -39,10 +46,41 @@ class Content(Base):
     learning_objective = Column(String)
     keywords = Column(String)
     source_page = Column(Integer)
+    content_hash = Column(String)  # db.ingest.content_hash(text_content), used to diff re-ingests
+    duplicate_of = Column(Integer, ForeignKey("content.content_id"))  # near-duplicate it took its labels from
     is_active = Column(Boolean, default=True)
+    revision = Column(Integer)  # change number of the transaction that last wrote the row (db.ingest.next_revision)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
+    chapter = relationship("Chapter", back_populates="contents")
+    translations = relationship("Translation", back_populates="content", order_by="Translation.translation_id")
+    media = relationship("Media", back_populates="content", order_by="Media.media_id")
+
+class Label(str):
+    """
+    A content_type written by something other than the LLM; `source` ("rule",
+    "model", "near_duplicate", "manual") goes to Content.label_source. Plain
+    strings count as LLM labels. Only LLM and manual labels train the local
+    classifier, so it never learns from its own output. `columns` are other
+    Content values that come with the label (a near-duplicate's duplicate_of).
+    """
+
+    def __new__(cls, value: str, source: str, **columns):
+        label = super().__new__(cls, value)
+        label.source = source
+        label.columns = columns
+        return label
+
+def label_source(label):
+    return getattr(label, "source", "llm") if label is not None else None
+
+def stored_label(content_type, source):
+    """
+    A stored content_type as a label that keeps its label_source when written again.
+    """
+    return Label(content_type, source) if content_type is not None and source not in (None, "llm") else content_type
+
 class Translation(Base):
     __tablename__ = "translations"
     translation_id = Column(Integer, primary_key=True)
@@ -50,6 +88,8 @@ class Translation(Base):
     english_translation = Column(Text)
     transliteration = Column(Text)
 
+    content = relationship("Content", back_populates="translations")
+
 class Media(Base):
     __tablename__ = "media"
     media_id = Column(Integer, primary_key=True)
@@ -59,6 +99,12 @@ class Media(Base):
     audio_path = Column(String)
     media_description = Column(Text)
     duration = Column(String)
+    source_page = Column(Integer)
+    file_hash = Column(String)  # sha256 of the file, which is also its name in the media store
+    width = Column(Integer)
+    height = Column(Integer)
+
+    content = relationship("Content", back_populates="media")
 
 class Chapter(Base):
     __tablename__ = "chapters"
@@ -70,3 +116,69 @@ class Chapter(Base):
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
+    unit = relationship("Unit", back_populates="chapters")
+    contents = relationship("Content", back_populates="chapter", order_by="Content.content_id")
+
+
+class PageHash(Base):
+    """
+    One row per PDF page of an ingested textbook: the hash of its extracted text
+    and its share of the filtered markdown, so a re-ingest only re-filters pages
+    that changed. filtered_text is None when the filter output for this page is
+    part of the previous page's text (its page marker was not kept).
+    """
+    __tablename__ = "page_hashes"
+    page_hash_id = Column(Integer, primary_key=True)
+    textbook_id = Column(Integer, ForeignKey("textbooks.textbook_id"))
+    page_number = Column(Integer)
+    text_hash = Column(String)
+    prompt_hash = Column(String)
+    filtered_text = Column(Text)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
+class ContentSignature(Base):
+    """
+    MinHash signature of one distinct content text (db.near_duplicates).
+    """
+    __tablename__ = "content_signatures"
+    content_hash = Column(String, primary_key=True)
+    signature = Column(LargeBinary)
+
+
+class ContentBucket(Base):
+    """
+    LSH bucket membership: one row per band of each signature. The primary key
+    doubles as the bucket lookup index.
+    """
+    __tablename__ = "content_buckets"
+    bucket = Column(BigInteger, primary_key=True, autoincrement=False)
+    content_hash = Column(String, primary_key=True)
+
+
+class IngestJob(Base):
+    __tablename__ = "ingest_jobs"
+    job_id = Column(Integer, primary_key=True)
+    source_path = Column(String, unique=True)
+    file_hash = Column(String)
+    status = Column(String, default="pending")  # pending, running, done, failed
+    textbook_id = Column(Integer, ForeignKey("textbooks.textbook_id"))
+    pages = Column(Integer)
+    rows = Column(Integer)
+    attempts = Column(Integer, default=0)
+    error = Column(Text)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
+class ChangeCounter(Base):
+    """
+    Named counters that only go up. "content" numbers the transactions that
+    write content rows, for incremental exports (see db.export).
+    """
+    __tablename__ = "change_counters"
+    name = Column(String, primary_key=True)
+    value = Column(Integer, default=0)
@@ -0,0 +1,294 @@
+"""
+Near-duplicate index over Content.text_content (MinHash + LSH).
+
+Books in a series repeat the same rhymes, teacher notes and exercise templates
+with small OCR differences, which exact-text caching misses. Every indexed text
+gets a MinHash signature of its character shingles (content_signatures); its
+bands are hashed into content_buckets, keyed by bucket, so a lookup reads a
+handful of index entries however many blocks are stored. Candidates sharing a
+bucket are verified against NEAR_DUP_THRESHOLD on the estimated Jaccard
+similarity.
+
+Signatures are keyed by content_hash, so a text shared by many rows is indexed
+once, before or after its rows are written; a match resolves to the oldest
+active row with that hash. near_duplicate_classifier puts the index in front of
+the LLM at ingest time: it looks texts up, indexes them in a short transaction
+of its own, and hands back labels that carry the match's duplicate_of and
+REUSED_COLUMNS, which the writers in db.ingest copy into the new rows
+(inherited_columns). The writers' bulk-insert transactions never touch the
+index; rows saved without the classifier are indexed by backfill_index.
+
+    NEAR_DUPLICATES=0       # no lookups (classified texts are still indexed)
+    NEAR_DUP_THRESHOLD=0.8  # estimated Jaccard similarity needed to reuse a label
+"""
+import os
+import re
+import zlib
+import struct
+import hashlib
+import threading
+from functools import lru_cache
+
+from sqlalchemy import insert, select, update, bindparam
+
+from db.models import Content, ContentSignature, ContentBucket, Label
+from instrumentation import incr
+
+NEAR_DUPLICATES = os.getenv("NEAR_DUPLICATES", "1").lower() not in ("0", "false", "no")
+NEAR_DUP_LINK = os.getenv("NEAR_DUP_LINK", "1").lower() not in ("0", "false", "no")
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.8"))
+NEAR_DUP_MIN_CHARS = int(os.getenv("NEAR_DUP_MIN_CHARS", "60"))  # shorter blocks are too ambiguous to reuse
+
+SHINGLE_SIZE = 5
+NUM_BINS = 128  # index = top 7 bits of the shingle hash
+BANDS, ROWS = 16, 8  # candidate pairs from about 0.7 similarity up
+SQL_CHUNK = 500  # bound parameters per IN (...) query
+
+# Columns a near-duplicate inherits when its own value is missing.
+REUSED_COLUMNS = ["content_type", "question", "answer", "bloom_level", "difficulty_level",
+                  "learning_objective", "keywords"]
+INHERITED_COLUMNS = ["duplicate_of"] + [column for column in REUSED_COLUMNS if column != "content_type"]
+
+_MASK = (1 << 32) - 1
+_MASK64 = (1 << 64) - 1
+_GOLDEN = 0x9E3779B97F4A7C15
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", (text or "").lower()).strip()
+
+
+@lru_cache(maxsize=8192)
+def signature(text: str):
+    """
+    MinHash signature of the text's character shingles as a tuple of NUM_BINS
+    32-bit ints, or None for text shorter than NEAR_DUP_MIN_CHARS.
+
+    One-permutation hashing: each shingle is hashed once and kept as the minimum
+    of the bin its hash falls in; empty bins borrow from the next filled bin
+    (rotation densification), so a signature costs one hash per shingle.
+    """
+    normalized = normalize(text)
+    if len(normalized) < NEAR_DUP_MIN_CHARS:
+        return None
+    encoded = normalized.encode("utf-8")
+    bins = [None] * NUM_BINS
+    for shingle in {encoded[i:i + SHINGLE_SIZE] for i in range(len(encoded) - SHINGLE_SIZE + 1)}:
+        # crc32 is stable across processes (unlike hash()) and cheap; the
+        # multiply spreads it over the bin (top bits) and value (middle bits)
+        mixed = zlib.crc32(shingle) * _GOLDEN & _MASK64
+        index, value = mixed >> 57, (mixed >> 25) & _MASK
+        if bins[index] is None or value < bins[index]:
+            bins[index] = value
+    dense = []
+    for i in range(NUM_BINS):
+        distance = 0
+        while bins[(i + distance) % NUM_BINS] is None:
+            distance += 1
+        dense.append((bins[(i + distance) % NUM_BINS] + distance * 0x9E3779B1) & _MASK)
+    return tuple(dense)
+
+
+def similarity(a, b) -> float:
+    """
+    Estimated Jaccard similarity of two signatures.
+    """
+    return sum(x == y for x, y in zip(a, b)) / NUM_BINS
+
+
+@lru_cache(maxsize=8192)
+def bucket_keys(sig) -> tuple:
+    """
+    One signed 64-bit key per LSH band (the band number is part of the key).
+    """
+    keys = []
+    for band in range(BANDS):
+        packed = struct.pack(f"<{ROWS + 1}I", band, *sig[band * ROWS:(band + 1) * ROWS])
+        keys.append(int.from_bytes(hashlib.blake2b(packed, digest_size=8).digest(), "little", signed=True))
+    return tuple(keys)
+
+
+def pack(sig) -> bytes:
+    return struct.pack(f"<{NUM_BINS}I", *sig)
+
+
+def unpack(data: bytes) -> tuple:
+    return struct.unpack(f"<{NUM_BINS}I", data)
+
+
+def _chunks(items: list, size: int = SQL_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def index_contents(conn, rows: list) -> int:
+    """
+    Adds Content row dicts (content_hash, text_content) to the index, inside the
+    caller's transaction. Hashes that are already indexed are skipped before
+    their signature is computed. Returns the number of texts added.
+    """
+    texts = {}
+    for row in rows:
+        if row.get("content_hash"):
+            texts.setdefault(row["content_hash"], row.get("text_content") or "")
+    for chunk in _chunks(list(texts)):
+        for (content_hash,) in conn.execute(select(ContentSignature.content_hash)
+                                            .where(ContentSignature.content_hash.in_(chunk))):
+            texts.pop(content_hash, None)
+    pending = {content_hash: signature(text) for content_hash, text in texts.items()}
+    pending = {content_hash: sig for content_hash, sig in pending.items() if sig is not None}
+    if not pending:
+        return 0
+    conn.execute(insert(ContentSignature), [{"content_hash": content_hash, "signature": pack(sig)}
+                                            for content_hash, sig in pending.items()])
+    conn.execute(insert(ContentBucket), [{"bucket": key, "content_hash": content_hash}
+                                         for content_hash, sig in pending.items() for key in set(bucket_keys(sig))])
+    incr("near_duplicates.indexed", len(pending))
+    return len(pending)
+
+
+def find_near_duplicates(conn, texts: list, threshold: float = NEAR_DUP_THRESHOLD) -> list:
+    """
+    For each text, the closest indexed active content row with an estimated
+    similarity of at least `threshold`, or None. A match is a dict of
+    content_id (the row a linked duplicate points back to), similarity and
+    REUSED_COLUMNS.
+    """
+    signatures = [signature(text or "") for text in texts]
+    wanted = {}
+    for i, sig in enumerate(signatures):
+        if sig is not None:
+            for key in bucket_keys(sig):
+                wanted.setdefault(key, []).append(i)
+    if not wanted:
+        return [None] * len(texts)
+
+    candidates = {}
+    for chunk in _chunks(list(wanted)):
+        for bucket, content_hash in conn.execute(select(ContentBucket.bucket, ContentBucket.content_hash)
+                                                 .where(ContentBucket.bucket.in_(chunk))):
+            for i in wanted[bucket]:
+                candidates.setdefault(i, set()).add(content_hash)
+    stored = {}
+    hashes = list(set().union(*candidates.values())) if candidates else []
+    for chunk in _chunks(hashes):
+        for content_hash, data in conn.execute(select(ContentSignature.content_hash, ContentSignature.signature)
+                                               .where(ContentSignature.content_hash.in_(chunk))):
+            stored[content_hash] = unpack(data)
+
+    ranked = {}
+    for i, found in candidates.items():
+        scored = [(similarity(signatures[i], stored[h]), h) for h in found if h in stored]
+        ranked[i] = sorted((pair for pair in scored if pair[0] >= threshold), reverse=True)
+    rows = {}
+    for chunk in _chunks(list({h for pairs in ranked.values() for _, h in pairs})):
+        for row in conn.execute(
+            select(Content.content_id, Content.content_hash, Content.duplicate_of,
+                   *[getattr(Content, column) for column in REUSED_COLUMNS])
+            .where(Content.content_hash.in_(chunk), Content.is_active.is_(True), Content.content_type.isnot(None))
+            .order_by(Content.content_id)
+        ):
+            rows.setdefault(row.content_hash, row)
+
+    # a hash whose rows were all edited or deactivated falls through to the next candidate
+    matches = [None] * len(texts)
+    for i, pairs in ranked.items():
+        for score, content_hash in pairs:
+            row = rows.get(content_hash)
+            if row is not None:
+                matches[i] = {"content_id": row.duplicate_of or row.content_id, "similarity": score,
+                              **{column: getattr(row, column) for column in REUSED_COLUMNS}}
+                break
+    return matches
+
+
+_index_lock = threading.Lock()
+
+
+def index_texts(engine, texts: list) -> int:
+    """
+    Adds texts to the index in a transaction of their own. Classify workers of
+    the same process take turns, so two of them never insert the same hash.
+    Returns the number of texts added.
+    """
+    from db.ingest import content_hash
+
+    rows = [{"content_hash": content_hash(text), "text_content": text} for text in texts if text]
+    if not rows:
+        return 0
+    with _index_lock, engine.begin() as conn:
+        return index_contents(conn, rows)
+
+
+def near_duplicate_label(match: dict):
+    """
+    The content_type of a find_near_duplicates match as a Label carrying the
+    match's other REUSED_COLUMNS and, with NEAR_DUP_LINK, duplicate_of.
+    """
+    columns = {column: match[column] for column in INHERITED_COLUMNS if column != "duplicate_of"}
+    columns["duplicate_of"] = match["content_id"] if NEAR_DUP_LINK else None
+    return Label(match["content_type"], "near_duplicate", **columns)
+
+
+def inherited_columns(label) -> dict:
+    """
+    INHERITED_COLUMNS for a Content row dict about to be inserted with `label`
+    as its content_type. Every row gets all of them, as a bulk insert needs
+    uniform rows; a row's own values go on top.
+    """
+    columns = dict.fromkeys(INHERITED_COLUMNS)
+    columns.update(getattr(label, "columns", {}))
+    return columns
+
+
+def near_duplicate_classifier(engine, classify):
+    """
+    Wraps a classify callable (list of texts -> labels): texts with a labelled
+    near-duplicate in the index take its content_type (near_duplicate_label),
+    only the rest reach `classify`. All the texts are indexed afterwards, so
+    the next batch or book finds them. With NEAR_DUPLICATES off, texts are
+    indexed but not looked up.
+    """
+
+    def classify_with_index(texts: list) -> list:
+        matches = [None] * len(texts)
+        if NEAR_DUPLICATES:
+            with engine.connect() as conn:
+                matches = find_near_duplicates(conn, texts)
+        labels = [near_duplicate_label(match) if match else None for match in matches]
+        rest = [i for i, label in enumerate(labels) if label is None]
+        if rest:
+            for i, label in zip(rest, classify([texts[i] for i in rest])):
+                labels[i] = label
+        incr("classify.near_duplicate", len(texts) - len(rest))
+        index_texts(engine, texts)
+        return labels
+
+    return classify_with_index
+
+
+def backfill_index(conn, batch_size: int = 5000) -> int:
+    """
+    Indexes every stored content row, hashing rows saved before content_hash
+    existed. Safe to run again. Returns the number of texts added.
+    """
+    from db.ingest import content_hash
+
+    added, last_id = 0, 0
+    while True:
+        rows = conn.execute(
+            select(Content.content_id, Content.text_content, Content.content_hash)
+            .where(Content.content_id > last_id).order_by(Content.content_id).limit(batch_size)
+        ).all()
+        if not rows:
+            return added
+        last_id = rows[-1].content_id
+        missing = [{"row_id": row.content_id, "hash": content_hash(row.text_content)}
+                   for row in rows if not row.content_hash]
+        if missing:
+            conn.execute(update(Content).where(Content.content_id == bindparam("row_id"))
+                         .values(content_hash=bindparam("hash")), missing)
+        hashes = {row.content_id: row.content_hash for row in rows}
+        hashes.update({row["row_id"]: row["hash"] for row in missing})
+        added += index_contents(conn, [{"content_hash": hashes[row.content_id], "text_content": row.text_content}
+                                       for row in rows])
@@ -0,0 +1,87 @@
+"""
+Read API for the textbook hierarchy.
+
+load_textbook_tree uses selectinload, so a whole book costs a fixed number of
+queries (one per level) however many units, chapters and content rows it has.
+"""
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from db.models import Textbook, Unit, Chapter, Content
+
+
+def load_textbook_tree(session, textbook_id: int, with_media: bool = False):
+    """
+    Returns the Textbook with units -> chapters -> contents loaded, or None.
+    Four queries, plus two for translations and media when `with_media` is set.
+    """
+    contents = selectinload(Textbook.units).selectinload(Unit.chapters).selectinload(Chapter.contents)
+    options = [contents]
+    if with_media:
+        options += [contents.selectinload(Content.translations), contents.selectinload(Content.media)]
+    return session.execute(
+        select(Textbook).where(Textbook.textbook_id == textbook_id).options(*options)
+    ).scalar_one_or_none()
+
+
+def textbook_tree_dict(textbook) -> dict:
+    """
+    Plain-dict view of a loaded tree, in the shape parse_markdown_to_units uses.
+    """
+    return {
+        "textbook_id": textbook.textbook_id,
+        "title": textbook.title,
+        "subject": textbook.subject,
+        "grade": textbook.grade,
+        "units": [{
+            "unit_number": unit.unit_number,
+            "unit_title": unit.unit_title,
+            "chapters": [{
+                "chapter_number": chapter.chapter_number,
+                "chapter_title": chapter.chapter_title,
+                "contents": [{
+                    "content_id": content.content_id,
+                    "content_type": content.content_type,
+                    "text_content": content.text_content,
+                    "activity_description": content.activity_description,
+                    "source_page": content.source_page,
+                } for content in chapter.contents if content.is_active],
+            } for chapter in unit.chapters],
+        } for unit in textbook.units],
+    }
+
+
+def find_textbooks(session, grade: str = None, subject: str = None) -> list:
+    query = select(Textbook)
+    if grade is not None:
+        query = query.where(Textbook.grade == grade)
+    if subject is not None:
+        query = query.where(Textbook.subject == subject)
+    return session.execute(query.order_by(Textbook.textbook_id)).scalars().all()
+
+
+def find_content(session, content_type: str = None, grade: str = None, subject: str = None,
+                 textbook_id: int = None, limit: int = None) -> list:
+    """
+    Active content rows filtered by type and/or the owning textbook's grade/subject.
+    Served by ix_textbooks_grade_subject and ix_content_chapter_type.
+    """
+    query = (
+        select(Content)
+        .join(Chapter, Content.chapter_id == Chapter.chapter_id)
+        .join(Unit, Chapter.unit_id == Unit.unit_id)
+        .join(Textbook, Unit.textbook_id == Textbook.textbook_id)
+        .where(Content.is_active.is_(True))
+    )
+    if content_type is not None:
+        query = query.where(Content.content_type == content_type)
+    if grade is not None:
+        query = query.where(Textbook.grade == grade)
+    if subject is not None:
+        query = query.where(Textbook.subject == subject)
+    if textbook_id is not None:
+        query = query.where(Textbook.textbook_id == textbook_id)
+    query = query.order_by(Content.content_id)
+    if limit is not None:
+        query = query.limit(limit)
+    return session.execute(query).scalars().all()
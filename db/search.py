@@ -0,0 +1,127 @@
+"""
+Full-text search over content via the content_fts FTS5 table (see db.migrations).
+
+    search_content(session, "hands clap", content_type="rhyme", grade="1")
+"""
+import os
+import re
+
+from sqlalchemy import text, bindparam
+
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", 2000))
+
+TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_phrase(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+def facet_token(content_type: str = None, grade: str = None, subject: str = None) -> str:
+    """
+    Python side of db.migrations.facet_sql: the single index token for the given
+    combination of filters, or "" when no filter is set.
+    """
+    chosen = [(key, value) for key, value in (("t", content_type), ("g", grade), ("s", subject)) if value]
+    if not chosen:
+        return ""
+    values = "x".join(str(value).encode("utf-8").hex() for _, value in chosen)
+    return "x" + "".join(key for key, _ in chosen) + values + "0"
+
+
+def build_match(query: str, content_type: str = None, grade: str = None, subject: str = None,
+                prefix: bool = False) -> str:
+    """
+    Turns free text into an FTS5 MATCH expression: every word must appear in the
+    text, heading or chapter title (the last one as a prefix if `prefix`), and the
+    filters become one facet token, so any combination of them is a single short
+    posting list instead of a join or an intersection of long ones.
+    """
+    words = TOKEN.findall(query or "")
+    terms = [fts_phrase(word) for word in words]
+    if terms and prefix:
+        terms[-1] += "*"
+    clauses = []
+    if terms:
+        clauses.append("{text_content activity_description chapter_title}: (" + " AND ".join(terms) + ")")
+    facets = facet_token(content_type, grade, subject)
+    if facets:
+        clauses.append(f"facets: {facets}")
+    return " AND ".join(clauses)
+
+
+def search_content(session, query: str, content_type: str = None, grade: str = None, subject: str = None,
+                   limit: int = 20, offset: int = 0, prefix: bool = False,
+                   max_candidates: int = SEARCH_MAX_CANDIDATES) -> list:
+    """
+    Matches as dicts with a highlighted snippet and the owning chapter/textbook.
+    Returns [] when there is nothing to match on.
+
+    Queries with up to `max_candidates` matches are ranked by BM25 (best first).
+    Broader ones (near-stopword searches on a large library) are returned newest
+    first with score None: FTS5's bm25() scans every posting of every query term,
+    which is what makes those queries slow, and their idf is close to zero anyway.
+    A selective term combined with a near-stopword still pays for that scan.
+    """
+    match = build_match(query, content_type, grade, subject, prefix)
+    if not match:
+        return []
+    params = {"match": match, "candidates": max_candidates, "limit": limit, "offset": offset}
+    candidates = session.execute(text(
+        "SELECT count(*) FROM (SELECT 1 FROM content_fts WHERE content_fts MATCH :match LIMIT :candidates + 1)"
+    ), params).scalar_one()
+    if candidates > max_candidates:
+        ranked = session.execute(text("""
+            SELECT rowid, NULL FROM content_fts
+            WHERE content_fts MATCH :match
+            ORDER BY rowid DESC
+            LIMIT :limit OFFSET :offset
+        """), params).all()
+    else:
+        ranked = session.execute(text("""
+            SELECT rowid, rank FROM content_fts
+            WHERE content_fts MATCH :match
+            ORDER BY rank
+            LIMIT :limit OFFSET :offset
+        """), params).all()
+    if not ranked:
+        return []
+
+    # snippets and joins only for the page of hits
+    details = session.execute(text("""
+        SELECT f.rowid AS content_id, snippet(content_fts, 0, '**', '**', ' … ', 16) AS snippet,
+               c.content_type, c.text_content, c.activity_description, c.source_page, ch.chapter_title,
+               t.textbook_id, t.title, t.grade, t.subject
+        FROM content_fts f
+        JOIN content c ON c.content_id = f.rowid
+        JOIN chapters ch ON ch.chapter_id = c.chapter_id
+        JOIN units u ON u.unit_id = ch.unit_id
+        JOIN textbooks t ON t.textbook_id = u.textbook_id
+        WHERE content_fts MATCH :match AND f.rowid IN :ids
+    """).bindparams(bindparam("ids", expanding=True)),
+        {"match": match, "ids": [content_id for content_id, _ in ranked]}).mappings().all()
+    by_id = {row["content_id"]: dict(row) for row in details}
+    return [{**by_id[content_id], "score": score} for content_id, score in ranked if content_id in by_id]
+
+
+def count_matches(session, query: str, content_type: str = None, grade: str = None, subject: str = None,
+                  prefix: bool = False, cap: int = 1000) -> int:
+    """
+    Number of matches, counting at most `cap` + 1 so the UI can show "1000+".
+    """
+    match = build_match(query, content_type, grade, subject, prefix)
+    if not match:
+        return 0
+    return session.execute(
+        text("SELECT count(*) FROM (SELECT 1 FROM content_fts WHERE content_fts MATCH :match LIMIT :cap)"),
+        {"match": match, "cap": cap + 1}
+    ).scalar_one()
+
+
+def optimize_search_index(engine):
+    """
+    Merges the FTS index segments left behind by many small inserts.
+    Worth running after a large batch ingest.
+    """
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO content_fts (content_fts) VALUES ('optimize')"))
@@ -0,0 +1,246 @@
+"""
+Bulk export of the textbook corpus for downstream training pipelines.
+
+    python -m export exports/                                    # exports/part-<timestamp>.jsonl
+    python -m export exports/ --format parquet --partition-by grade,subject
+    python -m export exports/ --grade 1 --subject English --content-type poem
+    python -m export exports/ --format parquet --partition-by grade,subject --incremental
+
+One row per content block, with its chapter, unit and textbook columns (see
+db.export.EXPORT_FIELDS). Rows are streamed from the database in batches and
+written as they arrive, so memory does not grow with the corpus. Partitioned
+output goes to hive-style directories (grade=1/subject=English/part-....parquet).
+At most EXPORT_MAX_OPEN_PARTS partitions have an open file (and, for Parquet, a
+buffer of up to --batch-size rows) at a time; a partition that comes back after
+its file was closed gets a new part file.
+
+--incremental only exports content written since the last export into the same
+directory, including deactivated rows, so consumers can drop them. Every write
+transaction stamps its rows with a revision that commits in order
+(db.ingest.next_revision), and _export_state.json records the revision the last
+run read up to. A row can come out of two runs; keep the one with the highest
+revision per content_id. Renamed units and chapters are re-exported with their
+rows; textbook fields edited by hand in the database, and deleted textbooks,
+only show up in a full export. --since takes an explicit ISO timestamp
+(updated_at) instead. Each run writes new part files, so earlier exports are
+never overwritten.
+Parquet needs pyarrow (`pip install pyarrow`).
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import datetime
+from collections import OrderedDict, Counter
+
+from db.export import iter_export_batches, current_revision, field_kinds, EXPORT_FIELDS, EXPORT_BATCH_SIZE
+
+EXPORT_FORMATS = ("jsonl", "parquet")
+EXPORT_STATE_FILE = "_export_state.json"  # "_" prefix: skipped by parquet dataset readers
+PARTITION_FIELDS = ("grade", "subject", "language", "content_type", "textbook_id")
+EXPORT_MAX_OPEN_PARTS = int(os.getenv("EXPORT_MAX_OPEN_PARTS", "32"))
+
+
+def partition_dir(row: dict, partition_by: list) -> str:
+    parts = []
+    for field in partition_by:
+        value = re.sub(r"[^\w.-]+", "_", str(row.get(field) or "")).strip("_") or "unknown"
+        parts.append(f"{field}={value}")
+    return os.path.join(*parts) if parts else ""
+
+
+def json_default(value):
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+# one encoder for every row; json.dumps would build a new one per call
+_json_encoder = json.JSONEncoder(ensure_ascii=False, default=json_default)
+
+
+class JsonlPart:
+    """
+    One JSONL part file; rows are written straight through.
+    """
+    extension = "jsonl"
+
+    def __init__(self, path: str, batch_size: int, partition_by: list = ()):
+        self.path = path
+        self.file = open(path, "w", encoding="utf-8")
+
+    def write(self, rows: list):
+        self.file.writelines(_json_encoder.encode(row) + "\n" for row in rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetPart:
+    """
+    One Parquet part file; rows are buffered up to `batch_size` per row group.
+    Partition columns are left out, as hive-style readers take them from the path.
+    """
+    extension = "parquet"
+
+    def __init__(self, path: str, batch_size: int, partition_by: list = ()):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet export requires `pip install pyarrow`") from e
+
+        types = {"int": pa.int64(), "bool": pa.bool_(), "datetime": pa.timestamp("us"), "str": pa.string()}
+        self.pa = pa
+        self.path = path
+        self.batch_size = batch_size
+        self.schema = pa.schema([(field, types[kind]) for field, kind in field_kinds().items()
+                                 if field not in partition_by])
+        self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+        self.buffer = []
+
+    def write(self, rows: list):
+        self.buffer.extend(rows)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.writer.write_table(self.pa.Table.from_pylist(self.buffer, schema=self.schema))
+            self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+PART_WRITERS = {"jsonl": JsonlPart, "parquet": ParquetPart}
+
+
+def read_state(directory: str) -> dict:
+    path = os.path.join(directory, EXPORT_STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def export_corpus(engine, directory: str, fmt: str = "jsonl", partition_by: list = (),
+                  batch_size: int = EXPORT_BATCH_SIZE, since=None, incremental: bool = False,
+                  include_inactive: bool = None, max_open_parts: int = EXPORT_MAX_OPEN_PARTS, **filters) -> dict:
+    """
+    Streams the corpus into part files under `directory`. `filters` go to
+    db.export.export_query (grade, subject, content_type, textbook_ids).
+    With incremental=True and no `since`, only rows written after the revision
+    the previous export into `directory` read up to are exported. Deactivated
+    rows are included in incremental exports, unless include_inactive says
+    otherwise. Returns counts and timings.
+    """
+    if fmt not in PART_WRITERS:
+        raise ValueError(f"Unknown export format {fmt!r} (choose from {', '.join(EXPORT_FORMATS)})")
+    unknown = [field for field in partition_by if field not in EXPORT_FIELDS]
+    if unknown:
+        raise ValueError(f"Cannot partition by {', '.join(unknown)}")
+    after_revision = None
+    if incremental and since is None:
+        state = read_state(directory)
+        if "revision" in state:
+            after_revision = state["revision"]
+        elif state.get("exported_until"):
+            # state written before revisions existed
+            since = datetime.datetime.fromisoformat(state["exported_until"])
+    if include_inactive is None:
+        include_inactive = since is not None or after_revision is not None
+
+    # read before the rows: every write at or below it has committed and is in this
+    # export; later writes may be too, and come out again in the next incremental run
+    revision = current_revision(engine)
+    started = datetime.datetime.now()
+    run_id = started.strftime("%Y%m%dT%H%M%S%f")
+    part_class = PART_WRITERS[fmt]
+    parts = OrderedDict()  # open part writers, least recently used first
+    files, opened = [], Counter()
+    rows = 0
+    start = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    try:
+        for batch in iter_export_batches(engine, batch_size, since=since, after_revision=after_revision,
+                                         include_inactive=include_inactive, **filters):
+            grouped = {}
+            for row in batch:
+                grouped.setdefault(partition_dir(row, partition_by), []).append(row)
+            for key, group in grouped.items():
+                part = parts.pop(key, None)
+                if part is None:
+                    if len(parts) >= max(1, max_open_parts):
+                        parts.popitem(last=False)[1].close()
+                    folder = os.path.join(directory, key)
+                    os.makedirs(folder, exist_ok=True)
+                    opened[key] += 1
+                    suffix = f"-{opened[key]}" if opened[key] > 1 else ""
+                    part = part_class(os.path.join(folder, f"part-{run_id}{suffix}.{part_class.extension}"),
+                                      batch_size, partition_by)
+                    files.append(part.path)
+                parts[key] = part
+                part.write(group)
+            rows += len(batch)
+    finally:
+        for part in parts.values():
+            part.close()
+    elapsed = time.perf_counter() - start
+
+    stats = {
+        "format": fmt,
+        "rows": rows,
+        "files": sorted(os.path.relpath(path, directory) for path in files),
+        "since": since.isoformat() if since else None,
+        "after_revision": after_revision,
+        "revision": revision,
+        "exported_until": started.isoformat(),
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed, 1) if elapsed > 0 else None,
+    }
+    with open(os.path.join(directory, EXPORT_STATE_FILE), "w", encoding="utf-8") as f:
+        json.dump({key: value for key, value in stats.items() if key != "files"}, f, indent=2)
+    return stats
+
+
+def main(argv=None):
+    from db.database import init_db, engine
+
+    arg_parser = argparse.ArgumentParser(prog="python -m export", description="Export the textbook corpus.")
+    arg_parser.add_argument("directory")
+    arg_parser.add_argument("--format", choices=EXPORT_FORMATS, default="jsonl")
+    arg_parser.add_argument("--partition-by", default="", help=f"comma-separated, from {', '.join(PARTITION_FIELDS)}")
+    arg_parser.add_argument("--grade")
+    arg_parser.add_argument("--subject")
+    arg_parser.add_argument("--content-type")
+    arg_parser.add_argument("--textbook-id", type=int, action="append", dest="textbook_ids")
+    arg_parser.add_argument("--since", type=datetime.datetime.fromisoformat, help="content updated at or after")
+    arg_parser.add_argument("--incremental", action="store_true", help="since the last export into this directory")
+    arg_parser.add_argument("--include-inactive", action="store_true", default=None,
+                            help="also export deactivated rows (the default with --since/--incremental)")
+    arg_parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    arg_parser.add_argument("--max-open-parts", type=int, default=EXPORT_MAX_OPEN_PARTS,
+                            help="partitions with an open file at a time")
+    args = arg_parser.parse_args(argv)
+
+    init_db()
+    partition_by = [field.strip() for field in args.partition_by.split(",") if field.strip()]
+    unknown = [field for field in partition_by if field not in EXPORT_FIELDS]
+    if unknown:
+        arg_parser.error(f"cannot partition by {', '.join(unknown)}")
+    stats = export_corpus(engine, args.directory, args.format, partition_by, args.batch_size, since=args.since,
+                          incremental=args.incremental, include_inactive=args.include_inactive,
+                          max_open_parts=args.max_open_parts, grade=args.grade, subject=args.subject,
+                          content_type=args.content_type, textbook_ids=args.textbook_ids)
+    since = f" changed since {stats['since']}" if stats["since"] else ""
+    if stats["after_revision"] is not None:
+        since = f" changed since revision {stats['after_revision']}"
+    print(f"✅ Exported {stats['rows']} rows{since} to {len(stats['files'])} {args.format} files in "
+          f"{stats['seconds']:.1f}s ({stats['rows_per_second'] or 0:,.0f} rows/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""
+Headless batch ingestion.
+
+    python -m ingest path/to/textbooks --workers 4
+
+Every PDF under the directory gets a row in the ingest_jobs table. Files whose
+job is already done (same path and content hash) are skipped, and jobs left
+"running" by a crashed run are picked up again, so re-running the same command
+resumes where it stopped.
+
+A file that changed since it was ingested keeps its textbook: only the pages
+whose text changed are filtered again and the stored rows are updated in place
+(see pipeline.reingest_pdf). --reingest does the same for every done file, e.g.
+after the filter prompt changed.
+"""
+import os
+import sys
+import time
+import hashlib
+import argparse
+import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from db.database import init_db, engine, WriteSession
+from db.models import IngestJob, Textbook
+from db.search import optimize_search_index
+from instrumentation import IngestMetrics, profile
+from local_classifier import LOCAL_CLASSIFIER, get_local_classifier
+from pipeline import ingest_pdf, reingest_pdf
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_pdfs(directory: str, recursive: bool = True) -> list:
+    found = []
+    for root, dirs, files in os.walk(directory):
+        found.extend(os.path.join(root, name) for name in files if name.lower().endswith(".pdf"))
+        if not recursive:
+            break
+    return sorted(found)
+
+
+def plan_jobs(paths: list, retry_failed: bool = True, reingest: bool = False) -> tuple:
+    """
+    Creates or resets ingest_jobs rows for `paths`. With reingest=True files
+    that are already done run again too.
+    Returns (job ids to run, number of files skipped as already done).
+    """
+    to_run, skipped = [], 0
+    # hash before opening the write transaction so the lock is held only for the updates
+    hashes = {os.path.abspath(path): file_sha256(path) for path in paths}
+    db = WriteSession()
+    try:
+        for source_path, file_hash in hashes.items():
+            job = db.query(IngestJob).filter_by(source_path=source_path).one_or_none()
+            if job is None:
+                job = IngestJob(source_path=source_path, file_hash=file_hash, status="pending")
+                db.add(job)
+            elif job.file_hash != file_hash:
+                job.file_hash, job.status, job.error = file_hash, "pending", None
+            elif (job.status == "done" and not reingest) or (job.status == "failed" and not retry_failed):
+                skipped += 1
+                continue
+            else:
+                job.status = "pending"
+            db.flush()
+            to_run.append(job.job_id)
+        db.commit()
+    finally:
+        db.close()
+    return to_run, skipped
+
+
+def update_job(job_id: int, **fields):
+    db = WriteSession()
+    try:
+        db.query(IngestJob).filter_by(job_id=job_id).update(fields)
+        db.commit()
+    finally:
+        db.close()
+
+
+def run_job(job_id: int) -> dict:
+    db = WriteSession()
+    try:
+        job = db.get(IngestJob, job_id)
+        source_path = job.source_path
+        # a file ingested before keeps its textbook and is diffed against it
+        textbook_id = job.textbook_id if job.textbook_id and db.get(Textbook, job.textbook_id) else None
+        job.status = "running"
+        job.attempts = (job.attempts or 0) + 1
+        job.started_at = datetime.datetime.now()
+        db.commit()
+    finally:
+        db.close()
+
+    start = time.perf_counter()
+    metrics = IngestMetrics(source_path)
+    try:
+        with metrics.activate(), profile(source_path):
+            if textbook_id:
+                result = reingest_pdf(engine, textbook_id, source_path)
+            else:
+                result = ingest_pdf(engine, source_path, os.path.basename(source_path))
+    except Exception as e:
+        update_job(job_id, status="failed", error=str(e), finished_at=datetime.datetime.now())
+        metrics.log(job_id=job_id, source_path=source_path, status="failed", error=str(e))
+        print(f"❌ {source_path}: {str(e)}")
+        return {"status": "failed", "pages": 0, "rows": 0, "seconds": time.perf_counter() - start}
+
+    update_job(job_id, status="done", error=None, textbook_id=result["textbook_id"],
+               pages=result["pages"], rows=result["rows"], finished_at=datetime.datetime.now())
+    metrics.log(job_id=job_id, source_path=source_path, status="done", textbook_id=result["textbook_id"],
+                pages=result["pages"], rows=result["rows"])
+    seconds = time.perf_counter() - start
+    if textbook_id:
+        print(f"✅ {source_path}: re-ingested, {result['pages_refiltered']}/{result['pages']} pages re-filtered, "
+              f"{result['updated']} rows updated, {result['inserted']} added, {result['deactivated']} deactivated "
+              f"in {seconds:.1f}s")
+    else:
+        print(f"✅ {source_path}: {result['pages']} pages, {result['rows']} rows in {seconds:.1f}s")
+    return {"status": "done", "pages": result["pages"], "rows": result["rows"], "seconds": seconds}
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog="python -m ingest", description="Batch-ingest a directory of textbook PDFs.")
+    arg_parser.add_argument("directory")
+    arg_parser.add_argument("--workers", type=int, default=2, help="files processed concurrently")
+    arg_parser.add_argument("--no-recursive", action="store_true", help="only look at the top-level directory")
+    arg_parser.add_argument("--skip-failed", action="store_true", help="do not retry files that failed before")
+    arg_parser.add_argument("--reingest", action="store_true",
+                            help="re-run done files too, re-filtering only pages that changed")
+    args = arg_parser.parse_args(argv)
+
+    init_db()
+    paths = find_pdfs(args.directory, recursive=not args.no_recursive)
+    job_ids, skipped = plan_jobs(paths, retry_failed=not args.skip_failed, reingest=args.reingest)
+    print(f"🟡 {len(paths)} PDFs found, {skipped} already ingested, {len(job_ids)} to run.")
+
+    totals = {"done": 0, "failed": 0, "pages": 0, "rows": 0}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        for future in as_completed([pool.submit(run_job, job_id) for job_id in job_ids]):
+            outcome = future.result()
+            totals[outcome["status"]] += 1
+            totals["pages"] += outcome["pages"]
+            totals["rows"] += outcome["rows"]
+    if totals["done"]:
+        optimize_search_index(engine)
+    elapsed = time.perf_counter() - start
+
+    print(f"\n📊 {totals['done']} done, {totals['failed']} failed, {skipped} skipped in {elapsed:.1f}s")
+    if elapsed > 0 and job_ids:
+        print(f"   {totals['done'] * 60 / elapsed:.1f} files/min, {totals['pages'] / elapsed:.1f} pages/s, "
+              f"{totals['rows'] / elapsed:.1f} rows/s")
+    if LOCAL_CLASSIFIER and job_ids:
+        local = get_local_classifier().stats()
+        print(f"   local classifier: {local['rule']} by rule, {local['model']} by model, "
+              f"{local['escalated']} sent to the LLM ({local['saved_fraction']:.0%} of classifications saved)")
+    return 1 if totals["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+Lightweight ingest instrumentation.
+
+An IngestMetrics collector is activated for the duration of one ingest; while it
+is active, stage() timers and incr() counters anywhere in the call tree record
+into it, including worker threads started through propagate(). With no active
+collector every call is a no-op, so library code can be instrumented freely.
+
+    metrics = IngestMetrics("book.pdf")
+    with metrics.activate(), profile("book.pdf"):
+        ingest_pdf(engine, "book.pdf", "book.pdf")
+    metrics.log(status="done")
+
+Stage times are summed across threads and stages may nest (the filter stage
+includes pulling pages from the extractor), so they can add up to more than the
+wall-clock time reported as elapsed_seconds.
+"""
+import os
+import json
+import time
+import datetime
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+INGEST_LOG_PATH = os.getenv("INGEST_LOG_PATH", "ingest_metrics.jsonl")
+INGEST_PROFILE = os.getenv("INGEST_PROFILE", "")  # "", "cprofile" or "pyinstrument"
+INGEST_PROFILE_DIR = os.getenv("INGEST_PROFILE_DIR", "profiles")
+
+_current = contextvars.ContextVar("ingest_metrics", default=None)
+_log_lock = threading.Lock()
+
+
+class IngestMetrics:
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.started_at = datetime.datetime.now()
+        self.perf_start = time.perf_counter()
+        self.stages = {}
+        self.counters = Counter()
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def activate(self):
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def add_time(self, name: str, seconds: float, calls: int = 1):
+        with self.lock:
+            stage = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0})
+            stage["calls"] += calls
+            stage["seconds"] += seconds
+
+    def incr(self, name: str, n: int = 1):
+        with self.lock:
+            self.counters[name] += n
+
+    def summary(self) -> dict:
+        with self.lock:
+            return {
+                "label": self.label,
+                "started_at": self.started_at.isoformat(timespec="seconds"),
+                "elapsed_seconds": round(time.perf_counter() - self.perf_start, 3),
+                "stages": {name: {"calls": stage["calls"], "seconds": round(stage["seconds"], 3)}
+                           for name, stage in sorted(self.stages.items(), key=lambda item: -item[1]["seconds"])},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def table(self) -> list:
+        """
+        Rows for st.table / printing: stages (slowest first), then counters.
+        """
+        summary = self.summary()
+        rows = [{"metric": f"⏱ {name}", "calls": stage["calls"], "value": f"{stage['seconds']:.2f}s"}
+                for name, stage in summary["stages"].items()]
+        rows += [{"metric": name, "calls": "", "value": f"{value:,}"} for name, value in summary["counters"].items()]
+        rows.append({"metric": "elapsed", "calls": "", "value": f"{summary['elapsed_seconds']:.2f}s"})
+        return rows
+
+    def log(self, path: str = INGEST_LOG_PATH, **fields) -> dict:
+        """
+        Appends one JSON line with the summary and any extra `fields`.
+        """
+        record = {**self.summary(), **fields}
+        if path:
+            with _log_lock, open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+        return record
+
+
+def current():
+    return _current.get()
+
+
+def incr(name: str, n: int = 1):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.incr(name, n)
+
+
+@contextmanager
+def stage(name: str):
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_time(name, time.perf_counter() - start)
+
+
+def timed(name: str):
+    """
+    Decorator form of stage().
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_iter(name: str, iterable, per_item: bool = True):
+    """
+    Passes `iterable` through, timing only the work of producing each item
+    (e.g. page extraction), not what the consumer does in between. Each item
+    counts as a call unless per_item=False (one call for the whole stream).
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    calls, seconds = 0, 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                seconds += time.perf_counter() - start
+            calls += 1
+            yield item
+    finally:
+        metrics.add_time(name, seconds, calls if per_item else 1)
+
+
+def propagate(fn):
+    """
+    Binds the caller's context variables (the active collector, an LLM cache
+    bypass) to `fn` so they still apply when it runs on a ThreadPoolExecutor or
+    Thread, which do not inherit them.
+    """
+    context = contextvars.copy_context()
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        # a Context can only be entered by one thread at a time
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+def record_usage(usage):
+    """
+    Token counters from a chat response's `usage`, when the API returned one.
+    """
+    if usage is None:
+        return
+    incr("llm.prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+    incr("llm.completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
+
+
+@contextmanager
+def profile(label: str, mode: str = INGEST_PROFILE, directory: str = INGEST_PROFILE_DIR):
+    """
+    Optional profiler around one ingest: "cprofile" writes a .prof file (open it
+    with snakeviz or pstats), "pyinstrument" an HTML report if pyinstrument is
+    installed. Both only see the calling thread. Yields the output path or None.
+    """
+    if not mode:
+        yield None
+        return
+
+    os.makedirs(directory, exist_ok=True)
+    name = "".join(c if c.isalnum() else "_" for c in os.path.basename(label))[:60] or "ingest"
+    base = os.path.join(directory, f"{name}-{datetime.datetime.now():%Y%m%d-%H%M%S}")
+
+    if mode == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("pyinstrument is not installed (`pip install pyinstrument`); using cProfile instead.")
+            mode = "cprofile"
+
+    if mode == "pyinstrument":
+        profiler = Profiler()
+        path = base + ".html"
+        profiler.start()
+        try:
+            yield path
+        finally:
+            profiler.stop()
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+            print(f"🟣 Profile written to {path}")
+    else:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        path = base + ".prof"
+        profiler.enable()
+        try:
+            yield path
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+            print(f"🟣 Profile written to {path}")
@@ -0,0 +1,276 @@
+"""
+Process-wide background executor for ingestion work started from the
+Streamlit app.
+
+A Streamlit script reruns on every widget interaction and is abandoned when the
+browser refreshes, so long work must not live in the script body. The app
+submits it here instead and polls the returned Job by id:
+
+    job = get_job_manager().submit("book.pdf", extract_upload, path)
+    get_job_manager().get(job.job_id).snapshot()   # status, progress, result
+    get_job_manager().cancel(job.job_id)
+
+Progress (pages extracted, blocks classified, rows written) comes from the
+job's IngestMetrics, which every thread of the job records into. Cancellation
+is cooperative: the next page, LLM call, counter or stage timing the job
+records after cancel() raises JobCancelled in the job's thread.
+"""
+import os
+import uuid
+import shutil
+import asyncio
+import datetime
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import IngestMetrics, stage, timed_iter, propagate
+from llm_cache import bypass_cache
+from db.ingest import save_media, delete_textbook
+from ocr_utils import iter_pages, extract_relevant_textbook_content
+from pdf_metadata import extract_pdf_metadata
+from media_store import extract_media, sweep_if_due, INGEST_MEDIA
+
+INGEST_JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", "2"))  # jobs running at once, across all sessions
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "100"))  # finished jobs kept for polling
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(BaseException):
+    """
+    Not an Exception, like asyncio.CancelledError, so the pipeline's
+    "log the error and carry on" handlers do not swallow it.
+    """
+
+
+class JobMetrics(IngestMetrics):
+    """
+    IngestMetrics that doubles as the job's cancellation checkpoint.
+    """
+
+    def __init__(self, label: str, cancelled: threading.Event):
+        super().__init__(label)
+        self.cancelled = cancelled
+
+    def checkpoint(self):
+        if self.cancelled.is_set():
+            raise JobCancelled("Job was cancelled.")
+
+    def add_time(self, name: str, seconds: float, calls: int = 1):
+        super().add_time(name, seconds, calls)
+        self.checkpoint()
+
+    def incr(self, name: str, n: int = 1):
+        super().incr(name, n)
+        self.checkpoint()
+
+
+class Job:
+    def __init__(self, label: str, kind: str = "", use_cache: bool = True):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.kind = kind
+        self.use_cache = use_cache  # False skips the LLM cache for this job only
+        self.status = QUEUED
+        self.created_at = datetime.datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.partial = {}  # results the job publishes before it finishes, e.g. metadata ahead of the filter
+        self.error = None
+        self.pages = 0
+        self.cancelled = threading.Event()
+        self.metrics = JobMetrics(label, self.cancelled)
+        self.future = None
+        self.cleanup = None
+
+    def count_pages(self, pages):
+        """
+        Passes (page_number, text) pairs through, counting them as extracted.
+        """
+        for page in pages:
+            self.metrics.checkpoint()
+            self.pages += 1
+            yield page
+
+    def progress(self) -> dict:
+        counters = self.metrics.summary()["counters"]
+        classified = sum(counters.get(name, 0) for name in
+                         ("classify.near_duplicate", "classify.local_rule", "classify.local_model",
+                          "classify.blocks"))
+        return {"pages": self.pages, "classified": classified, "rows": counters.get("db.rows", 0)}
+
+    def snapshot(self) -> dict:
+        end = self.finished_at or datetime.datetime.now()
+        return {
+            "job_id": self.job_id,
+            "label": self.label,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(timespec="seconds"),
+            "elapsed_seconds": round((end - self.started_at).total_seconds(), 1) if self.started_at else 0.0,
+            "progress": self.progress(),
+            "partial": dict(self.partial),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """
+    Runs jobs on a shared thread pool. `fn(job, *args)` does the work and
+    returns the job's result; it runs with job.metrics active.
+    """
+
+    def __init__(self, max_workers: int = INGEST_JOB_WORKERS, history: int = INGEST_JOB_HISTORY):
+        self.pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="ingest-job")
+        self.history = history
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, label: str, fn, *args, kind: str = "", cleanup=None, use_cache: bool = True) -> Job:
+        """
+        Queues `fn(job, *args)`. `cleanup()`, if given, runs once the job has
+        finished, whatever the outcome (e.g. to delete a spooled upload).
+        With use_cache=False the job neither reads nor fills the LLM cache.
+        """
+        job = Job(label, kind or fn.__name__, use_cache)
+        job.cleanup = cleanup
+        with self.lock:
+            self.jobs[job.job_id] = job
+            self._prune()
+        job.future = self.pool.submit(self._run, job, fn, args)
+        return job
+
+    def _run(self, job: Job, fn, args):
+        try:
+            if job.cancelled.is_set():
+                job.status = CANCELLED
+                return
+            job.status, job.started_at = RUNNING, datetime.datetime.now()
+            with job.metrics.activate(), bypass_cache(not job.use_cache):
+                job.result = fn(job, *args)
+            job.status = DONE
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            job.status, job.error = FAILED, str(e)
+            print(f"❌ Job {job.job_id} ({job.label}) failed: {str(e)}")
+        finally:
+            job.finished_at = datetime.datetime.now()
+            if job.cleanup:
+                job.cleanup()
+            if job.started_at:
+                job.metrics.log(job_id=job.job_id, kind=job.kind, source_path=job.label, status=job.status,
+                                error=job.error)
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in FINISHED]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id: str):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self) -> list:
+        with self.lock:
+            return list(self.jobs.values())
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Asks a job to stop. A queued job never starts; a running one stops at
+        its next checkpoint. Returns False for unknown or finished jobs.
+        """
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED:
+            return False
+        job.cancelled.set()
+        if job.future is not None and job.future.cancel():
+            job.status, job.finished_at = CANCELLED, datetime.datetime.now()
+            if job.cleanup:
+                job.cleanup()
+        return True
+
+
+_manager = None
+_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    global _manager
+    with _lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
+
+
+def spool_upload(file) -> str:
+    """
+    Copies an uploaded file to a temporary path that outlives the Streamlit
+    rerun; the job that reads it deletes it (see JobManager.submit's cleanup).
+    """
+    if hasattr(file, "seek"):
+        file.seek(0)
+    tmp = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+    with tmp:
+        shutil.copyfileobj(file, tmp, 1024 * 1024)
+    return tmp.name
+
+
+def remove_file(path: str):
+    def cleanup():
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+    return cleanup
+
+
+def extract_upload(job: Job, path: str) -> dict:
+    """
+    Job: metadata, filtered markdown and stored images for a spooled PDF. The
+    metadata is published in job.partial as soon as it is known, so the form can
+    be filled in while the filter runs; images are extracted alongside the filter.
+    """
+    with ThreadPoolExecutor(max_workers=1) as background:
+        media = background.submit(propagate(extract_media), path) if INGEST_MEDIA else None
+        with stage("metadata"):
+            metadata = extract_pdf_metadata(path)
+        job.partial["metadata"] = metadata
+        print("\n🟡 Metadata extracted:", metadata)
+        with stage("filter"):
+            filtered_markdown = extract_relevant_textbook_content(
+                timed_iter("extract", job.count_pages(iter_pages(path)))
+            )
+        job.metrics.checkpoint()
+        print("\n🟡 Filtered markdown extracted.")
+        with stage("media"):
+            images = media.result() if media is not None else []
+    return {"metadata": metadata, "filtered_markdown": filtered_markdown, "media": images}
+
+
+def save_markdown(job: Job, engine, textbook: dict, markdown: str, images: list = ()) -> dict:
+    """
+    Job: parse, classify and save filtered markdown (async_pipeline, starting at
+    parse), then link the images extract_upload stored to the new content.
+    Now and then the media store is swept for files no book uses, such as the
+    images of uploads that were never saved.
+    """
+    from async_pipeline import IngestPipeline
+
+    pipeline = IngestPipeline(engine, textbook)
+    result = asyncio.run(pipeline.run_markdown(markdown))
+    try:
+        media = save_media(engine, result["textbook_id"], list(images)) if images else 0
+    except BaseException:
+        # cancelled or failed after the rows were committed: a job that does not
+        # finish as done leaves no book behind, as IngestPipeline does
+        delete_textbook(engine, result["textbook_id"])
+        raise
+    sweep_if_due(engine)
+    return {"textbook_id": result["textbook_id"], "rows": result["rows"], "classified": result["classified"],
+            "media": media, "elapsed_seconds": result["elapsed_seconds"], "metrics": job.metrics.table()}
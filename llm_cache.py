@@ -0,0 +1,198 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import contextvars
+from contextlib import contextmanager
+
+import llm_client
+from instrumentation import stage, incr, timed_iter, record_usage
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(30 * 24 * 3600)))  # seconds, 0 = never expire
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "200000"))
+LLM_CACHE_DISABLED = os.getenv("LLM_CACHE_DISABLED", "").lower() in ("1", "true", "yes")
+
+# Run the eviction sweep once every this many writes rather than on each one.
+EVICT_EVERY = 500
+
+_bypassed = contextvars.ContextVar("llm_cache_bypassed", default=False)
+
+
+@contextmanager
+def bypass_cache(bypass: bool = True):
+    """
+    Skips the cache for every lookup and write made inside the block (and in
+    worker threads started through instrumentation.propagate), without
+    touching the shared cache other sessions and jobs are using.
+    """
+    token = _bypassed.set(bypass)
+    try:
+        yield
+    finally:
+        _bypassed.reset(token)
+
+
+class LLMCache:
+    """
+    Persistent, content-addressed cache of LLM responses.
+    Entries are keyed by sha256(model + prompt) and stored in a small SQLite file.
+    Expired entries (TTL) and the least recently used entries beyond
+    `max_entries` are evicted periodically.
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, ttl=LLM_CACHE_TTL,
+                 max_entries=LLM_CACHE_MAX_ENTRIES, enabled=not LLM_CACHE_DISABLED):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            cache_key TEXT PRIMARY KEY,
+            model TEXT,
+            response TEXT,
+            created_at REAL,
+            last_used REAL
+        )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_last_used ON llm_cache (last_used)")
+
+    @staticmethod
+    def make_key(model: str, prompt: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(model.encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(prompt.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def get(self, model: str, prompt: str):
+        if not self.enabled or _bypassed.get():
+            return None
+        key = self.make_key(model, prompt)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE llm_cache SET last_used = ? WHERE cache_key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, model: str, prompt: str, response: str):
+        if not self.enabled or _bypassed.get():
+            return
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (cache_key, model, response, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.make_key(model, prompt), model, response, now, now)
+            )
+            self.writes += 1
+            if self.writes % EVICT_EVERY == 0:
+                self._evict(now)
+
+    def evict(self):
+        with self.lock:
+            self._evict(time.time())
+
+    def _evict(self, now: float):
+        if self.ttl:
+            self.conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+        if self.max_entries:
+            self.conn.execute("""
+            DELETE FROM llm_cache WHERE cache_key IN (
+                SELECT cache_key FROM llm_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+            """, (self.max_entries,))
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM llm_cache")
+
+    def stats(self) -> dict:
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "enabled": self.enabled}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> LLMCache:
+    """
+    Returns the process-wide cache, opening it on first use.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
+
+
+def cached_complete(client, model: str, prompt: str, use_cache: bool = True) -> str:
+    """
+    Returns the stripped completion text for a single-message prompt, serving it
+    from the cache when possible. Errors from the client propagate and are never cached.
+    """
+    cache = get_cache()
+    if use_cache:
+        cached = cache.get(model, prompt)
+        if cached is not None:
+            incr("llm.cache_hits")
+            return cached
+
+    incr("llm.calls")
+    with stage(f"llm:{model}"):
+        response = llm_client.complete(client, model, prompt)
+    record_usage(getattr(response, "usage", None))
+    if not response.choices or not response.choices[0].message:
+        return ""
+    text = response.choices[0].message.content.strip()
+    if text and use_cache:
+        cache.set(model, prompt, text)
+    return text
+
+
+def cached_stream(client, model: str, prompt: str, use_cache: bool = True):
+    """
+    Streaming counterpart of cached_complete: yields text fragments as the model
+    produces them. A cache hit is yielded as a single fragment; a completed stream
+    is cached as its full stripped text.
+    """
+    cache = get_cache()
+    if use_cache:
+        cached = cache.get(model, prompt)
+        if cached is not None:
+            incr("llm.cache_hits")
+            yield cached
+            return
+
+    incr("llm.calls")
+    parts = []
+    with llm_client.stream(client, model, prompt) as events:
+        for event in timed_iter(f"llm:{model}", events, per_item=False):
+            # the final chunk carries the token usage for the whole stream
+            record_usage(getattr(event.data, "usage", None))
+            if not event.data.choices:
+                continue
+            delta = event.data.choices[0].delta.content
+            if isinstance(delta, str) and delta:
+                parts.append(delta)
+                yield delta
+
+    text = "".join(parts).strip()
+    if text and use_cache:
+        cache.set(model, prompt, text)
@@ -0,0 +1,252 @@
+"""
+Shared Mistral client for every LLM call site.
+
+One process-wide client reuses a keep-alive HTTP connection pool with explicit
+timeouts. Calls go through with_retries() / stream(), which:
+
+- retry 429s, 5xx responses, timeouts and dropped connections with jittered
+  exponential backoff, waiting at least as long as the server's Retry-After;
+- run under a global AdaptiveLimiter that halves the number of concurrent
+  requests on a 429 and adds roughly one slot per window of successful calls
+  (AIMD), so every thread backs off together instead of retrying in lockstep.
+
+Point MISTRAL_SERVER_URL at benchmarks/mock_mistral.py to exercise 429s and latency.
+"""
+import os
+import time
+import random
+import datetime
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+import httpx
+from mistralai import Mistral
+from dotenv import load_dotenv
+
+from instrumentation import incr
+
+load_dotenv()
+
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))  # seconds
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))  # seconds between bytes, so long streams are fine
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "5"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))  # seconds
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "60"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))  # starting limit
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit with additive increase / multiplicative decrease.
+    A 429 halves the limit, unless the request was sent before the last
+    decrease (429s from a burst that was already in flight count once), and,
+    with Retry-After, holds every new request until that time has passed.
+    acquire() returns the request's start time for on_rate_limited().
+    """
+
+    def __init__(self, initial: int = LLM_CONCURRENCY, minimum: int = 1, maximum: int = LLM_MAX_CONCURRENCY):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(self.maximum, max(self.minimum, initial)))
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self) -> float:
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                wait = self.paused_until - now
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return now
+                self.condition.wait(timeout=wait if wait > 0 else None)
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    @contextmanager
+    def slot(self):
+        started = self.acquire()
+        try:
+            yield started
+        finally:
+            self.release()
+
+    def on_success(self):
+        with self.condition:
+            if self.limit < self.maximum:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                self.condition.notify_all()
+
+    def on_rate_limited(self, started: float, retry_after: float = None):
+        with self.condition:
+            now = time.monotonic()
+            if started >= self.last_decrease:
+                self.limit = max(self.minimum, self.limit / 2)
+                self.last_decrease = now
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {"limit": round(self.limit, 2), "in_flight": self.in_flight}
+
+
+_client = None
+_limiter = None
+_lock = threading.Lock()
+
+
+def get_client() -> Mistral:
+    """
+    Returns the process-wide Mistral client, honouring MISTRAL_SERVER_URL
+    (e.g. http://127.0.0.1:8089 for benchmarks/mock_mistral.py).
+    """
+    global _client
+    with _lock:
+        if _client is None:
+            http = httpx.Client(
+                timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                                    max_keepalive_connections=LLM_MAX_CONNECTIONS),
+            )
+            _client = Mistral(api_key=os.getenv("MISTRAL_API_KEY"),
+                              server_url=os.getenv("MISTRAL_SERVER_URL") or None, client=http)
+        return _client
+
+
+def get_limiter() -> AdaptiveLimiter:
+    global _limiter
+    with _lock:
+        if _limiter is None:
+            _limiter = AdaptiveLimiter()
+        return _limiter
+
+
+def status_code(error: Exception):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "raw_response", None), "status_code", None)
+    return status
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return status_code(error) == 429
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, httpx.TransportError):  # timeouts, refused or dropped connections
+        return True
+    return status_code(error) in RETRY_STATUS
+
+
+def retry_after(error: Exception):
+    """
+    Seconds from the response's Retry-After header (delta-seconds or HTTP date), or None.
+    """
+    headers = getattr(getattr(error, "raw_response", None), "headers", None) or {}
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (moment - datetime.datetime.now(moment.tzinfo)).total_seconds())
+
+
+def backoff(attempt: int, base: float = LLM_BACKOFF_BASE, cap: float = LLM_BACKOFF_MAX) -> float:
+    """
+    "Full jitter": a random wait up to base * 2**attempt, capped.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _wait_before_retry(error: Exception, attempt: int, retries: int, limiter: AdaptiveLimiter, started: float):
+    """
+    Raises `error` if it is final, otherwise records it and sleeps before the next attempt.
+    """
+    if not is_retryable(error) or attempt >= retries:
+        incr("llm.errors")
+        raise error
+    delay = retry_after(error)
+    if is_rate_limited(error):
+        incr("llm.429")
+        limiter.on_rate_limited(started, delay)
+    wait = backoff(attempt)
+    if delay is not None:
+        # never earlier than the server asked; jitter keeps the threads from waking together
+        wait = delay * random.uniform(1.0, 1.25)
+    incr("llm.retries")
+    print(f"🟠 LLM request failed ({status_code(error) or type(error).__name__}), "
+          f"retry {attempt + 1}/{retries} in {wait:.1f}s")
+    time.sleep(wait)
+
+
+def with_retries(request, retries: int = LLM_RETRIES, limiter: AdaptiveLimiter = None):
+    """
+    Calls `request()` (one API call) under the shared limiter, retrying failures
+    that are worth retrying. Other errors, and the last failure, propagate.
+    """
+    limiter = limiter or get_limiter()
+    attempt = 0
+    while True:
+        started = None
+        try:
+            with limiter.slot() as started:
+                result = request()
+        except Exception as e:
+            _wait_before_retry(e, attempt, retries, limiter, started)
+            attempt += 1
+            continue
+        limiter.on_success()
+        return result
+
+
+def complete(client, model: str, prompt: str, **kwargs):
+    """
+    Single-message chat completion through with_retries. Returns the API response.
+    """
+    return with_retries(lambda: client.chat.complete(
+        model=model, messages=[{"role": "user", "content": prompt}], **kwargs
+    ))
+
+
+@contextmanager
+def stream(client, model: str, prompt: str, retries: int = LLM_RETRIES, limiter: AdaptiveLimiter = None):
+    """
+    Opens a chat stream, retrying until the response starts, and yields its
+    events. The limiter slot is held until the stream is closed; errors after
+    the first event propagate, since the caller may already have used output.
+    """
+    limiter = limiter or get_limiter()
+    attempt = 0
+    while True:
+        started = limiter.acquire()
+        try:
+            events = client.chat.stream(model=model, messages=[{"role": "user", "content": prompt}])
+        except Exception as e:
+            limiter.release()
+            _wait_before_retry(e, attempt, retries, limiter, started)
+            attempt += 1
+            continue
+        try:
+            with events:
+                yield events
+            limiter.on_success()
+        finally:
+            limiter.release()
+        return
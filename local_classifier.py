@@ -0,0 +1,361 @@
+"""
+Local fast path for content-type classification.
+
+Shape rules catch the blocks that are obvious from their form ("Note to the
+teacher", "Name: ..." dialogue lines, blanks, lettered choices). A small text
+model trained from the LLM and manual labels in the content table covers the
+rest. Only blocks where neither is confident enough go to the LLM:
+
+    local = get_local_classifier()
+    labels = local.classify(blocks, ClassificationEngine().classify)
+    local.stats()  # {"rule": ..., "model": ..., "escalated": ..., "saved_fraction": ...}
+
+The model is TF-IDF + logistic regression when scikit-learn is installed
+(`pip install scikit-learn`), otherwise a pure-Python naive Bayes.
+
+    python -m local_classifier   # held-out accuracy and the share of LLM calls saved
+"""
+import os
+import re
+import math
+import random
+import argparse
+import threading
+from collections import Counter, defaultdict
+
+from sqlalchemy import select
+
+from db.models import Content, Label
+from instrumentation import incr
+
+LOCAL_CLASSIFIER = os.getenv("LOCAL_CLASSIFIER", "1").lower() not in ("0", "false", "no")
+LOCAL_CLASSIFY_THRESHOLD = float(os.getenv("LOCAL_CLASSIFY_THRESHOLD", "0.85"))
+LOCAL_TRAIN_MAX_ROWS = int(os.getenv("LOCAL_TRAIN_MAX_ROWS", "50000"))
+LOCAL_TRAIN_MIN_ROWS = 50
+RULE_MIN_SUPPORT = 10  # rule firings needed before its precision on stored labels can lower its confidence
+TRAINING_LABEL_SOURCES = ("llm", "manual")  # never the classifier's own labels; NULL is a row from before label_source
+
+# Kept in step with ocr_utils.CONTENT_TYPES (not imported, to keep this module free of the Mistral client).
+CONTENT_TYPES = {
+    "poem", "story", "activity", "question", "note", "dialogue", "exercise",
+    "example", "reading_passage", "song", "conversation", "picture_description",
+    "fill_in_the_blanks", "short_answer_question", "multiple_choice_question",
+    "matching", "rhyme",
+}
+
+TOKEN = re.compile(r"[^\W\d_]+", re.UNICODE)
+SPEAKER_LINE = re.compile(r"^\W*[A-Z][\w .']{0,24}\s*:\**\s+\S")
+LETTERED = re.compile(r"^\W*[A-H]\.\s")
+BLANK = re.compile(r"_{3,}|\.{5,}")
+CHOICES = re.compile(r"\(\s*[a-d]\s*\)|^\s*[a-d]\)\s", re.M)
+TEACHER_NOTE = re.compile(r"note (?:to|for) (?:the )?teachers?|teacher'?s note", re.I)
+
+
+def normalize_label(raw: str):
+    """
+    Stored labels sometimes carry markdown or an explanation after the label
+    ("**dialogue**", "note\\n\\n(note: ...)"). Returns the bare label, or None if
+    it is not one of CONTENT_TYPES.
+    """
+    if not raw:
+        return None
+    label = raw.strip().split()[0].strip("*`\"'.,").replace("\\_", "_").lower()
+    return label if label in CONTENT_TYPES else None
+
+
+def _lines(text: str) -> list:
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def _rhymes(lines: list) -> bool:
+    endings = [TOKEN.findall(line.lower())[-1:] for line in lines]
+    endings = [ending[0][-2:] for ending in endings if ending and len(ending[0]) > 1]
+    pairs = list(zip(endings, endings[1:])) + list(zip(endings, endings[2:]))
+    return bool(pairs) and sum(a == b for a, b in pairs) >= max(1, len(endings) // 3)
+
+
+def rule_label(text: str):
+    """
+    (label, confidence) from the block's shape, or None.
+    """
+    lines = _lines(text)
+    if not lines:
+        return None
+    if TEACHER_NOTE.search(lines[0]):
+        return "note", 0.97
+    body = lines[1:] if lines[0].startswith("**") and len(lines) > 2 else lines
+    speakers = sum(bool(SPEAKER_LINE.match(line)) for line in body)
+    if speakers >= 2 and speakers * 2 >= len(body):
+        return "dialogue", 0.92
+    if len(BLANK.findall(text)) >= 2:
+        return "fill_in_the_blanks", 0.9
+    if len(CHOICES.findall(text)) >= 3:
+        return "multiple_choice_question", 0.88
+    return None
+
+
+def shape_features(text: str) -> list:
+    """
+    Marker words for shapes that are too ambiguous to decide a label: lettered
+    items are activities, songs and dialogues as often as exercises, and short
+    rhyming lines are songs and reading passages as often as poems. They only
+    serve as model features (see model_input).
+    """
+    lines = _lines(text)
+    if not lines:
+        return []
+    body = lines[1:] if lines[0].startswith("**") and len(lines) > 2 else lines
+    features = []
+    if LETTERED.match(lines[0]):
+        features.append("shapelettered")
+    if 4 <= len(body) <= 24 and sum(len(line) for line in body) / len(body) <= 45 and _rhymes(body):
+        features.append("shaperhyming")
+    return features
+
+
+def model_input(text: str) -> str:
+    features = shape_features(text)
+    return f"{text}\n{' '.join(features)}" if features else text
+
+
+def tokens(text: str) -> list:
+    words = TOKEN.findall(text.lower())
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+
+class NaiveBayesModel:
+    """
+    Multinomial naive Bayes over words and word pairs; the fallback when
+    scikit-learn is missing. Its probabilities run high, so it is held to a
+    stricter margin in LocalClassifier.
+    """
+    calibrated = False
+
+    def fit(self, texts: list, labels: list):
+        self.doc_counts = Counter(labels)
+        self.word_counts = defaultdict(Counter)
+        for text, label in zip(texts, labels):
+            self.word_counts[label].update(tokens(text))
+        self.vocabulary = set().union(*(counts.keys() for counts in self.word_counts.values()))
+        self.totals = {label: sum(counts.values()) for label, counts in self.word_counts.items()}
+        self.classes = sorted(self.doc_counts)
+        return self
+
+    def predict(self, texts: list) -> list:
+        size, documents = len(self.vocabulary) + 1, sum(self.doc_counts.values())
+        results = []
+        for text in texts:
+            words = [word for word in tokens(text) if word in self.vocabulary]
+            scores = {}
+            for label in self.classes:
+                counts, total = self.word_counts[label], self.totals[label] + size
+                scores[label] = math.log(self.doc_counts[label] / documents) + sum(
+                    math.log((counts[word] + 1) / total) for word in words)
+            best = max(scores, key=scores.get)
+            norm = sum(math.exp(score - scores[best]) for score in scores.values())
+            results.append((best, 1 / norm))
+        return results
+
+
+class SklearnModel:
+    """
+    TF-IDF over words and word pairs with a multinomial logistic regression.
+    """
+    calibrated = True
+
+    def __init__(self):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.pipeline import make_pipeline
+
+        self.pipeline = make_pipeline(
+            TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, min_df=1, max_features=50000),
+            LogisticRegression(max_iter=1000, C=5.0),
+        )
+
+    def fit(self, texts: list, labels: list):
+        self.pipeline.fit(texts, labels)
+        self.classes = list(self.pipeline.classes_)
+        return self
+
+    def predict(self, texts: list) -> list:
+        results = []
+        for row in self.pipeline.predict_proba(texts):
+            best = max(range(len(row)), key=row.__getitem__)
+            results.append((self.classes[best], float(row[best])))
+        return results
+
+
+def make_model():
+    try:
+        return SklearnModel()
+    except ImportError:
+        print("scikit-learn is not installed (`pip install scikit-learn`); using naive Bayes for local classification.")
+        return NaiveBayesModel()
+
+
+def load_training_rows(engine, limit: int = LOCAL_TRAIN_MAX_ROWS) -> list:
+    """
+    (text, label) pairs from the newest active content rows with a usable label
+    written by the LLM or by hand.
+    """
+    query = (select(Content.text_content, Content.content_type)
+             .where(Content.is_active.is_(True), Content.content_type.is_not(None),
+                    Content.label_source.is_(None) | Content.label_source.in_(TRAINING_LABEL_SOURCES))
+             .order_by(Content.content_id.desc()).limit(limit))
+    with engine.connect() as conn:
+        rows = conn.execute(query).all()
+    pairs = [(text, normalize_label(label)) for text, label in rows if text]
+    return [(text, label) for text, label in pairs if label]
+
+
+class LocalClassifier:
+    """
+    Rules, then the trained model (if any). A block stays local when the winning
+    confidence reaches `threshold`; everything else is escalated. Local labels
+    are returned as db.models.Label, so the rows they end up in are left out of
+    later training. `rule_confidence` overrides rule_label's confidence per label.
+    """
+
+    def __init__(self, model=None, threshold: float = LOCAL_CLASSIFY_THRESHOLD, rule_confidence: dict = None):
+        self.model = model
+        self.threshold = threshold
+        self.rule_confidence = rule_confidence or {}
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def train(cls, rows: list, threshold: float = LOCAL_CLASSIFY_THRESHOLD):
+        """
+        Fits a model on (text, label) rows (rules only if there are too few rows
+        or labels) and calibrates each rule to its precision on the same rows, so
+        a rule the stored labels disagree with stops deciding on its own.
+        """
+        model = None
+        if len(rows) >= LOCAL_TRAIN_MIN_ROWS and len({label for _, label in rows}) >= 2:
+            model = make_model().fit([model_input(text) for text, _ in rows], [label for _, label in rows])
+        fired, agreed = Counter(), Counter()
+        for text, label in rows:
+            rule = rule_label(text)
+            if rule:
+                fired[rule[0]] += 1
+                agreed[rule[0]] += rule[0] == label
+        rule_confidence = {label: agreed[label] / n for label, n in fired.items() if n >= RULE_MIN_SUPPORT}
+        return cls(model, threshold, rule_confidence)
+
+    def predict(self, texts: list) -> list:
+        """
+        (label, confidence, source) per text; source is "rule" or "model".
+        """
+        results = []
+        for text in texts:
+            rule = rule_label(text)
+            if rule:
+                label, confidence = rule
+                results.append((label, min(confidence, self.rule_confidence.get(label, confidence)), "rule"))
+            else:
+                results.append((None, 0.0, None))
+        pending = [i for i, (_, confidence, _) in enumerate(results) if confidence < self.threshold]
+        if self.model is not None and pending:
+            for i, (label, confidence) in zip(pending, self.model.predict([model_input(texts[i]) for i in pending])):
+                if not self.model.calibrated:
+                    # naive Bayes is overconfident: require it to be nearly certain
+                    confidence = confidence ** 4
+                if confidence > results[i][1]:
+                    results[i] = (label, confidence, "model")
+        return results
+
+    def classify(self, blocks: list, fallback) -> list:
+        """
+        One label per block; blocks below the threshold are labelled by
+        `fallback(list_of_blocks)` (the LLM) in a single call.
+        """
+        predictions = self.predict(blocks)
+        labels = [Label(label, source) if confidence >= self.threshold else None
+                  for label, confidence, source in predictions]
+        escalated = [i for i, label in enumerate(labels) if label is None]
+        if escalated:
+            for i, label in zip(escalated, fallback([blocks[i] for i in escalated])):
+                labels[i] = label
+
+        local = Counter(source for _, confidence, source in predictions if confidence >= self.threshold)
+        with self.lock:
+            self.counts.update(local)
+            self.counts["escalated"] += len(escalated)
+        for source, n in local.items():
+            incr(f"classify.local_{source}", n)
+        incr("classify.escalated", len(escalated))
+        return labels
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = sum(self.counts.values())
+            local = total - self.counts["escalated"]
+            return {"rule": self.counts["rule"], "model": self.counts["model"],
+                    "escalated": self.counts["escalated"],
+                    "saved_fraction": round(local / total, 3) if total else 0.0}
+
+
+_local = None
+_local_lock = threading.Lock()
+
+
+def get_local_classifier(engine=None) -> LocalClassifier:
+    """
+    Returns the process-wide classifier, training it from the content table on first use.
+    """
+    global _local
+    with _local_lock:
+        if _local is None:
+            if engine is None:
+                from db.database import engine
+            try:
+                rows = load_training_rows(engine)
+            except Exception as e:
+                print(f"Local classifier: no training data ({str(e).splitlines()[0]}); using rules only.")
+                rows = []
+            _local = LocalClassifier.train(rows)
+            print(f"🟢 Local classifier ready: {len(rows)} training rows, "
+                  f"{type(_local.model).__name__ if _local.model else 'rules only'}")
+        return _local
+
+
+def evaluate(rows: list, threshold: float = LOCAL_CLASSIFY_THRESHOLD, holdout: float = 0.2, seed: int = 0) -> dict:
+    """
+    Trains on part of `rows` and reports, on the rest, how many blocks would stay
+    local and how accurate those local labels are against the stored ones.
+    """
+    rows = rows[:]
+    random.Random(seed).shuffle(rows)
+    cut = int(len(rows) * (1 - holdout))
+    train, test = rows[:cut], rows[cut:]
+    classifier = LocalClassifier.train(train, threshold)
+    predictions = classifier.predict([text for text, _ in test])
+    local = [(label, truth, source) for (label, confidence, source), (_, truth) in zip(predictions, test)
+             if confidence >= threshold]
+    correct = sum(label == truth for label, truth, _ in local)
+    return {
+        "train_rows": len(train), "test_rows": len(test),
+        "model": type(classifier.model).__name__ if classifier.model else None,
+        "by_rule": sum(source == "rule" for _, _, source in local),
+        "by_model": sum(source == "model" for _, _, source in local),
+        "saved_fraction": round(len(local) / len(test), 3) if test else 0.0,
+        "local_accuracy": round(correct / len(local), 3) if local else None,
+    }
+
+
+def main(argv=None):
+    from db.database import engine
+
+    arg_parser = argparse.ArgumentParser(prog="python -m local_classifier")
+    arg_parser.add_argument("--threshold", type=float, default=LOCAL_CLASSIFY_THRESHOLD)
+    arg_parser.add_argument("--holdout", type=float, default=0.2)
+    args = arg_parser.parse_args(argv)
+
+    report = evaluate(load_training_rows(engine), args.threshold, args.holdout)
+    for key, value in report.items():
+        print(f"{key:>16}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Illustrations from textbook PDFs, kept in a content-addressed store on disk.
+
+extract_media(path) goes through the pages in worker processes, like
+ocr_utils.iter_pages. Every image placed on a page larger than
+MEDIA_MIN_SIZE points is taken as follows:
+- the embedded file is kept as-is when it is a plain PNG or JPEG;
+- anything else (masks, CMYK, JBIG2, inline images) is rendered as a crop
+  of the page at MEDIA_CROP_DPI.
+
+Files are named after the sha256 of their bytes (media/ab/cd/<sha256>.png), so
+a series logo or icon repeated on every page and in every book is stored
+once. Workers write the files themselves and only send back small
+records, so memory stays flat however image-heavy the book is.
+db.ingest.save_media links the records to Content rows by source_page.
+
+Files are shared between books, so they are reference-counted by the Media
+rows pointing at them: collect_garbage deletes the ones no row refers to.
+db.ingest runs it on the files a deleted textbook or replaced media leave
+behind, and jobs.save_markdown sweeps the whole store every MEDIA_GC_INTERVAL_HOURS,
+which also catches uploads that were never saved. A file stored or reused by an
+extraction within MEDIA_GC_MIN_AGE_HOURS is kept, as its rows may not be saved yet.
+
+    python -m media_store book.pdf   # images found, files written, bytes, time
+    python -m media_store --gc       # delete files no Media row refers to
+"""
+import os
+import sys
+import time
+import hashlib
+import argparse
+import tempfile
+import threading
+from itertools import repeat
+
+import fitz
+from sqlalchemy import select
+
+from db.models import Media
+from instrumentation import incr
+from ocr_utils import EXTRACT_WORKERS, EXTRACT_PARALLEL_MIN_PAGES, EXTRACT_MIN_CHUNK_PAGES, process_pool
+
+INGEST_MEDIA = os.getenv("INGEST_MEDIA", "1").lower() not in ("0", "false", "no")  # extract images when ingesting
+MEDIA_DIR = os.getenv("MEDIA_DIR", "media")
+MEDIA_MIN_SIZE = float(os.getenv("MEDIA_MIN_SIZE", "32"))  # points on the page; smaller images are bullets and rules
+MEDIA_MAX_PER_PAGE = int(os.getenv("MEDIA_MAX_PER_PAGE", "20"))
+MEDIA_CROP_DPI = int(os.getenv("MEDIA_CROP_DPI", "150"))
+MEDIA_MAX_PIXELS = int(os.getenv("MEDIA_MAX_PIXELS", str(4 * 1024 * 1024)))  # per rendered crop
+MEDIA_GC_MIN_AGE = float(os.getenv("MEDIA_GC_MIN_AGE_HOURS", "24")) * 3600  # unused files younger than this are kept
+MEDIA_GC_INTERVAL = float(os.getenv("MEDIA_GC_INTERVAL_HOURS", "6")) * 3600  # between full sweeps (sweep_if_due)
+SQL_CHUNK = 500  # bound parameters per IN (...) query
+
+KEEP_FORMATS = {"png", "jpeg", "jpg"}
+
+
+class MediaStore:
+    """
+    Files under `root`, addressed by the sha256 of their bytes.
+    Writes go through a temporary file and a rename, so concurrent workers
+    storing the same image never leave a partial file behind.
+    """
+
+    def __init__(self, root: str = MEDIA_DIR):
+        self.root = root
+
+    def path_for(self, digest: str, extension: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], f"{digest}.{extension}")
+
+    def put(self, data: bytes, extension: str) -> tuple:
+        """
+        Stores `data` unless an identical file is already there.
+        Returns (sha256, path, written).
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path_for(digest, extension)
+        if os.path.exists(path):
+            try:
+                # marks it as in use, so collect_garbage leaves it alone until the rows are saved
+                os.utime(path)
+                return digest, path, False
+            except FileNotFoundError:
+                pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return digest, path, True
+
+
+def image_bytes(pdf, page, xref: int, bbox, dpi: int = MEDIA_CROP_DPI) -> tuple:
+    """
+    (bytes, extension, width, height, kind) for one placed image: the embedded
+    file when it can be used as-is, otherwise a crop of the rendered page.
+    """
+    if xref:
+        image = pdf.extract_image(xref)
+        if image and image.get("ext") in KEEP_FORMATS and not image.get("smask") and image.get("colorspace") in (1, 3):
+            extension = "jpg" if image["ext"] == "jpeg" else image["ext"]
+            return image["image"], extension, image["width"], image["height"], "embedded"
+    # scale down so that huge placements stay under MEDIA_MAX_PIXELS
+    pixels = (bbox.width * dpi / 72) * (bbox.height * dpi / 72)
+    if pixels > MEDIA_MAX_PIXELS:
+        dpi = max(36, int(dpi * (MEDIA_MAX_PIXELS / pixels) ** 0.5))
+    pixmap = page.get_pixmap(clip=bbox, dpi=dpi)
+    return pixmap.tobytes("png"), "png", pixmap.width, pixmap.height, "crop"
+
+
+def extract_page_range_media(path: str, start: int, stop: int, root: str = MEDIA_DIR) -> list:
+    """
+    Worker: stores the images of pages [start, stop) and returns one record per
+    (page, image). An image object reused across pages is only read once.
+    """
+    store = MediaStore(root)
+    records, stored = [], {}
+    with fitz.open(path) as pdf:
+        for index in range(start, stop):
+            page = pdf.load_page(index)
+            placed = 0
+            for info in page.get_image_info(xrefs=True):
+                bbox = fitz.Rect(info["bbox"]) & page.rect
+                if bbox.is_empty or bbox.width < MEDIA_MIN_SIZE or bbox.height < MEDIA_MIN_SIZE:
+                    continue
+                if placed >= MEDIA_MAX_PER_PAGE:
+                    break
+                placed += 1
+                xref = info.get("xref") or 0
+                record = stored.get(xref)
+                if record is None:
+                    try:
+                        data, extension, width, height, kind = image_bytes(pdf, page, xref, bbox)
+                    except Exception as e:
+                        print(f"Image extraction error on page {index + 1}: {str(e)}")
+                        continue
+                    digest, file_path, written = store.put(data, extension)
+                    record = {"file_hash": digest, "image_path": file_path, "width": width, "height": height,
+                              "kind": kind, "bytes": len(data) if written else 0}
+                    if kind == "embedded":
+                        stored[xref] = record
+                else:
+                    record = {**record, "bytes": 0}
+                records.append({**record, "source_page": index + 1, "bbox": [round(v, 1) for v in bbox]})
+    return records
+
+
+def extract_media(file, workers: int = EXTRACT_WORKERS, root: str = MEDIA_DIR) -> list:
+    """
+    Stores every illustration of a PDF (a path) and returns records with
+    source_page, file_hash, image_path, width, height, kind, bbox and bytes
+    (bytes newly written to the store, 0 for a file that was already there).
+    Small files are read serially; larger ones in a process pool.
+    """
+    with fitz.open(file) as pdf:
+        pages = pdf.page_count
+    if workers <= 1 or pages < EXTRACT_PARALLEL_MIN_PAGES:
+        records = extract_page_range_media(file, 0, pages, root)
+    else:
+        chunk = max(EXTRACT_MIN_CHUNK_PAGES, -(-pages // (workers * 4)))
+        starts = list(range(0, pages, chunk))
+        stops = [min(pages, start + chunk) for start in starts]
+        records = []
+        # not forked: this runs on a background thread next to the filter
+        with process_pool(workers) as pool:
+            for part in pool.map(extract_page_range_media, repeat(file), starts, stops, repeat(root)):
+                records.extend(part)
+    incr("media.images", len(records))
+    incr("media.files_written", sum(1 for record in records if record["bytes"]))
+    incr("media.bytes_written", sum(record["bytes"] for record in records))
+    return records
+
+
+_gc_lock = threading.Lock()
+_last_sweep = 0.0
+
+
+def _referenced(engine, paths: dict) -> set:
+    """
+    The subset of `paths` ({path: sha256}) that a Media row refers to, by
+    file_hash or by image_path.
+    """
+    referenced = set()
+    by_hash = {}
+    for path, digest in paths.items():
+        by_hash.setdefault(digest, []).append(path)
+    with engine.connect() as conn:
+        hashes = list(by_hash)
+        for i in range(0, len(hashes), SQL_CHUNK):
+            for (digest,) in conn.execute(select(Media.file_hash).where(Media.file_hash.in_(hashes[i:i + SQL_CHUNK]))
+                                          .distinct()):
+                referenced.update(by_hash[digest])
+        candidates = list(paths)
+        for i in range(0, len(candidates), SQL_CHUNK):
+            referenced.update(conn.execute(select(Media.image_path)
+                                           .where(Media.image_path.in_(candidates[i:i + SQL_CHUNK]))).scalars())
+    return referenced
+
+
+def collect_garbage(engine, paths: list = None, root: str = MEDIA_DIR, min_age: float = MEDIA_GC_MIN_AGE) -> dict:
+    """
+    Deletes store files that no Media row refers to: `paths`, or every file
+    under `root`. Files an extraction stored or reused in the last `min_age`
+    seconds are kept. Returns {"files": ..., "bytes": ...} removed.
+    """
+    if paths is None:
+        paths = [os.path.join(folder, name) for folder, _, names in os.walk(root) for name in names]
+    removed = {"files": 0, "bytes": 0}
+    with _gc_lock:
+        cutoff = time.time() - min_age
+        candidates = {}
+        for path in dict.fromkeys(path for path in paths if path):
+            try:
+                if os.path.getmtime(path) <= cutoff:
+                    candidates[path] = os.path.basename(path).split(".")[0]
+            except FileNotFoundError:
+                continue
+        if not candidates:
+            return removed
+        referenced = _referenced(engine, candidates)
+        for path in candidates:
+            if path in referenced:
+                continue
+            try:
+                # stat again: an extraction may have reused it while the rows were read
+                status = os.stat(path)
+                if status.st_mtime > cutoff:
+                    continue
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            removed["files"] += 1
+            removed["bytes"] += status.st_size
+    return removed
+
+
+def sweep_if_due(engine, root: str = MEDIA_DIR, interval: float = MEDIA_GC_INTERVAL):
+    """
+    collect_garbage over the whole store, at most once per `interval` seconds in
+    this process. Returns its counts, or None when it was not due.
+    """
+    global _last_sweep
+    with _gc_lock:
+        if time.time() - _last_sweep < interval:
+            return None
+        _last_sweep = time.time()
+    return collect_garbage(engine, root=root)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog="python -m media_store", description="Extract the images of a PDF.")
+    arg_parser.add_argument("pdf", nargs="?")
+    arg_parser.add_argument("--media-dir", default=MEDIA_DIR)
+    arg_parser.add_argument("--workers", type=int, default=EXTRACT_WORKERS)
+    arg_parser.add_argument("--gc", action="store_true", help="delete files no Media row refers to")
+    args = arg_parser.parse_args(argv)
+
+    if args.gc:
+        from db.database import init_db, engine
+
+        init_db()
+        removed = collect_garbage(engine, root=args.media_dir)
+        print(f"🧹 Removed {removed['files']} unused files ({removed['bytes'] / 1e6:.1f} MB) from {args.media_dir}")
+        return 0
+    if not args.pdf:
+        arg_parser.error("a PDF is required unless --gc is given")
+
+    start = time.perf_counter()
+    records = extract_media(args.pdf, args.workers, args.media_dir)
+    elapsed = time.perf_counter() - start
+    unique = {record["file_hash"] for record in records}
+    written = [record for record in records if record["bytes"]]
+    print(f"✅ {len(records)} images on {len({record['source_page'] for record in records})} pages, "
+          f"{len(unique)} distinct, {len(written)} new files ({sum(r['bytes'] for r in written) / 1e6:.1f} MB) "
+          f"in {elapsed:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+import base64
+
+from llm_client import with_retries
+
+
+class OCRBackend:
+    """
+    Turns a rasterized page (PNG bytes) into text.
+    `name` is part of the per-page cache key, so change it when output would change.
+    """
+    name = "base"
+
+    def ocr_image(self, png_bytes: bytes) -> str:
+        raise NotImplementedError
+
+
+class MistralOCRBackend(OCRBackend):
+    """
+    Mistral OCR (`client.ocr.process`) on a single page image.
+    """
+
+    def __init__(self, model: str = "mistral-ocr-latest", client=None):
+        from ocr_utils import get_mistral_client
+
+        self.model = model
+        self.name = f"mistral:{model}"
+        self.client = client or get_mistral_client()
+
+    def ocr_image(self, png_bytes: bytes) -> str:
+        data_url = "data:image/png;base64," + base64.b64encode(png_bytes).decode("ascii")
+        response = with_retries(lambda: self.client.ocr.process(
+            model=self.model,
+            document={"type": "image_url", "image_url": data_url}
+        ))
+        return "\n\n".join(page.markdown for page in response.pages).strip()
+
+
+class TesseractOCRBackend(OCRBackend):
+    """
+    Local stand-in using Tesseract. Needs the optional pytesseract package and
+    the tesseract binary; Pillow is already a requirement.
+    """
+
+    def __init__(self, lang: str = "eng"):
+        try:
+            import pytesseract
+        except ImportError as e:
+            raise ImportError("TesseractOCRBackend requires `pip install pytesseract`") from e
+        self.pytesseract = pytesseract
+        self.lang = lang
+        self.name = f"tesseract:{lang}"
+
+    def ocr_image(self, png_bytes: bytes) -> str:
+        import io
+        from PIL import Image
+
+        with Image.open(io.BytesIO(png_bytes)) as image:
+            return self.pytesseract.image_to_string(image, lang=self.lang).strip()
+
+
+BACKENDS = {
+    "mistral": MistralOCRBackend,
+    "tesseract": TesseractOCRBackend,
+}
+
+
+def get_ocr_backend(backend):
+    """
+    Resolves a backend name ("mistral", "tesseract", "none") or instance.
+    Returns None when OCR is disabled.
+    """
+    if backend is None or isinstance(backend, OCRBackend):
+        return backend
+    if not backend or backend.lower() in ("none", "off", "0"):
+        return None
+    try:
+        return BACKENDS[backend.lower()]()
+    except KeyError:
+        raise ValueError(f"Unknown OCR backend: {backend}")
@@ -1,65 +1,293 @@
 import os
 import fitz
-from mistralai import Mistral
 import re, json
-import time
+import hashlib
+import queue
+import shutil
+import tempfile
 import requests
+import multiprocessing
+from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from itertools import repeat
+
+from llm_cache import cached_complete, cached_stream, get_cache
+from llm_client import get_client
+from ocr_backends import get_ocr_backend
+from instrumentation import stage, incr, propagate
+from local_classifier import LOCAL_CLASSIFIER, get_local_classifier
 
 from dotenv import load_dotenv
 load_dotenv()
 
-MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
+# Chunked filtering (extract_relevant_textbook_content on a list of pages)
+FILTER_WINDOW_TOKENS = int(os.getenv("FILTER_WINDOW_TOKENS", "6000"))
+FILTER_OVERLAP_CHARS = int(os.getenv("FILTER_OVERLAP_CHARS", "600"))
+FILTER_CONCURRENCY = int(os.getenv("FILTER_CONCURRENCY", "4"))
+CHARS_PER_TOKEN = 4
+SPOOL_CHUNK_SIZE = 1024 * 1024
 
-def extract_text(file) -> str:
+# Multi-process page extraction (iter_pages)
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXTRACT_PARALLEL_MIN_PAGES = int(os.getenv("EXTRACT_PARALLEL_MIN_PAGES", "64"))
+EXTRACT_MIN_CHUNK_PAGES = 8
+# Pools are started from Streamlit, job and background threads; forking a
+# process while another thread holds a lock can deadlock the child.
+EXTRACT_START_METHOD = os.getenv("EXTRACT_START_METHOD", "forkserver")
+
+# OCR for pages without a text layer (see ocr_backends)
+OCR_BACKEND = os.getenv("OCR_BACKEND", "mistral")
+OCR_MIN_TEXT_CHARS = int(os.getenv("OCR_MIN_TEXT_CHARS", "20"))
+OCR_DPI = int(os.getenv("OCR_DPI", "150"))
+OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", "4"))
+# Kept verbatim by the filter prompt and picked up by the parser as Content.source_page
+PAGE_MARKER = "<!-- page {} -->"
+
+CONTENT_TYPES = [
+    "poem", "story", "activity", "question", "note", "dialogue", "exercise",
+    "example", "reading_passage", "song", "conversation", "picture_description",
+    "fill_in_the_blanks", "short_answer_question", "multiple_choice_question",
+    "matching", "rhyme",
+]
+
+def get_mistral_client():
     """
-    Extracts raw text from PDF using PyMuPDF.
+    The shared, pooled Mistral client (see llm_client), honouring MISTRAL_SERVER_URL.
+    """
+    return get_client()
+
+@contextmanager
+def spooled_pdf(file):
+    """
+    Yields a filesystem path for `file`. Paths are used as-is; file-like uploads
+    are copied to a temporary file in fixed-size chunks so the PDF is never held
+    in memory as one bytes object.
+    """
+    if isinstance(file, (str, os.PathLike)):
+        yield os.fspath(file)
+        return
+
+    if hasattr(file, "seek"):
+        file.seek(0)
+    tmp = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+    try:
+        with tmp:
+            shutil.copyfileobj(file, tmp, SPOOL_CHUNK_SIZE)
+        yield tmp.name
+    finally:
+        os.unlink(tmp.name)
+
+def resolve_page_range(page_count: int, page_range=None) -> tuple:
+    """
+    Converts an optional 1-based inclusive (first, last) page range into
+    0-based [start, stop) indexes clamped to the document.
+    """
+    if not page_range:
+        return 0, page_count
+    first, last = page_range
+    start = max(0, (first or 1) - 1)
+    stop = page_count if last is None else min(page_count, last)
+    return start, max(start, stop)
+
+def page_text(pdf, index: int):
+    """
+    Text layer of one page (0-based), or None if the page cannot be read.
+    """
+    try:
+        return pdf.load_page(index).get_text()
+    except Exception as e:
+        print(f"PDF Extraction Error on page {index + 1}: {str(e)}")
+        return None
+
+def extract_page_range(path: str, start: int, stop: int) -> list:
+    """
+    Worker for parallel extraction: opens the PDF itself and returns the text of pages [start, stop),
+    None for pages that could not be read.
+    """
+    with fitz.open(path) as pdf:
+        return [page_text(pdf, index) for index in range(start, stop)]
+
+def process_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    A process pool using EXTRACT_START_METHOD ("spawn" where forkserver is not available).
+    """
+    method = EXTRACT_START_METHOD
+    if method not in multiprocessing.get_all_start_methods():
+        method = "spawn"
+    context = multiprocessing.get_context(method)
+    if method == "forkserver":
+        # imported once in the server, so each worker forks with the workers' modules loaded
+        context.set_forkserver_preload(["ocr_utils", "media_store"])
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+def iter_pages_parallel(path: str, start: int, stop: int, workers: int):
+    """
+    Splits [start, stop) into contiguous chunks, extracts them in a process pool
+    and yields (page_number, text) in page order.
+    """
+    chunk = max(EXTRACT_MIN_CHUNK_PAGES, -(-(stop - start) // (workers * 4)))
+    starts = list(range(start, stop, chunk))
+    stops = [min(stop, s + chunk) for s in starts]
+    with process_pool(workers) as pool:
+        for chunk_start, texts in zip(starts, pool.map(extract_page_range, repeat(path), starts, stops)):
+            for offset, text in enumerate(texts):
+                yield chunk_start + offset + 1, text
+
+def ocr_page_image(backend, png_bytes: bytes) -> str:
+    """
+    OCRs one page image, cached by the sha256 of the rendered page.
+    Returns "" if the backend fails so the caller can keep the text layer.
     """
+    cache = get_cache()
+    model = f"ocr:{backend.name}"
+    page_hash = hashlib.sha256(png_bytes).hexdigest()
+    cached = cache.get(model, page_hash)
+    if cached is not None:
+        incr("ocr.cache_hits")
+        return cached
+    incr("ocr.pages")
     try:
-        pdf = fitz.open(stream=file.read(), filetype="pdf")
-        text = "\n".join([page.get_text() for page in pdf])
-        return text.strip()
+        with stage(model):
+            text = backend.ocr_image(png_bytes)
     except Exception as e:
-        print(f"PDF Extraction Error: {str(e)}")
+        incr("ocr.errors")
+        print(f"OCR Error: {str(e)}")
         return ""
+    if text:
+        cache.set(model, page_hash, text)
+    return text
 
-def extract_metadata_from_text(markdown_text: str) -> dict:
+def ocr_sparse_pages(path: str, pages, backend, max_workers: int = OCR_CONCURRENCY):
+    """
+    Passes (page_number, text) pairs through, replacing pages whose text layer has
+    fewer than OCR_MIN_TEXT_CHARS characters with OCR output. Only those pages are
+    rasterized; OCR calls run concurrently with a bounded number in flight and
+    results are yielded in page order.
+    """
+    max_workers = max(1, max_workers)
+    in_flight = deque()
+    ocr_page = propagate(ocr_page_image)
+
+    def resolve(item):
+        number, text, future = item
+        if future is None:
+            return number, text
+        return number, future.result() or text
+
+    with fitz.open(path) as pdf, ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for number, text in pages:
+            future = None
+            if len(text.strip()) < OCR_MIN_TEXT_CHARS:
+                with stage("ocr.render"):
+                    png_bytes = pdf.load_page(number - 1).get_pixmap(dpi=OCR_DPI).tobytes("png")
+                future = pool.submit(ocr_page, backend, png_bytes)
+            in_flight.append((number, text, future))
+            while in_flight and (in_flight[0][2] is None or in_flight[0][2].done()
+                                 or len(in_flight) > 2 * max_workers):
+                yield resolve(in_flight.popleft())
+        while in_flight:
+            yield resolve(in_flight.popleft())
+
+def iter_pages(file, workers: int = EXTRACT_WORKERS, page_range=None, ocr_backend=OCR_BACKEND):
+    """
+    Lazily yields (page_number, text) for each PDF page, 1-based.
+    Serially, only one page is materialised at a time. With workers > 1 and at
+    least EXTRACT_PARALLEL_MIN_PAGES pages, the page range is extracted in a
+    process pool instead; small files stay serial since pool startup would dominate.
+    `page_range` is an optional 1-based inclusive (first, last) tuple.
+    Pages without a usable text layer are OCRed with `ocr_backend`
+    (a name from ocr_backends.BACKENDS, an OCRBackend, or "none").
+    A page that cannot be read is skipped and counted as extract.page_errors;
+    a file that cannot be opened raises.
+    """
+    def extracted(path):
+        with fitz.open(path) as pdf:
+            start, stop = resolve_page_range(pdf.page_count, page_range)
+            if workers <= 1 or stop - start < EXTRACT_PARALLEL_MIN_PAGES:
+                for index in range(start, stop):
+                    yield index + 1, page_text(pdf, index)
+                return
+        yield from iter_pages_parallel(path, start, stop, workers)
+
+    def text_layer(path):
+        for number, text in extracted(path):
+            if text is None:
+                incr("extract.page_errors")
+                continue
+            yield number, text
+
+    with spooled_pdf(file) as path:
+        try:
+            backend = get_ocr_backend(ocr_backend)
+        except ImportError as e:
+            print(f"OCR disabled: {str(e)}")
+            backend = None
+        if backend is None:
+            yield from text_layer(path)
+        else:
+            yield from ocr_sparse_pages(path, text_layer(path), backend)
+
+def head_text(pages, limit: int = 10000) -> str:
+    """
+    Joins page texts from `pages` until `limit` characters are collected.
+    """
+    parts, size = [], 0
+    for _, text in pages:
+        parts.append(text)
+        size += len(text) + 1
+        if size >= limit:
+            break
+    return "\n".join(parts).strip()[:limit]
+
+def extract_pages(file) -> list:
+    """
+    Extracts the text of each PDF page using PyMuPDF, one string per page.
+    """
+    return [text for _, text in iter_pages(file)]
+
+def extract_text(file) -> str:
+    """
+    Extracts raw text from PDF using PyMuPDF.
+    """
+    return "\n".join(text for _, text in iter_pages(file)).strip()
+
+METADATA_FIELDS = ["title", "subject", "grade", "language", "publisher", "year"]
+
+def extract_metadata_from_text(markdown_text: str, fields: list = None, known: dict = None,
+                               limit: int = 10000) -> dict:
     """
     Uses Mistral LLM to extract textbook metadata from OCR text.
+    `fields` narrows the request to those fields (all of METADATA_FIELDS by
+    default) and `known` passes already extracted values along as context;
+    only the first `limit` characters of the text are sent.
     """
-    client = Mistral(api_key=MISTRAL_API_KEY)
+    fields = list(fields or METADATA_FIELDS)
+    client = get_mistral_client()
+    field_list = "\n".join(f"- {field}" for field in fields)
+    template = ",\n".join(f'  "{field}": "..."' for field in fields)
+    known_note = ""
+    if known:
+        known_note = "\nAlready known (use as context, do not repeat): " + json.dumps(known, ensure_ascii=False) + "\n"
     prompt = f"""
 You are an expert at reading school textbooks. Based on the content below, extract the following metadata:
 
-- title
-- subject
-- grade
-- language
-- publisher
-- year
-
+{field_list}
+{known_note}
 Respond ONLY in strict JSON format. Do NOT wrap it in triple backticks or code block.
 
 {{
-  "title": "...",
-  "subject": "...",
-  "grade": "...",
-  "language": "...",
-  "publisher": "...",
-  "year": "..."
+{template}
 }}
 
 OCR Text:
 \"\"\"
-{markdown_text[:10000]}
+{markdown_text[:limit]}
 \"\"\"
     """
 
     try:
-        response = client.chat.complete(
-            model="mistral-small",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        raw = response.choices[0].message.content.strip()
+        raw = cached_complete(client, "mistral-small", prompt)
         print("\n\n🔵 Mistral Metadata Response:\n", raw)
 
         # Robust cleanup of triple backticks and `json`
@@ -70,19 +298,23 @@ OCR Text:
         return json.loads(cleaned)
 
     except Exception as e:
+        incr("metadata.errors")
         print(f"Metadata extraction failed: {str(e)}")
-        return {
-            "title": "", "subject": "", "grade": "",
-            "language": "", "publisher": "", "year": ""
-        }
+        return {field: "" for field in fields}
 
-def extract_relevant_textbook_content(ocr_text: str) -> str:
-    """
-    Filters OCR text using Mistral LLM to retain relevant textbook content in markdown format.
-    """
-    client = Mistral(api_key=MISTRAL_API_KEY)
-    prompt = f"""
+def build_filter_prompt(ocr_text: str, context: str = "") -> str:
+    context_note = ""
+    if context:
+        context_note = f"""
+The text below is one part of a longer book. For reference only, this is the end of the previous part
+(do NOT include it in your output):
+{context}
+
+If this part continues a unit or chapter that started earlier, do not repeat or invent its header; start directly with the content.
+"""
+    return f"""
 You are a helpful assistant extracting educational content from an OCR dump of a textbook.
+{context_note}
 Here is the raw OCR text:
 {ocr_text}
 
@@ -91,29 +323,234 @@ Retain all **useful learning content** starting from the first Unit, Chapter, Le
 Return the filtered content in markdown format, wrapped in ```markdown and ``` delimiters.
 Use # for unit headers (e.g., # Unit 1: Title), ## for chapter headers (e.g., ## Chapter 1: Title), ### for sub-headings.
 Preserve all unit and chapter headers exactly as they appear. Include all content under these headers, including poems, lists, and notes.
+Keep every <!-- page N --> marker line exactly as it is, on its own line, where it appears in the content you keep.
 No extra explanations.
 """
 
+def extract_relevant_textbook_content(ocr_text) -> str:
+    """
+    Filters OCR text using Mistral LLM to retain relevant textbook content in markdown format.
+    Passing page texts instead of one string (a list from extract_pages, or the
+    (page_number, text) iterator from iter_pages) uses the chunked, concurrent mode.
+    """
+    if not isinstance(ocr_text, str):
+        return filter_pages_chunked(ocr_text)
+
+    client = get_mistral_client()
+    prompt = build_filter_prompt(ocr_text)
+
     try:
-        response = client.chat.complete(
-            model="mistral-medium",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        filtered_text = response.choices[0].message.content.strip()
+        filtered_text = cached_complete(client, "mistral-medium", prompt)
         print("\n\n🟢 Mistral Filtered Markdown Response:\n", filtered_text[:1000], "...\n[truncated]")
         return filtered_text
     except Exception as e:
         print(f"LLM Filtering Error: {str(e)}")
         return ocr_text
+
+def make_page_windows(pages, window_tokens: int = FILTER_WINDOW_TOKENS,
+                      overlap_chars: int = FILTER_OVERLAP_CHARS, context: str = ""):
+    """
+    Lazily packs consecutive pages into windows of roughly `window_tokens` tokens.
+    `pages` yields page texts or (page_number, text) pairs. Every page (and every
+    piece of a page too large for one window, cut on line boundaries) is prefixed
+    with a <!-- page N --> marker. Each window carries the last `overlap_chars`
+    characters of the preceding window as read-only context; `context` stands in
+    for the text before the first window (e.g. when only part of a book is filtered).
+    """
+    budget = max(1, window_tokens * CHARS_PER_TOKEN)
+
+    def pieces():
+        for number, page in enumerate(pages, start=1):
+            if isinstance(page, tuple):
+                number, page = page
+            page = page.strip()
+            while page:
+                cut = len(page)
+                if cut > budget:
+                    cut = page.rfind("\n", 0, budget)
+                    cut = cut if cut > 0 else budget
+                yield f"{PAGE_MARKER.format(number)}\n{page[:cut]}"
+                page = page[cut:].strip()
+
+    current, size, previous = [], 0, context
+    for piece in pieces():
+        if current and size + len(piece) > budget:
+            text = "\n".join(current)
+            yield {"text": text, "context": previous[-overlap_chars:] if overlap_chars else ""}
+            current, size, previous = [], 0, text
+        current.append(piece)
+        size += len(piece) + 1
+    if current:
+        yield {"text": "\n".join(current), "context": previous[-overlap_chars:] if overlap_chars else ""}
+
+def strip_markdown_fence(text: str) -> str:
+    text = text.strip()
+    if text.startswith("```markdown"):
+        text = text[len("```markdown"):].strip()
+    elif text.startswith("```"):
+        text = text[3:].strip()
+    if text.endswith("```"):
+        text = text[:-3].strip()
+    return text
+
+class HeaderStitcher:
+    """
+    Line filter used when joining per-window filter output. Unit and chapter
+    headers repeated at a window edge (same unit / chapter number as the one
+    already open) are dropped, as are markdown fence lines, so the parser sees
+    each header once.
+    """
+    unit_pattern = re.compile(r"# Unit\s+(\d+)", re.IGNORECASE)
+    chapter_pattern = re.compile(r"## Chapter\s+(\d+)", re.IGNORECASE)
+
+    def __init__(self):
+        self.current_unit = None
+        self.current_chapter = None
+
+    def keep(self, line: str) -> bool:
+        stripped = line.strip()
+        if stripped in ("```", "```markdown"):
+            return False
+        if not stripped.startswith("#"):
+            return True
+        unit_match = self.unit_pattern.match(stripped)
+        if unit_match:
+            if unit_match.group(1) == self.current_unit:
+                return False
+            self.current_unit, self.current_chapter = unit_match.group(1), None
+            return True
+        chapter_match = self.chapter_pattern.match(stripped)
+        if chapter_match:
+            if chapter_match.group(1) == self.current_chapter:
+                return False
+            self.current_chapter = chapter_match.group(1)
+        return True
+
+def stitch_filtered_chunks(chunks: list) -> str:
+    """
+    Joins per-window filter output into one markdown document (see HeaderStitcher).
+    """
+    stitcher = HeaderStitcher()
+    lines = []
+    for chunk in chunks:
+        lines.extend(line for line in strip_markdown_fence(chunk).splitlines() if stitcher.keep(line))
+        lines.append("")
+
+    return "```markdown\n" + "\n".join(lines).strip() + "\n```"
+
+def filter_pages_chunked(pages, window_tokens: int = FILTER_WINDOW_TOKENS,
+                         overlap_chars: int = FILTER_OVERLAP_CHARS,
+                         max_workers: int = FILTER_CONCURRENCY, context: str = "") -> str:
+    """
+    Map-reduce version of extract_relevant_textbook_content: page windows are
+    filtered concurrently and stitched back together in page order. `pages` is
+    consumed incrementally, with at most 2 * max_workers windows in flight.
+    """
+    client = get_mistral_client()
+    max_workers = max(1, max_workers)
+
+    def filter_window(window: dict) -> str:
+        try:
+            return cached_complete(client, "mistral-medium", build_filter_prompt(window["text"], window["context"]))
+        except Exception as e:
+            print(f"LLM Filtering Error (chunk): {str(e)}")
+            return window["text"]
+
+    chunks, in_flight = [], deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for window in make_page_windows(pages, window_tokens, overlap_chars, context):
+            in_flight.append(pool.submit(propagate(filter_window), window))
+            if len(in_flight) >= 2 * max_workers:
+                chunks.append(in_flight.popleft().result())
+        chunks.extend(future.result() for future in in_flight)
+
+    if not chunks:
+        return ""
+    filtered_text = stitch_filtered_chunks(chunks)
+    print(f"\n\n🟢 Filtered {len(chunks)} windows concurrently:\n", filtered_text[:1000], "...\n[truncated]")
+    return filtered_text
     
-# ocr_utils.py
-def classify_content_type(text_block: str) -> str:
+def stream_relevant_textbook_content(ocr_text):
     """
-    Uses Mistral LLM to classify the content type from a block of textbook content.
+    Streaming version of extract_relevant_textbook_content: yields markdown text
+    fragments as Mistral generates them, so parsing can start before the
+    completion finishes. Accepts the same inputs (one string or page texts).
     """
-    client = Mistral(api_key=MISTRAL_API_KEY)
+    if not isinstance(ocr_text, str):
+        yield from stream_filtered_pages(ocr_text)
+        return
 
-    prompt = f"""
+    client = get_mistral_client()
+    produced = False
+    try:
+        for fragment in cached_stream(client, "mistral-medium", build_filter_prompt(ocr_text)):
+            produced = True
+            yield fragment
+    except Exception as e:
+        print(f"LLM Filtering Error: {str(e)}")
+        if not produced:
+            yield ocr_text
+
+def stream_filtered_pages(pages, window_tokens: int = FILTER_WINDOW_TOKENS,
+                          overlap_chars: int = FILTER_OVERLAP_CHARS,
+                          max_workers: int = FILTER_CONCURRENCY):
+    """
+    Streams the chunked filter: windows are filtered concurrently, the earliest
+    unfinished window is relayed token by token, and later windows are buffered
+    until their turn. Yields whole lines with repeated headers removed.
+    """
+    client = get_mistral_client()
+    max_workers = max(1, max_workers)
+    stitcher = HeaderStitcher()
+
+    def stream_window(window: dict, fragments: queue.Queue):
+        produced = False
+        try:
+            prompt = build_filter_prompt(window["text"], window["context"])
+            for fragment in cached_stream(client, "mistral-medium", prompt):
+                produced = True
+                fragments.put(fragment)
+        except Exception as e:
+            print(f"LLM Filtering Error (chunk): {str(e)}")
+            if not produced:
+                fragments.put(window["text"])
+        finally:
+            fragments.put(None)
+
+    def relay(fragments: queue.Queue):
+        buffer = ""
+        while True:
+            fragment = fragments.get()
+            if fragment is None:
+                break
+            buffer += fragment
+            if "\n" in buffer:
+                complete, buffer = buffer.rsplit("\n", 1)
+                for line in complete.split("\n"):
+                    if stitcher.keep(line):
+                        yield line + "\n"
+        for line in buffer.split("\n"):
+            if stitcher.keep(line):
+                yield line + "\n"
+        yield "\n"
+
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for window in make_page_windows(pages, window_tokens, overlap_chars):
+            fragments = queue.Queue()
+            pool.submit(propagate(stream_window), window, fragments)
+            in_flight.append(fragments)
+            if len(in_flight) >= 2 * max_workers:
+                yield from relay(in_flight.popleft())
+        while in_flight:
+            yield from relay(in_flight.popleft())
+
+# ocr_utils.py
+def build_classification_prompt(text_block: str) -> str:
+    """
+    Single-block classification prompt. Also used as the cache key for per-block labels.
+    """
+    return f"""
 You are an expert classifier of content blocks from Indian school textbooks (Grades 1–5).
 Your task is to assign a single most appropriate content type label from the list below to a given block of text.
 
@@ -134,26 +571,28 @@ Here is the content block:
 Now classify it and return the label.
 """
 
-    retries = 3
-    delay = 10
-
-    for attempt in range(retries):
-        try:
-            response = client.chat.complete(
-                model="mistral-small",
-                messages=[{"role": "user", "content": prompt}]
-            )
+def classify_content_type(text_block: str) -> str:
+    """
+    Classifies a block of textbook content, locally when the local classifier
+    is confident and with the Mistral LLM otherwise.
+    """
+    if not LOCAL_CLASSIFIER:
+        return classify_content_type_llm(text_block)
+    return get_local_classifier().classify([text_block], lambda blocks: [classify_content_type_llm(blocks[0])])[0]
 
-            if response.choices and response.choices[0].message:
-                return response.choices[0].message.content.strip().lower()
+def classify_content_type_llm(text_block: str) -> str:
+    """
+    Uses Mistral LLM to classify the content type from a block of textbook content.
+    """
+    client = get_mistral_client()
+    prompt = build_classification_prompt(text_block)
 
-        except Exception as e:
-            if "429" in str(e):
-                print("Rate limit hit. Retrying...")
-                time.sleep(delay)
-                delay *= 2  # exponential backoff
-            else:
-                print(f"Content type classification error: {str(e)}")
-                break
+    # rate limits and transient failures are retried inside llm_client
+    try:
+        label = cached_complete(client, "mistral-small", prompt)
+        if label:
+            return label.lower()
+    except Exception as e:
+        print(f"Content type classification error: {str(e)}")
 
     return "unknown"
@@ -0,0 +1,48 @@
+import streamlit as st
+from sqlalchemy import select
+from db.database import init_db, SessionLocal
+from db.models import Textbook
+from db.search import search_content, count_matches
+from ocr_utils import CONTENT_TYPES
+
+
+@st.cache_resource
+def setup_db():
+    # once per server process, not on every rerun
+    init_db()
+
+
+setup_db()
+
+st.title("🔎 Search Textbooks")
+
+db = SessionLocal()
+try:
+    grades = sorted({g for g in db.execute(select(Textbook.grade).distinct()).scalars() if g})
+    subjects = sorted({s for s in db.execute(select(Textbook.subject).distinct()).scalars() if s})
+
+    query = st.text_input("Search content", placeholder="hands clap")
+    prefix = st.checkbox("Match word prefixes", help="Also match words that start with the last search word")
+    col1, col2, col3 = st.columns(3)
+    content_type = col1.selectbox("Content type", ["Any"] + CONTENT_TYPES)
+    grade = col2.selectbox("Grade", ["Any"] + grades)
+    subject = col3.selectbox("Subject", ["Any"] + subjects)
+
+    filters = {
+        "content_type": None if content_type == "Any" else content_type,
+        "grade": None if grade == "Any" else grade,
+        "subject": None if subject == "Any" else subject,
+    }
+    if query or any(filters.values()):
+        results = search_content(db, query, limit=50, prefix=prefix, **filters)
+        matches = count_matches(db, query, prefix=prefix, **filters)
+        st.caption(f"{matches if matches <= 1000 else '1000+'} matches")
+        for hit in results:
+            st.markdown(f"**{hit['title']}** · Grade {hit['grade']} · {hit['subject']} · "
+                        f"{hit['chapter_title']} · `{hit['content_type']}`"
+                        + (f" · p. {hit['source_page']}" if hit["source_page"] else ""))
+            st.markdown(hit["snippet"])
+            with st.expander(hit["activity_description"] or "Full text"):
+                st.text(hit["text_content"])
+finally:
+    db.close()
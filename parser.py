@@ -1,100 +1,271 @@
+import os
 import re
 import logging
 
 logger = logging.getLogger(__name__)
 
-def parse_markdown_to_units(markdown_text):
+# Set to a path (e.g. filtered_markdown.txt) to dump every parsed input for debugging.
+PARSER_DEBUG_DUMP = os.getenv("PARSER_DEBUG_DUMP") or None
+
+UNIT_PATTERN = re.compile(r"# Unit\s+(\d+)\s*[:\-\.]?\s*(.*)", re.IGNORECASE)
+CHAPTER_PATTERN = re.compile(r"## Chapter\s+(\d+)\s*[:\-\.]?\s*(.*)", re.IGNORECASE)
+HEADING_PATTERN = re.compile(r"###\s+(.*)")
+PAGE_PATTERN = re.compile(r"<!--\s*page\s+(\d+)\s*-->", re.IGNORECASE)
+
+# Line starts that open a new sub-block (see split_mixed_block). Lines starting
+# with ** or ## are checked separately via SUB_BLOCK_MARKUP.
+SUB_BLOCK_PHRASES = [
+    "Note to the teacher", "New words", "Sight words", "Letter sounds", "Washing hands",
+    "My hand", "Now compare", "Draw attention", "Let the students", "Provide regular", "Teacher:",
+]
+SUB_BLOCK_START = re.compile(r"[A-Z]\.|" + "|".join(re.escape(p) for p in SUB_BLOCK_PHRASES))
+# "#**" turns into "###" once ** is read as ##, so it opens a sub-block too.
+SUB_BLOCK_MARKUP = ("**", "##", "#**")
+SPLIT_PATTERN = re.compile(
+    r"(?=^##|\n##|\n\s*[A-Z]\.|" + "|".join(r"\n\s*" + re.escape(p) for p in SUB_BLOCK_PHRASES) + ")"
+)
+
+UNIT, CHAPTER, HEADING, PAGE, TEXT = range(5)
+
+
+def normalize_markup(line: str) -> str:
+    """
+    The ** -> ## -> ** round trip split_mixed_block applies to its output,
+    which only changes lines that contain a #.
+    """
+    if "#" in line:
+        return line.replace("**", "##").replace("##", "**")
+    return line
+
+
+def tokenize_markdown(markdown_text):
+    """
+    Single pass over the lines of filtered markdown, dispatching on the first
+    character so plain text lines never touch a header regex.
+    Yields (kind, value, starts_sub_block) where value is the regex match for
+    headers and page markers and the stripped line for TEXT.
+    """
+    return tokenize_lines(markdown_text.splitlines())
+
+
+def tokenize_lines(lines):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        first = line[0]
+        if first == "<":
+            page_match = PAGE_PATTERN.match(line)
+            if page_match:
+                yield PAGE, page_match, False
+                line = line[page_match.end():].strip()
+                if not line:
+                    continue
+                first = line[0]
+
+        if first == "#":
+            match = UNIT_PATTERN.match(line)
+            if match:
+                yield UNIT, match, False
+                continue
+            match = CHAPTER_PATTERN.match(line)
+            if match:
+                yield CHAPTER, match, False
+                continue
+            match = HEADING_PATTERN.match(line)
+            if match:
+                yield HEADING, match, False
+                continue
+
+        yield TEXT, line, line.startswith(SUB_BLOCK_MARKUP) or SUB_BLOCK_START.match(line) is not None
+
+
+def parse_markdown_to_units(markdown_text, with_sub_blocks=False, dump_path=PARSER_DEBUG_DUMP):
     """
     Splits markdown text into units (chapters/lessons), extracting headers.
     Returns a list of dicts: {unit_number, unit_title, content}
+    With with_sub_blocks=True every content block also carries "sub_blocks",
+    identical to split_mixed_block(block["content"]) but found in the same pass.
+    The input is only written to `dump_path` (PARSER_DEBUG_DUMP) when one is set.
     """
-    # Save markdown_text to a file for debugging
-    with open("filtered_markdown.txt", "w", encoding="utf-8") as f:
-        f.write(markdown_text)
-    logger.debug("Saved filtered markdown to filtered_markdown.txt")
+    if dump_path:
+        with open(dump_path, "w", encoding="utf-8") as f:
+            f.write(markdown_text)
+        logger.debug("Saved filtered markdown to %s", dump_path)
 
+    return parse_units(markdown_text, with_sub_blocks)
+
+
+def strip_fences(markdown_text: str) -> str:
     markdown_text = markdown_text.strip()
     if markdown_text.startswith("```markdown"):
         markdown_text = markdown_text[len("```markdown"):].strip()
     if markdown_text.endswith("```"):
         markdown_text = markdown_text[:-3].strip()
+    return markdown_text
+
 
-    # Updated regex to match various header formats
-    unit_pattern = re.compile(r"# Unit\s+(\d+)\s*[:\-\.]?\s*(.*)", re.IGNORECASE)
-    chapter_pattern = re.compile(r"## Chapter\s+(\d+)\s*[:\-\.]?\s*(.*)", re.IGNORECASE)
-    heading_pattern = re.compile(r"###\s+(.*)")
+def parse_units(markdown_text, with_sub_blocks=False):
+    """
+    Builds the unit/chapter/heading tree from tokenize_markdown output.
+    """
+    builder = UnitTreeBuilder(with_sub_blocks)
+    for token in tokenize_markdown(strip_fences(markdown_text)):
+        builder.add(*token)
+    return builder.finish()
+
+
+class UnitTreeBuilder:
+    """
+    Turns tokens into the unit/chapter/block tree. Finished blocks and chapters
+    are reported through the optional on_block(unit, chapter, block) and
+    on_chapter(unit, chapter) callbacks as soon as the next header closes them.
+    """
 
-    units = []
-    current_unit = None
-    current_chapter = None
-    current_heading = None
-    current_content_lines = []
+    def __init__(self, with_sub_blocks=False, on_block=None, on_chapter=None):
+        self.with_sub_blocks = with_sub_blocks
+        self.on_block = on_block
+        self.on_chapter = on_chapter
+        self.units = []
+        self.current_unit = None
+        self.current_chapter = None
+        self.current_heading = None
+        self.current_content_lines = []
+        self.sub_block_starts = []
+        self.current_page = None
+        self.block_page = None
 
-    def save_block():
-        if current_heading and current_content_lines:
+    def save_block(self):
+        if self.current_heading and self.current_content_lines:
             block = {
-                "heading": current_heading,
-                "content": "\n".join(current_content_lines).strip()
+                "heading": self.current_heading,
+                "content": "\n".join(self.current_content_lines),
+                "source_page": self.block_page
             }
-            current_chapter["content_blocks"].append(block)
+            if self.with_sub_blocks:
+                bounds = self.sub_block_starts + [len(self.current_content_lines)]
+                lines = [normalize_markup(line) for line in self.current_content_lines]
+                block["sub_blocks"] = ["\n".join(lines[start:end]) for start, end in zip(bounds, bounds[1:])]
+            self.current_chapter["content_blocks"].append(block)
+            if self.on_block:
+                self.on_block(self.current_unit, self.current_chapter, block)
 
-    for line in markdown_text.splitlines():
-        line = line.strip()
-        if not line:
-            continue
+    def close_chapter(self):
+        if self.current_unit is None:
+            # a chapter before the first "# Unit" header has no unit to go in
+            logger.warning("Dropped chapter %r: it comes before the first unit header",
+                           self.current_chapter.get("chapter_title"))
+            return
+        self.current_unit["chapters"].append(self.current_chapter)
+        if self.on_chapter:
+            self.on_chapter(self.current_unit, self.current_chapter)
 
-        unit_match = unit_pattern.match(line)
-        chapter_match = chapter_pattern.match(line)
-        heading_match = heading_pattern.match(line)
+    def add(self, kind, value, starts_sub_block=False):
+        if kind == TEXT:
+            if starts_sub_block or not self.current_content_lines:
+                self.sub_block_starts.append(len(self.current_content_lines))
+            self.current_content_lines.append(value)
+            return
 
-        if unit_match:
+        if kind == PAGE:
+            self.current_page = int(value.group(1))
+            if not self.current_content_lines:
+                self.block_page = self.current_page
+            return
+
+        if kind == UNIT:
             # Save previous heading
-            if current_chapter:
-                save_block()
-            if current_unit:
-                if current_chapter:
-                    current_unit["chapters"].append(current_chapter)
-                units.append(current_unit)
+            if self.current_chapter:
+                self.save_block()
+                self.close_chapter()
+            if self.current_unit:
+                self.units.append(self.current_unit)
 
             # Start new unit
-            current_unit = {
-                "unit_number": int(unit_match.group(1)),
-                "unit_title": unit_match.group(2).strip(),
+            self.current_unit = {
+                "unit_number": int(value.group(1)),
+                "unit_title": value.group(2).strip(),
                 "chapters": []
             }
-            current_chapter = None
-            current_heading = None
-            current_content_lines = []
-
-        elif chapter_match:
-            if current_chapter:
-                save_block()
-                current_unit["chapters"].append(current_chapter)
-
-            current_chapter = {
-                "chapter_number": int(chapter_match.group(1)),
-                "chapter_title": chapter_match.group(2).strip(),
+            self.current_chapter = None
+            self.current_heading = None
+
+        elif kind == CHAPTER:
+            if self.current_chapter:
+                self.save_block()
+                self.close_chapter()
+
+            self.current_chapter = {
+                "chapter_number": int(value.group(1)),
+                "chapter_title": value.group(2).strip(),
                 "content_blocks": []
             }
-            current_heading = None
-            current_content_lines = []
+            self.current_heading = None
 
-        elif heading_match:
-            save_block()
-            current_heading = heading_match.group(1).strip()
-            current_content_lines = []
+        elif kind == HEADING:
+            self.save_block()
+            self.current_heading = value.group(1).strip()
+            self.block_page = self.current_page
 
-        else:
-            current_content_lines.append(line)
+        self.current_content_lines = []
+        self.sub_block_starts = []
 
-    # Save last parts
-    if current_chapter:
-        save_block()
-        current_unit["chapters"].append(current_chapter)
-    if current_unit:
-        units.append(current_unit)
+    def finish(self) -> list:
+        # Save last parts
+        if self.current_chapter:
+            self.save_block()
+            self.close_chapter()
+        if self.current_unit:
+            self.units.append(self.current_unit)
+        return self.units
+
+
+class IncrementalMarkdownParser:
+    """
+    Parses filtered markdown as it streams in. feed() takes arbitrary text
+    fragments (e.g. LLM tokens) and returns the events completed so far:
+    ("block", unit, chapter, block) when the next header closes a block and
+    ("chapter", unit, chapter) when a chapter is closed. close() flushes the
+    rest and returns the final events; the full tree is then in `units`.
+    """
+
+    def __init__(self, with_sub_blocks=True):
+        self.buffer = ""
+        self.events = []
+        self.builder = UnitTreeBuilder(
+            with_sub_blocks,
+            on_block=lambda unit, chapter, block: self.events.append(("block", unit, chapter, block)),
+            on_chapter=lambda unit, chapter: self.events.append(("chapter", unit, chapter)),
+        )
+
+    @property
+    def units(self) -> list:
+        return self.builder.units
+
+    def _add_lines(self, lines):
+        lines = [line for line in lines if line.strip() not in ("```", "```markdown")]
+        for token in tokenize_lines(lines):
+            self.builder.add(*token)
+
+    def _drain(self) -> list:
+        events, self.events = self.events, []
+        return events
+
+    def feed(self, text: str) -> list:
+        self.buffer += text
+        if "\n" in self.buffer:
+            complete, self.buffer = self.buffer.rsplit("\n", 1)
+            self._add_lines(complete.split("\n"))
+        return self._drain()
+
+    def close(self) -> list:
+        if self.buffer:
+            self._add_lines([self.buffer])
+            self.buffer = ""
+        self.builder.finish()
+        return self._drain()
 
-    return units
 
 def split_mixed_block(content: str) -> list:
     """
@@ -110,8 +281,5 @@ def split_mixed_block(content: str) -> list:
     content = content.replace("**", "##")
 
     # Split at headings, section labels (like ##A.), or note blocks
-    split_pattern = r'(?=^##|\n##|\n\s*[A-Z]\.|\n\s*Note to the teacher|\n\s*New words|\n\s*Sight words|\n\s*Letter sounds|\n\s*Washing hands|\n\s*My hand|\n\s*Now compare|\n\s*Draw attention|\n\s*Let the students|\n\s*Provide regular|\n\s*Teacher:)'
-
-    blocks = re.split(split_pattern, content)
+    blocks = SPLIT_PATTERN.split(content)
     return [b.strip().replace("##", "**") for b in blocks if b.strip()]
-
@@ -0,0 +1,237 @@
+"""
+Textbook metadata (title, subject, grade, language, publisher, year) read
+locally from the PDF, with the LLM only for what is left.
+
+Local sources, each value with a confidence:
+- the PDF's own metadata (title, author, subject, creation date)
+- the cover: the lines set in the largest font on the first text page
+- the opening pages (and the last one), where the imprint sits:
+  "© 2019 ...", "First Edition: June 2019", "Published by ...", "Class III"
+- the script of that text for the language
+
+Fields that stay empty or below METADATA_MIN_CONFIDENCE go to
+ocr_utils.extract_metadata_from_text in one prompt that asks for just those
+fields, with the local values as context. Most books need no LLM call at all.
+
+    python -m pdf_metadata book.pdf   # local values with their source and confidence
+"""
+import os
+import re
+import sys
+import json
+import argparse
+from collections import Counter
+
+import fitz
+
+from instrumentation import incr
+from ocr_utils import iter_pages, head_text, extract_metadata_from_text, METADATA_FIELDS
+
+METADATA_MIN_CONFIDENCE = float(os.getenv("METADATA_MIN_CONFIDENCE", "0.6"))
+METADATA_LOCAL_PAGES = int(os.getenv("METADATA_LOCAL_PAGES", "6"))  # opening pages searched for the imprint
+METADATA_LLM_CHARS = int(os.getenv("METADATA_LLM_CHARS", "4000"))  # text sent when the LLM fills gaps
+
+SUBJECTS = [
+    ("Environmental Studies", r"environmental\s+studies|\bevs\b|पर्यावरण"),
+    ("Social Science", r"social\s+(?:science|studies)|सामाजिक"),
+    ("Mathematics", r"\bmath(?:s|ematics)?\b|गणित"),
+    ("Science", r"\bscience\b|विज्ञान"),
+    ("English", r"\benglish\b"),
+    ("Hindi", r"\bhindi\b|हिंदी|हिन्दी"),
+    ("Sanskrit", r"\bsanskrit\b|संस्कृत"),
+    ("Kannada", r"\bkannada\b|ಕನ್ನಡ"),
+    ("Marathi", r"\bmarathi\b|मराठी"),
+    ("Urdu", r"\burdu\b"),
+    ("History", r"\bhistory\b|इतिहास"),
+    ("Geography", r"\bgeography\b|भूगोल"),
+    ("Computer Science", r"\bcomputer\s+(?:science|studies)\b"),
+]
+LANGUAGE_SUBJECTS = {"English", "Hindi", "Sanskrit", "Kannada", "Marathi", "Urdu"}
+
+# Unicode blocks of the scripts Indian textbooks are printed in
+SCRIPTS = [
+    ("Hindi", 0x0900, 0x097F), ("Bengali", 0x0980, 0x09FF), ("Punjabi", 0x0A00, 0x0A7F),
+    ("Gujarati", 0x0A80, 0x0AFF), ("Odia", 0x0B00, 0x0B7F), ("Tamil", 0x0B80, 0x0BFF),
+    ("Telugu", 0x0C00, 0x0C7F), ("Kannada", 0x0C80, 0x0CFF), ("Malayalam", 0x0D00, 0x0D7F),
+    ("Urdu", 0x0600, 0x06FF),
+]
+
+ROMAN = {"I": 1, "II": 2, "III": 3, "IV": 4, "V": 5, "VI": 6, "VII": 7, "VIII": 8, "IX": 9, "X": 10, "XI": 11,
+         "XII": 12}
+GRADE_PATTERN = re.compile(r"\b(?:class|grade|std\.?|standard)\s*[-:]?\s*(1[0-2]|[1-9]|XII|XI|IX|X|VI{0,3}|IV|I{1,3})\b"
+                           r"|कक्षा\s*[-:]?\s*(1[0-2]|[1-9]|[१-९])", re.IGNORECASE)
+YEAR_PATTERN = re.compile(r"(?:edition|reprint(?:ed)?|published|©|\(c\)|copyright)[^\n\d]{0,40}((?:19|20)\d{2})",
+                          re.IGNORECASE)
+PUBLISHED_BY_PATTERN = re.compile(r"(?:published|printed and published)\s+by\s*[:\-]?\s*([^\n,;]{3,100})",
+                                  re.IGNORECASE)
+COPYRIGHT_PATTERN = re.compile(r"(?:©|\(c\)|copyright)\s*(?:©\s*)?(?:(?:19|20)\d{2}\s*[,.]?\s*)?(?:by\s+)?"
+                               r"([A-Zऀ-ॿ][^\n,;]{2,80})", re.IGNORECASE)
+JUNK_TITLE_PATTERN = re.compile(r"^(?:untitled|microsoft word|document\d*|title)\b|\.(?:docx?|pdf|indd|qxd|p65)\b"
+                                r"|^\W*$", re.IGNORECASE)
+
+
+def _clean(value: str) -> str:
+    return re.sub(r"\s+", " ", value or "").strip(" .,:;-–|")
+
+
+def _grade(match) -> str:
+    value = match.group(1) or match.group(2)
+    if value.upper() in ROMAN:
+        return str(ROMAN[value.upper()])
+    return str(int(value.translate(str.maketrans("०१२३४५६७८९", "0123456789"))))
+
+
+def cover_title(page) -> tuple:
+    """
+    (title, confidence) from the lines set in the largest font on a page.
+    Confidence is higher when that font clearly stands out from the body text.
+    """
+    lines = []
+    for block in page.get_text("dict")["blocks"]:
+        for line in block.get("lines", []):
+            spans = [span for span in line["spans"] if span["text"].strip()]
+            if spans:
+                lines.append((max(span["size"] for span in spans), "".join(span["text"] for span in spans)))
+    if not lines:
+        return "", 0.0
+    sizes = Counter()
+    for size, text in lines:
+        sizes[round(size)] += len(text)
+    body = sizes.most_common(1)[0][0]
+    largest = max(size for size, _ in lines)
+    title = _clean(" ".join(text for size, text in lines if size >= largest * 0.85))[:150]
+    if len(title) < 3:
+        return "", 0.0
+    return title, 0.85 if largest >= body * 1.3 else 0.5
+
+
+def local_metadata(path: str, pages: int = METADATA_LOCAL_PAGES) -> dict:
+    """
+    {field: (value, confidence, source)} for the fields found locally.
+    Only the text layer is read; scanned pages contribute nothing.
+    """
+    found = {}
+
+    def offer(field, value, confidence, source):
+        value = _clean(str(value))
+        if value and confidence > found.get(field, ("", 0.0, ""))[1]:
+            found[field] = (value, confidence, source)
+
+    with fitz.open(path) as pdf:
+        info = pdf.metadata or {}
+        if not JUNK_TITLE_PATTERN.search(_clean(info.get("title"))):
+            offer("title", info.get("title"), 0.6, "pdf")
+        offer("publisher", info.get("author"), 0.4, "pdf")
+        year = re.match(r"D:((?:19|20)\d{2})", info.get("creationDate") or "")
+        if year:
+            offer("year", year.group(1), 0.4, "pdf")  # when the file was made, not the edition
+
+        numbers = list(range(min(pages, pdf.page_count)))
+        if pdf.page_count > pages:
+            numbers.append(pdf.page_count - 1)
+        texts = {number: pdf.load_page(number).get_text() for number in numbers}
+        cover = next((number for number in numbers if texts[number].strip()), None)
+        if cover is not None:
+            title, confidence = cover_title(pdf.load_page(cover))
+            pdf_title = found.get("title", ("",))[0].lower()
+            if title and pdf_title and (title.lower() in pdf_title or pdf_title in title.lower()):
+                confidence = 0.95  # the file and the cover agree
+            offer("title", title, confidence, "cover")
+
+    text = "\n".join(texts[number] for number in numbers)
+    cover_text = texts.get(cover, "") if cover is not None else ""
+    for source, body, confidence in (("cover", cover_text, 0.85), ("imprint", text, 0.75)):
+        match = GRADE_PATTERN.search(body)
+        if match:
+            offer("grade", _grade(match), confidence, source)
+        for subject, pattern in SUBJECTS:
+            if re.search(pattern, body, re.IGNORECASE):
+                offer("subject", subject, confidence, source)
+                break
+    subject = found.get("subject", ("", 0.0, ""))[0]
+    if not subject:
+        for candidate, pattern in SUBJECTS:
+            if re.search(pattern, info.get("subject") or "", re.IGNORECASE):
+                offer("subject", candidate, 0.7, "pdf")
+                break
+
+    years = [int(match.group(1)) for match in YEAR_PATTERN.finditer(text)]
+    if years:
+        offer("year", max(years), 0.85, "imprint")  # a reprint year describes this copy
+    match = PUBLISHED_BY_PATTERN.search(text)
+    if match:
+        offer("publisher", match.group(1), 0.85, "imprint")
+    for match in COPYRIGHT_PATTERN.finditer(text):
+        if not match.group(1).lower().startswith(("all rights", "reserved")):
+            offer("publisher", match.group(1), 0.7, "imprint")
+            break
+
+    subject = found.get("subject", ("", 0.0, ""))
+    if subject[0] in LANGUAGE_SUBJECTS:
+        offer("language", subject[0], min(0.9, subject[1]), "subject")
+    letters = Counter()
+    for char in text:
+        code = ord(char)
+        if char.isascii():
+            if char.isalpha():
+                letters["English"] += 1
+            continue
+        for language, first, last in SCRIPTS:
+            if first <= code <= last:
+                letters[language] += 1
+                break
+    if letters:
+        language, count = letters.most_common(1)[0]
+        offer("language", language, 0.8 if count >= 0.7 * sum(letters.values()) else 0.5, "script")
+    return found
+
+
+def extract_pdf_metadata(path: str, use_llm: bool = True) -> dict:
+    """
+    Metadata for a PDF in the shape of extract_metadata_from_text. Fields found
+    locally with enough confidence are kept; the rest are asked of the LLM in
+    one call, sending at most METADATA_LLM_CHARS of the opening text.
+    """
+    try:
+        found = local_metadata(path)
+    except Exception as e:
+        print(f"Local metadata extraction failed: {str(e)}")
+        found = {}
+    metadata = {field: found[field][0] if field in found else "" for field in METADATA_FIELDS}
+    missing = [field for field in METADATA_FIELDS
+               if field not in found or found[field][1] < METADATA_MIN_CONFIDENCE]
+    incr("metadata.local_fields", len(METADATA_FIELDS) - len(missing))
+    if not missing or not use_llm:
+        return metadata
+
+    incr("metadata.llm_fields", len(missing))
+    known = {field: metadata[field] for field in METADATA_FIELDS if field not in missing}
+    # only the opening pages, read serially: a process pool over the whole book
+    # would extract (and OCR) every page before returning
+    head = head_text(iter_pages(path, workers=1, page_range=(1, METADATA_LOCAL_PAGES)), METADATA_LLM_CHARS)
+    answer = extract_metadata_from_text(head, missing, known, limit=METADATA_LLM_CHARS)
+    for field in missing:
+        value = answer.get(field)
+        if value not in (None, "", "..."):
+            metadata[field] = value
+    return metadata
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog="python -m pdf_metadata", description="Extract textbook metadata.")
+    arg_parser.add_argument("pdf")
+    arg_parser.add_argument("--llm", action="store_true", help="also ask the LLM for missing fields")
+    args = arg_parser.parse_args(argv)
+
+    found = local_metadata(args.pdf)
+    for field in METADATA_FIELDS:
+        value, confidence, source = found.get(field, ("", 0.0, "-"))
+        flag = "" if confidence >= METADATA_MIN_CONFIDENCE else "  (to LLM)"
+        print(f"{field:<10} {confidence:.2f} {source:<8} {value}{flag}")
+    if args.llm:
+        print(json.dumps(extract_pdf_metadata(args.pdf), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,390 @@
+import os
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from classification import classify_blocks
+from instrumentation import stage, incr, timed_iter, propagate
+from db.ingest import (save_textbook, TextbookWriter, sync_textbook, load_page_hashes, save_page_hashes,
+                       save_media, content_hash, delete_textbook)
+from db.near_duplicates import near_duplicate_classifier
+from ocr_utils import (spooled_pdf, iter_pages, extract_relevant_textbook_content, stream_relevant_textbook_content,
+                       filter_pages_chunked, build_filter_prompt, strip_markdown_fence, stitch_filtered_chunks,
+                       FILTER_CONCURRENCY, FILTER_OVERLAP_CHARS, METADATA_FIELDS)
+from pdf_metadata import extract_pdf_metadata
+from media_store import extract_media, INGEST_MEDIA
+from parser import parse_markdown_to_units, split_mixed_block, IncrementalMarkdownParser, PAGE_PATTERN
+
+INGEST_STREAMING = os.getenv("INGEST_STREAMING", "1").lower() not in ("0", "false", "no")
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "32"))
+
+# Textbook string columns filled from metadata; year is converted separately
+TEXT_METADATA_FIELDS = [field for field in METADATA_FIELDS if field != "year"]
+
+# Stored with each page's filter output; a prompt change makes every page "changed".
+FILTER_PROMPT_HASH = hashlib.sha256(build_filter_prompt("", "").encode("utf-8")).hexdigest()[:16]
+
+
+def collect_sub_blocks(parsed_units: list) -> list:
+    """
+    Splits every content block exactly once, reusing the "sub_blocks" found by
+    parse_markdown_to_units(..., with_sub_blocks=True) when present.
+    Returns (chapter, block, sub_block) tuples in document order; identical
+    sub-blocks under the same chapter are only kept once.
+    """
+    collected = []
+    for unit in parsed_units:
+        if not unit:
+            continue
+        for chapter in unit.get("chapters", []):
+            if not chapter:
+                continue
+            seen = set()
+            for block in chapter.get("content_blocks", []):
+                if not block:
+                    continue
+                sub_blocks = block.get("sub_blocks")
+                if sub_blocks is None:
+                    sub_blocks = split_mixed_block(block.get("content", ""))
+                if not sub_blocks:
+                    sub_blocks = [block.get("content", "")]
+                for sub in sub_blocks:
+                    if sub in seen:
+                        continue
+                    seen.add(sub)
+                    collected.append((chapter, block, sub))
+    return collected
+
+
+def classify_unique(texts: list, classify=classify_blocks) -> dict:
+    """
+    Classifies each distinct text once and returns a {text: label} mapping.
+    """
+    unique = list(dict.fromkeys(texts))
+    return dict(zip(unique, classify(unique)))
+
+
+def ingest_parsed_textbook(engine, textbook: dict, parsed_units: list, classify=classify_blocks) -> dict:
+    """
+    Splits, classifies and saves a parsed textbook.
+    `classify` takes a list of texts and returns one label per text; texts with
+    a labelled near-duplicate in the database never reach it.
+    Returns counts describing the ingest.
+    """
+    with stage("split"):
+        collected = collect_sub_blocks(parsed_units)
+    with stage("classify"):
+        labels = classify_unique([sub for _, _, sub in collected], near_duplicate_classifier(engine, classify))
+    attach_contents(parsed_units, collected, labels)
+
+    textbook_id = save_textbook(engine, textbook, parsed_units)
+    return {
+        "textbook_id": textbook_id,
+        "sub_blocks": len(collected),
+        "classified": len(labels),
+        "rows": len(collected),
+    }
+
+
+def attach_contents(parsed_units: list, collected: list, labels: dict = None):
+    """
+    Gives every chapter the "contents" list of Content column dicts that
+    save_textbook / sync_textbook expect. Without `labels` content_type is left out.
+    """
+    for unit in parsed_units:
+        for chapter in (unit or {}).get("chapters", []):
+            if chapter:
+                chapter["contents"] = []
+    for chapter, block, sub in collected:
+        content = {
+            "text_content": sub,
+            "activity_description": block.get("heading", ""),
+            "source_page": block.get("source_page"),
+        }
+        if labels is not None:
+            content["content_type"] = labels[sub]
+        chapter["contents"].append(content)
+
+
+def textbook_from_metadata(metadata: dict, source_file: str) -> dict:
+    """
+    Maps extract_pdf_metadata output onto Textbook columns.
+    A year that is not a plain number is dropped.
+    """
+    textbook = {field: str(metadata.get(field) or "") for field in TEXT_METADATA_FIELDS}
+    year = str(metadata.get("year") or "").strip()
+    textbook["year"] = int(year) if year.isdigit() else None
+    textbook["source_file"] = source_file
+    return textbook
+
+
+def ingest_streaming(engine, textbook: dict, fragments, classify=classify_blocks,
+                     batch_size: int = STREAM_BATCH_SIZE) -> dict:
+    """
+    Streaming ingest: `fragments` is filtered markdown arriving piece by piece
+    (see stream_relevant_textbook_content). Blocks are classified and written in
+    batches as soon as the parser closes them, on a single background worker so
+    reading the stream never waits on the LLM or the database. If anything
+    fails, the rows already written are deleted again.
+    """
+    start = time.perf_counter()
+    classify = near_duplicate_classifier(engine, classify)
+    writer = TextbookWriter(engine, textbook)
+    parser = IncrementalMarkdownParser(with_sub_blocks=True)
+    labels = {}
+    seen = {}
+    pending = []
+    stats = {"sub_blocks": 0, "first_row_seconds": None}
+
+    def process(batch):
+        texts = [sub for _, _, _, sub in batch]
+        unknown = [text for text in dict.fromkeys(texts) if text not in labels]
+        if unknown:
+            with stage("classify"):
+                labels.update(zip(unknown, classify(unknown)))
+        writer.write([(unit, chapter, {
+            "content_type": labels[sub],
+            "text_content": sub,
+            "activity_description": block.get("heading", ""),
+            "source_page": block.get("source_page"),
+        }) for unit, chapter, block, sub in batch])
+        if stats["first_row_seconds"] is None:
+            stats["first_row_seconds"] = time.perf_counter() - start
+
+    background = ThreadPoolExecutor(max_workers=1)
+    futures = []
+
+    def flush():
+        if pending:
+            futures.append(background.submit(propagate(process), pending[:]))
+            pending.clear()
+
+    def handle(events):
+        for event in events:
+            if event[0] == "chapter":
+                flush()
+                continue
+            _, unit, chapter, block = event
+            if unit is None:
+                # Chapters before the first unit are dropped by the parser too.
+                continue
+            chapter_seen = seen.setdefault(id(chapter), set())
+            sub_blocks = block.get("sub_blocks") or [block.get("content", "")]
+            for sub in sub_blocks:
+                if sub in chapter_seen:
+                    continue
+                chapter_seen.add(sub)
+                pending.append((unit, chapter, block, sub))
+                stats["sub_blocks"] += 1
+            if len(pending) >= batch_size:
+                flush()
+
+    try:
+        for fragment in timed_iter("filter", fragments, per_item=False):
+            with stage("parse"):
+                events = parser.feed(fragment)
+            handle(events)
+        with stage("parse"):
+            events = parser.close()
+        handle(events)
+        flush()
+        for future in futures:
+            future.result()
+    except BaseException:
+        # batches are committed one by one: drop the ones already written so a
+        # retry starts from a clean slate instead of next to a partial copy
+        background.shutdown(cancel_futures=True)
+        writer.discard()
+        raise
+    finally:
+        background.shutdown()
+
+    if writer.textbook_id is None:
+        raise ValueError("Parsed content is empty or malformed.")
+
+    return {
+        "textbook_id": writer.textbook_id,
+        "sub_blocks": stats["sub_blocks"],
+        "classified": len(labels),
+        "rows": writer.rows,
+        "first_row_seconds": stats["first_row_seconds"],
+    }
+
+
+def split_filtered_pages(markdown: str, page_numbers) -> dict:
+    """
+    Cuts filtered markdown back into per-page segments at its <!-- page N -->
+    markers. Returns {page_number: segment}; a page whose marker the filter
+    dropped maps to None, meaning its output is part of the previous page's
+    segment. Text before the first marker belongs to the first page.
+    Joining the segments in page order gives the markdown back.
+    """
+    numbers = sorted(set(page_numbers))
+    if not numbers:
+        return {}
+    parts = {number: [] for number in numbers}
+    found = {numbers[0]}
+    current = numbers[0]
+    for line in strip_markdown_fence(markdown).splitlines():
+        match = PAGE_PATTERN.match(line.strip())
+        # markers for unknown pages, or going backwards, stay with the current page
+        if match and int(match.group(1)) in parts and int(match.group(1)) >= current:
+            current = int(match.group(1))
+            found.add(current)
+        parts[current].append(line)
+    return {number: "\n".join(parts[number]).strip() if number in found else None for number in numbers}
+
+
+def page_hash_rows(text_hashes: dict, segments: dict) -> list:
+    """
+    PageHash column dicts for save_page_hashes.
+    """
+    return [{"page_number": number, "text_hash": text_hash, "prompt_hash": FILTER_PROMPT_HASH,
+             "filtered_text": segments.get(number)} for number, text_hash in sorted(text_hashes.items())]
+
+
+def changed_page_runs(text_hashes: dict, stored: dict) -> list:
+    """
+    Groups pages into the stretches that have to be filtered again.
+    A page is changed when its text hash or the filter prompt differs from the
+    stored one, or when it was added or removed. A page stored without a segment
+    of its own goes with the page before it. Returns lists of consecutive page
+    numbers (pages of the new file only).
+    """
+    groups = []
+    for number in sorted(set(text_hashes) | set(stored)):
+        row = stored.get(number)
+        changed = (row is None or number not in text_hashes or row.text_hash != text_hashes[number]
+                   or row.prompt_hash != FILTER_PROMPT_HASH)
+        if groups and row is not None and row.filtered_text is None:
+            groups[-1][0].append(number)
+            groups[-1][1] = groups[-1][1] or changed
+        else:
+            groups.append([[number], changed])
+
+    runs, previous_changed = [], False
+    for numbers, changed in groups:
+        if changed:
+            if not previous_changed:
+                runs.append([])
+            runs[-1].extend(number for number in numbers if number in text_hashes)
+        previous_changed = changed
+    return [run for run in runs if run]
+
+
+def ingest_pdf(engine, file, source_file: str, classify=classify_blocks, stream: bool = INGEST_STREAMING) -> dict:
+    """
+    Runs the whole chain for one PDF without any UI:
+    extract -> metadata -> filter -> parse -> classify -> persist.
+    `file` is a path or a binary file object. With stream=True the filter output
+    is parsed, classified and saved while it is still being generated.
+    With INGEST_MEDIA the book's images go to the media store alongside the
+    filter (which waits on the LLM) and are linked to the saved content.
+    """
+    text_hashes = {}
+    output = []
+
+    def counted(path):
+        for number, text in timed_iter("extract", iter_pages(path)):
+            text_hashes[number] = content_hash(text)
+            yield number, text
+
+    def recorded(fragments):
+        for fragment in fragments:
+            output.append(fragment)
+            yield fragment
+
+    result = None
+    try:
+        with spooled_pdf(file) as path, ThreadPoolExecutor(max_workers=1) as background:
+            media = background.submit(propagate(extract_media), path) if INGEST_MEDIA else None
+            with stage("metadata"):
+                metadata = extract_pdf_metadata(path)
+            textbook = textbook_from_metadata(metadata, source_file)
+            if stream:
+                result = ingest_streaming(engine, textbook, recorded(stream_relevant_textbook_content(counted(path))),
+                                          classify)
+            else:
+                with stage("filter"):
+                    filtered_markdown = extract_relevant_textbook_content(counted(path))
+                output.append(filtered_markdown)
+            if media is not None:
+                with stage("media"):
+                    images = media.result()
+
+        if not stream:
+            with stage("parse"):
+                parsed_units = parse_markdown_to_units(filtered_markdown, with_sub_blocks=True)
+            if not parsed_units:
+                raise ValueError("Parsed content is empty or malformed.")
+            result = ingest_parsed_textbook(engine, textbook, parsed_units, classify)
+
+        # per-page filter output, so a later reingest_pdf only re-filters the pages that changed
+        save_page_hashes(engine, result["textbook_id"],
+                         page_hash_rows(text_hashes, split_filtered_pages("".join(output), text_hashes)))
+        if media is not None:
+            result["media"] = save_media(engine, result["textbook_id"], images)
+    except BaseException:
+        # the book was saved but the ingest failed: remove it so a retry does not add a second copy
+        if result is not None:
+            delete_textbook(engine, result["textbook_id"])
+        raise
+    result["pages"] = len(text_hashes)
+    result["metadata"] = metadata
+    return result
+
+
+def reingest_pdf(engine, textbook_id: int, file, classify=classify_blocks) -> dict:
+    """
+    Applies a new version of an already ingested PDF to its textbook.
+    Only pages whose text changed since the last ingest (see changed_page_runs)
+    go through the filter again; the other pages reuse their stored filter
+    output. The rebuilt book is then diffed block by block against the stored
+    rows (sync_textbook), so unchanged rows and their labels are kept, edited
+    rows are updated in place and removed ones are deactivated.
+    Metadata is kept as it is; with INGEST_MEDIA the images are extracted again
+    and relinked.
+    """
+    with spooled_pdf(file) as path:
+        pages = dict(timed_iter("extract", iter_pages(path)))
+        if INGEST_MEDIA:
+            with stage("media"):
+                images = extract_media(path)
+    text_hashes = {number: content_hash(text) for number, text in pages.items()}
+    stored = load_page_hashes(engine, textbook_id)
+    runs = changed_page_runs(text_hashes, stored)
+
+    def refilter(run: list) -> dict:
+        # the end of the page before the run stands in for the window context
+        context = pages.get(run[0] - 1, "")[-FILTER_OVERLAP_CHARS:] if FILTER_OVERLAP_CHARS else ""
+        filtered = filter_pages_chunked([(number, pages[number]) for number in run], context=context)
+        return split_filtered_pages(filtered, run)
+
+    segments = {number: row.filtered_text for number, row in stored.items() if number in pages}
+    with stage("filter"), ThreadPoolExecutor(max_workers=max(1, min(len(runs), FILTER_CONCURRENCY))) as pool:
+        for refiltered in pool.map(propagate(refilter), runs):
+            segments.update(refiltered)
+    incr("pages.refiltered", sum(len(run) for run in runs))
+
+    with stage("parse"):
+        markdown = stitch_filtered_chunks(["\n".join(segments[number] for number in sorted(segments)
+                                                     if segments[number])])
+        parsed_units = parse_markdown_to_units(markdown, with_sub_blocks=True)
+    if not parsed_units:
+        raise ValueError("Parsed content is empty or malformed.")
+    with stage("split"):
+        collected = collect_sub_blocks(parsed_units)
+    attach_contents(parsed_units, collected)
+
+    counts = sync_textbook(engine, textbook_id, parsed_units, near_duplicate_classifier(engine, classify))
+    save_page_hashes(engine, textbook_id, page_hash_rows(text_hashes, segments))
+    result = {
+        "textbook_id": textbook_id,
+        "pages": len(pages),
+        "pages_refiltered": sum(len(run) for run in runs),
+        "rows": counts["unchanged"] + counts["updated"] + counts["inserted"],
+        **counts,
+    }
+    if INGEST_MEDIA:
+        result["media"] = save_media(engine, textbook_id, images)
+    return result